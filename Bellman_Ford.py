@@ -1,3 +1,11 @@
+from routing_table import *
+try:
+   import numpy # optional, only the vectorized kernel needs it
+except ImportError:
+   numpy = None
+
+VECTOR_MIN_ENTRIES = 64 # smallest table apply_table hands to the NumPy kernel, below it the array setup costs more than the loop
+
 def BellmanFord(table_dict, recieved_table_dict, source_of_routing_table, neighbour_edges):
    #Finds the least cost paths from this router to every other router in the graph. 
    updated_dests = []
@@ -19,3 +27,180 @@ def BellmanFord(table_dict, recieved_table_dict, source_of_routing_table, neighb
             
          
    return table_dict, updated_dests
+
+
+class DistanceVector(object):
+    """
+    Incremental distance vector engine. Works on a routing table in place and keeps
+    a reverse index from each next hop to the destinations routed through it, so a
+    neighbour going down or changing its link cost only touches the routes that go
+    through that neighbour. Every method returns the list of destinations whose
+    (next hop, cost) actually changed.
+
+    Attributes:
+    router_id -- the id of this router
+    table -- the RoutingTable, destination -> (next hop, cost)
+    edges -- dictionary of neighbour id -> link cost
+    via -- dictionary of next hop -> set of destinations routed through it
+
+    Methods:
+    set_route -- sets one route, keeping the reverse index in step
+    neighbour_route -- takes the direct route to a neighbour that has sent an update, if it is no worse
+    apply -- applies a table recieved from a neighbour
+    apply_vectors -- applies a table recieved from a neighbour as NumPy arrays, without a loop per destination
+    apply_table -- applies a table recieved from a neighbour with whichever of the two is faster for its size
+    expire -- marks a route as unreachable, keeping its next hop
+    remove_route -- deletes a route and poisons every route through it
+    neighbour_down -- marks every route through a neighbour as unreachable
+    link_cost_changed -- moves every route through a neighbour onto a new link cost
+    routes_via -- the destinations currently routed through a next hop
+    """
+
+    def __init__(self, router_id, table, edges):
+        self.router_id = router_id
+        self.table = table
+        self.edges = edges
+        self.via = {}
+        for dest, (next_hop, cost) in table.items(): # index whatever the table already holds
+            self.via.setdefault(next_hop, set()).add(dest)
+
+    def set_route(self, dest, next_hop, cost, changed):
+        """sets the route to 'dest', appending dest to 'changed' if it differs from the current route"""
+        table = self.table
+        slot = table.slot(dest)
+        if slot >= 0:
+            old_hop = table.next_hops[slot]
+            if old_hop != next_hop:
+                self.via[old_hop].discard(dest)
+        if table.set_route(dest, next_hop, cost):
+            self.via.setdefault(next_hop, set()).add(dest)
+            changed.append(dest)
+
+    def neighbour_route(self, neighbour, link_cost, changed):
+        """routes to 'neighbour' over its link, as an update from it advertises itself at cost
+        0, unless another neighbour offers a strictly cheaper route to it"""
+        table = self.table
+        slot = table.slot(neighbour)
+        if slot < 0 or table.next_hops[slot] == neighbour or link_cost < table.metrics[slot]:
+            self.set_route(neighbour, neighbour, link_cost, changed)
+
+    def apply(self, recieved_table_dict, source_of_routing_table):
+        """applies the routes advertised by a neighbour, returns the changed destinations"""
+        changed = []
+        link_cost = self.edges.get(source_of_routing_table)
+        if link_cost is None: # not one of our neighbours, we cannot route through it
+            return changed
+        self.neighbour_route(source_of_routing_table, link_cost, changed)
+        table = self.table
+        slot_of, next_hops, metrics = table.slot, table.next_hops, table.metrics # read the table's arrays directly, no tuples
+        for dest, (_, metric) in recieved_table_dict.items():
+            if dest == self.router_id or dest == source_of_routing_table:
+                continue
+            cost = min(metric + link_cost, INFINITY)
+            slot = slot_of(dest)
+            if slot < 0: #We have no information on this vertex yet
+                if cost < INFINITY:
+                    self.set_route(dest, source_of_routing_table, cost, changed)
+            elif next_hops[slot] == source_of_routing_table: # Routes have same next hop, always believe it
+                if metrics[slot] != cost:
+                    self.set_route(dest, source_of_routing_table, cost, changed)
+            elif cost < metrics[slot]: # The new route has a lower cost than our current route.
+                self.set_route(dest, source_of_routing_table, cost, changed)
+        return changed
+
+    def apply_vectors(self, dests, advertised, source_of_routing_table):
+        """applies the routes advertised by a neighbour, given as arrays of destinations and
+        their advertised metrics, returns the changed destinations. Gives the same result as
+        apply: each destination indexes straight into the table's arrays, the new costs and
+        the same next hop / strictly better choice are worked out with whole array operations,
+        and only the routes that change are written back through set_route."""
+        changed = []
+        link_cost = self.edges.get(source_of_routing_table)
+        if link_cost is None: # not one of our neighbours, we cannot route through it
+            return changed
+        self.neighbour_route(source_of_routing_table, link_cost, changed)
+        keep = (dests != self.router_id) & (dests != source_of_routing_table)
+        dests, advertised = dests[keep], advertised[keep]
+        if not len(dests):
+            return changed
+        if dests.min() < 0 or dests.max() >= DIRECT_LIMIT: # ids outside the directly indexed slots, take the slow path
+            return changed + self.apply(dict(zip(dests.tolist(), zip([source_of_routing_table] * len(dests), advertised.tolist()))), source_of_routing_table)
+        table = self.table
+        costs = numpy.minimum(advertised + link_cost, INFINITY)
+        # Views onto the table's arrays. They pin the arrays' memory, so they must be
+        # released before set_route can grow the table.
+        ids = numpy.frombuffer(table.ids, dtype=numpy.intc)
+        next_hops = numpy.frombuffer(table.next_hops, dtype=numpy.intc)
+        metrics = numpy.frombuffer(table.metrics, dtype=numpy.intc)
+        flags = numpy.frombuffer(table.flags, dtype=numpy.uint8)
+        inside = dests < len(ids)
+        slots = numpy.where(inside, dests, 0)
+        known = inside & (ids[slots] == dests) & (flags[slots] & USED != 0)
+        current = numpy.where(known, metrics[slots], INFINITY)
+        same_hop = known & (next_hops[slots] == source_of_routing_table)
+        accept = (same_hop & (costs != current)) | (~same_hop & (costs < current)) # same next hop, always believe it, otherwise only if strictly better
+        del ids, next_hops, metrics, flags
+        for dest, cost in zip(dests[accept].tolist(), costs[accept].tolist()):
+            self.set_route(dest, source_of_routing_table, cost, changed)
+        return changed
+
+    def apply_table(self, recieved_table_dict, source_of_routing_table, vectorized=False):
+        """applies the routes advertised by a neighbour, returns the changed destinations.
+        With 'vectorized' a table of at least VECTOR_MIN_ENTRIES goes through apply_vectors,
+        a smaller one (every datagram of at most MAX_ENTRIES routes) through apply."""
+        if vectorized and numpy is not None and len(recieved_table_dict) >= VECTOR_MIN_ENTRIES:
+            return self.apply_vectors(*table_vectors(recieved_table_dict), source_of_routing_table)
+        return self.apply(recieved_table_dict, source_of_routing_table)
+
+    def expire(self, dest):
+        """marks the route to 'dest' as unreachable, returns the changed destinations"""
+        changed = []
+        current = self.table.get(dest)
+        if current is not None and dest != self.router_id:
+            self.set_route(dest, current[0], INFINITY, changed)
+        return changed
+
+    def remove_route(self, dest):
+        """deletes the route to 'dest' and poisons any route that went through it, returns the changed destinations"""
+        changed = []
+        current = self.table.get(dest)
+        if current is None or dest == self.router_id:
+            return changed
+        self.table.remove(dest)
+        self.via[current[0]].discard(dest)
+        changed.append(dest)
+        changed += self.neighbour_down(dest)
+        return changed
+
+    def neighbour_down(self, neighbour):
+        """marks every route through 'neighbour' as unreachable, returns the changed destinations"""
+        changed = []
+        for dest in list(self.via.get(neighbour, ())):
+            self.set_route(dest, neighbour, INFINITY, changed)
+        return changed
+
+    def link_cost_changed(self, neighbour, link_cost):
+        """moves every route through 'neighbour' onto its new link cost, returns the changed destinations"""
+        changed = []
+        old_cost = self.edges.get(neighbour)
+        self.edges[neighbour] = link_cost
+        if old_cost is None or old_cost == link_cost:
+            return changed
+        for dest in list(self.via.get(neighbour, ())):
+            cost = self.table[dest][1]
+            if cost < INFINITY: # the advertised metric is the cost less the old link cost
+                self.set_route(dest, neighbour, min(cost - old_cost + link_cost, INFINITY), changed)
+        return changed
+
+    def routes_via(self, next_hop):
+        """returns the set of destinations currently routed through 'next_hop'"""
+        return self.via.get(next_hop, set())
+
+
+def table_vectors(recieved_table_dict):
+    """turns a recieved table of destination -> (next hop, metric) into an array of
+    destinations and an array of their metrics, for DistanceVector.apply_vectors"""
+    count = len(recieved_table_dict)
+    dests = numpy.fromiter(recieved_table_dict.keys(), dtype=numpy.int64, count=count)
+    metrics = numpy.fromiter((metric for _, metric in recieved_table_dict.values()), dtype=numpy.int64, count=count)
+    return dests, metrics
@@ -2,6 +2,9 @@ import sys
 
 """Test parser class"""
 
+PACKET_FORMATS = ("json", "binary") # wire formats the daemon can send
+ID_LIMIT = 1 << 31 # router ids must fit the routing table's signed 32 bit arrays
+
 class Error(Exception):
     """Parent class for errors in the parser
 
@@ -44,11 +47,13 @@ class RouterIdError(Error):
 
     Constants:
         NEGATIVE_ERROR -- Message for negative id error
+        RANGE_ERROR -- Message for an id too large for the routing table
         EXISTS_ERROR -- Message for an existing router id used
         FORMAT -- Output format for error
     """
 
     NEGATIVE_ERROR = "Must Be A Positive Integer"
+    RANGE_ERROR = "Router ID Out Of Range (1 - 2147483647)"
     EXISTS_ERROR = "Router ID has been used before"
     NAME = "RouterIdError"
 
@@ -115,6 +120,62 @@ class OutputError(Error):
     FORM1 = "{}: Output {}: {}"
     FORM2 = "{}: Output {}:"
 
+class FormatError(Error):
+    """Exception raised for errors regarding the packet format
+
+    Constants:
+        INVALID_ERROR -- Message for an unknown packet format
+        NAME -- The name for the error
+    """
+
+    INVALID_ERROR = "Packet Format Must Be One Of: json, binary"
+    NAME = "FormatError"
+
+class BufferSizeError(Error):
+    """Exception raised for errors regarding the socket receive buffer size
+
+    Constants:
+        RANGE_ERROR -- Message for a buffer size out of range
+        NAME -- The name for the error
+    """
+
+    RANGE_ERROR = "Receive Buffer Must Be At Least 4096 Bytes"
+    NAME = "BufferSizeError"
+
+class PrefixError(Error):
+    """Exception raised for errors regarding network prefixes
+
+    Constants:
+        INVALID_ERROR -- Message for a prefix not written as address/length
+        HOST_BITS_ERROR -- Message for a prefix with bits set past its length
+        EXISTS_ERROR -- Message for a prefix given twice
+        NAME -- The name for the error
+    """
+
+    INVALID_ERROR = "Invalid Prefix (a.b.c.d/0-32)"
+    HOST_BITS_ERROR = "Prefix Has Address Bits Set Past Its Length"
+    EXISTS_ERROR = "Prefix Already Exists"
+    NAME = "PrefixError"
+
+class TopologyError(Error):
+    """Exception raised for routers in a topology file that do not fit together
+
+    Constants:
+        DANGLING_ERROR -- Message for an output to a router not in the topology
+        PORT_ERROR -- Message for an output port that is not an input port of its router
+        ASYMMETRIC_ERROR -- Message for a link with no output back, or a different metric back
+        NAME -- The name for the error
+        FORM1 -- The format the error should follow if info is given
+        FORM2 -- The format the error should follow if no info given
+    """
+
+    DANGLING_ERROR = "Output To Router {} Which Is Not In The Topology"
+    PORT_ERROR = "Output Port {} Is Not An Input Port Of Router {}"
+    ASYMMETRIC_ERROR = "Router {} Has No Output Back With Metric {}"
+    NAME = "TopologyError"
+    FORM1 = "{}: Router {}: {}"
+    FORM2 = "{}: Router {}:"
+
 class ConfigError(Error):
     """Exception raised for errors regarding config file
 
@@ -159,6 +220,10 @@ class Config(object):
         period -- the period that the router updates
         timeout -- the timeout period that the router uses
         garbage -- the garbage collection period that the router uses
+        packet_format -- the wire format the router sends its updates in
+        packet_format_set -- whether a packet-format line has been read, as packet_format always has a default
+        receive_buffer -- SO_RCVBUF size in bytes for the input sockets, None for the OS default
+        networks -- a list of (address, length) IPv4 prefixes the router is attached to, addresses as integers
 
     Methods:
         add_inputs -- add port to the inputs
@@ -167,6 +232,9 @@ class Config(object):
         set_period -- set the period for the router
         set_timeout -- set the timeout for the router
         set_garbage -- set the garbage collection for the router
+        set_packet_format -- set the wire format for the router
+        set_receive_buffer -- set the receive buffer size for the input sockets
+        add_networks -- add prefixes to the networks
         infer_timers -- fill in any gaps in the timers, defaulting if none set
     """
 
@@ -177,10 +245,14 @@ class Config(object):
         self.period = None
         self.timeout = None
         self.garbage = None
+        self.packet_format = "json"
+        self.packet_format_set = False
+        self.receive_buffer = None
+        self.networks = []
 
     def __str__(self):
         #returns a string formatting config objects
-        return "ID: {}\nInput Ports: {}\nOutputs: {}\nPeriod: {}\nTimeout: {}\nGarbage: {}".format(self.id, self.inputs, self.outputs, self.period, self.timeout, self.garbage)
+        return "ID: {}\nInput Ports: {}\nOutputs: {}\nPeriod: {}\nTimeout: {}\nGarbage: {}\nPacket Format: {}\nReceive Buffer: {}\nNetworks: {}".format(self.id, self.inputs, self.outputs, self.period, self.timeout, self.garbage, self.packet_format, self.receive_buffer, ", ".join(format_prefix(network) for network in self.networks))
 
     def set_id(self, rid, used_ids):
         self.id = validate_id(rid, used_ids) # validate the id before setting it
@@ -233,6 +305,26 @@ class Config(object):
         if (self.garbage < 8) or (self.period and float(self.garbage)/self.period != 8) or (self.timeout and self.timeout/float(self.garbage) != 0.75): # validate that the garbage is correct
             raise TimeError(self.garbage, TimeError.INVALID_GARBAGE_ERROR)
 
+    def set_packet_format(self, packet_format):
+        """sets the wire format used when sending updates"""
+        self.packet_format = validate_packet_format(packet_format) # validate the format is one we can send
+        self.packet_format_set = True
+
+    def set_receive_buffer(self, size):
+        """sets the SO_RCVBUF size asked for on the input sockets"""
+        self.receive_buffer = validate_buffer_size(size) # validate the size is sensible
+
+    def add_networks(self, networks):
+        """validates prefixes written as address/length and appends them to the networks"""
+        networks = networks.replace(",", " ").split() # commas are optional between prefixes
+        if len(networks) == 0:
+            raise PrefixError(None, PrefixError.INVALID_ERROR)
+        for network in networks:
+            network = validate_prefix(network)
+            if network in self.networks: # collision check
+                raise PrefixError(format_prefix(network), PrefixError.EXISTS_ERROR)
+            self.networks.append(network)
+
     def infer_timers(self):
         """sets the period (1 second to start and bases the other timers off it
         otherwise, it gives a default time period"""
@@ -261,14 +353,54 @@ def validate_time(time):
     else:
         return time
 
+def validate_packet_format(packet_format):
+    """Validate that a packet format is one of the supported wire formats"""
+    packet_format = packet_format.strip(" ")
+    if packet_format not in PACKET_FORMATS:
+        raise FormatError(packet_format, FormatError.INVALID_ERROR)
+    return packet_format
+
+def validate_buffer_size(size):
+    """Validate that a receive buffer size is an integer of at least 4096 bytes"""
+    try:
+        size = int(size)
+    except ValueError:
+        raise BufferSizeError(size, BufferSizeError.NAN_ERROR)
+    if size < 4096:
+        raise BufferSizeError(size, BufferSizeError.RANGE_ERROR)
+    return size
+
+def validate_prefix(prefix):
+    """Validate that a prefix is an IPv4 address and a length of 0 to 32 with no address bits
+    set past the length, returning it as (address as an integer, length)"""
+    try:
+        address, length = prefix.strip(" ").split("/")
+        octets = [int(octet) for octet in address.split(".")]
+        length = int(length)
+    except ValueError:
+        raise PrefixError(prefix, PrefixError.INVALID_ERROR)
+    if len(octets) != 4 or not all(0 <= octet <= 255 for octet in octets) or not 0 <= length <= 32:
+        raise PrefixError(prefix, PrefixError.INVALID_ERROR)
+    address = (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+    if address & ((1 << (32 - length)) - 1): # e.g. 10.1.0.0/8
+        raise PrefixError(prefix, PrefixError.HOST_BITS_ERROR)
+    return (address, length)
+
+def format_prefix(prefix):
+    """Return an (address, length) prefix written as address/length"""
+    address, length = prefix
+    return "{}.{}.{}.{}/{}".format(address >> 24, (address >> 16) & 255, (address >> 8) & 255, address & 255, length)
+
 def validate_id(rid, used_ids):
-    """Validate that an id is a positive integer, and hasn't been used before"""
+    """Validate that an id is a positive integer below ID_LIMIT, and hasn't been used before"""
     try:
         rid = int(rid)
     except ValueError:
         raise RouterIdError(rid, RouterIdError.NAN_ERROR)
-    if rid < 0:
+    if rid < 1:
         raise RouterIdError(rid, RouterIdError.NEGATIVE_ERROR)
+    elif rid >= ID_LIMIT:
+        raise RouterIdError(rid, RouterIdError.RANGE_ERROR)
     elif rid in used_ids: # collision check if a router already exsists
         raise RouterIdError(rid, RouterIdError.EXISTS_ERROR)
     else:
@@ -301,54 +433,158 @@ def validate_metric(metric):
         return metric
 
 
+def parse_config_line(config, line, line_num, used_ids, used_ports):
+    """Read one line of a router's config into 'config', raising a ConfigError for line 'line_num' if it is not valid"""
+    try:
+        if line.startswith("router-id "):
+            if config.id: # if there is already an id
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_id(line[9:].strip("\n"), used_ids) # strip out unneccesary information, and set the id
+        elif line.startswith("input-ports "):
+            if config.inputs: # if there is already an input list
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.add_inputs(line[11:].strip("\n"), used_ports) # strip out unneccesary information and add the inputs
+        elif line.startswith("outputs "):
+            if config.outputs: # if there is already an output list
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.add_outputs(line[7:].strip("\n"), used_ports, used_ids) # strip out unneccesary information and add outputs
+        elif line.startswith("period "):
+            if config.period: # if there is already a period
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_period(line[6:].strip("\n")) # strip out unneccesary information and set the period
+        elif line.startswith("timeout "):
+            if config.timeout: # if there is already a timeout
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_timeout(line[7:].strip("\n")) # strip out unneccesary information and set the timeout
+        elif line.startswith("garbage "):
+            if config.garbage: # if there is already a garbage
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_garbage(line[7:].strip("\n")) # strip out unneccesary information and set the garbage
+        elif line.startswith("packet-format "):
+            if config.packet_format_set: # if there is already a format
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_packet_format(line[13:].strip("\n")) # strip out unneccesary information and set the format
+        elif line.startswith("receive-buffer "):
+            if config.receive_buffer: # if there is already a buffer size
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.set_receive_buffer(line[14:].strip("\n")) # strip out unneccesary information and set the size
+        elif line.startswith("networks "):
+            if config.networks: # if there is already a network list
+                raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
+            config.add_networks(line[8:].strip("\n")) # strip out unneccesary information and add the prefixes
+        elif line.strip(" \n\t") == "": # ignore whitespace lines
+            pass
+        else: # anything else is an invalid line, so raise an error
+            raise ConfigError(line_num, ConfigError.INVALID_ERROR)
+    except ConfigError as error: # catch any ConfigError's and re-raise them
+        raise error
+    except Error as error: # catch any other error and change to a config error
+        raise ConfigError(line_num, error)
+
 def read_config(filename):
     """Read the config file stored in 'filename' and return a complete Config object"""
+    try:
+        config = load_config(filename)
+    except ConfigError as error: # any ConfigError's should now be printed out and the program halted
+        error.output()
+   # print(config) # print out the config object for viewing
+    return config
+
+def load_config(filename):
+    """Read the config file stored in 'filename' and return a complete Config object, raising
+    a ConfigError rather than halting if it is not valid, for a daemon that must keep running"""
     config = Config() # stores relevant information
     used_ids = set() # store used router id's
     used_ports = set() # store used ports
     config_file = open(filename, "r") # open file
     config_lines = config_file.readlines() # read the lines into a list
+    config_file.close()
+    for line_num, line in enumerate(config_lines): # loop over all the lines
+        line_num += 1 # # line numbers start at 1 not 0
+        parse_config_line(config, line, line_num, used_ids, used_ports)
+    config.infer_timers() # infer the timers if any were not set
+    return config
+
+def read_topology(filename):
+    """Read the topology file stored in 'filename' and return a complete Config object for
+    every router in it, in the order they appear. The file is the routers' config files one
+    after the other: each router's section starts with its router-id line, and lines starting
+    with '#' are comments. Each section is checked as read_config checks a file, then the
+    routers are checked against each other (see validate_topology)."""
     try:
-        for line_num, line in enumerate(config_lines): # loop over all the lines
-            line_num += 1 # # line numbers start at 1 not 0
-            try:
-                if line.startswith("router-id "):
-                    if config.id: # if there is already an id
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.set_id(line[9:].strip("\n"), used_ids) # strip out unneccesary information, and set the id
-                elif line.startswith("input-ports "):
-                    if config.inputs: # if there is already an input list
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.add_inputs(line[11:].strip("\n"), used_ports) # strip out unneccesary information and add the inputs
-                elif line.startswith("outputs "):
-                    if config.outputs: # if there is already an output list
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.add_outputs(line[7:].strip("\n"), used_ports, used_ids) # strip out unneccesary information and add outputs
-                elif line.startswith("period "):
-                    if config.period: # if there is already a period
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.set_period(line[6:].strip("\n")) # strip out unneccesary information and set the period
-                elif line.startswith("timeout "):
-                    if config.timeout: # if there is already a timeout
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.set_timeout(line[7:].strip("\n")) # strip out unneccesary information and set the timeout
-                elif line.startswith("garbage "):
-                    if config.garbage: # if there is already a garbage
-                        raise ConfigError(line_num, ConfigError.EXISTS_ERROR) # raise an error saying as much
-                    config.set_garbage(line[7:].strip("\n")) # strip out unneccesary information and set the garbage
-                elif line.strip(" \n\t") == "": # ignore whitespace lines
-                    pass
-                else: # anything else is an invalid line, so raise an error
-                    raise ConfigError(line_num, ConfigError.INVALID_ERROR)
-            except ConfigError as error: # catch any ConfigError's and re-raise them
-                raise error
-            except Error as error: # catch any other error and change to a config error
-                raise ConfigError(line_num, error)
-        config.infer_timers() # infer the timers if any were not set
-    except ConfigError as error: # any ConfigError's should now be printed out and the program halted
+        return load_topology(filename)
+    except Error as error: # any errors should now be printed out and the program halted
         error.output()
-   # print(config) # print out the config object for viewing
-    return config
+
+def load_topology(filename):
+    """Read a topology file as read_topology does, raising the first Error found rather than halting"""
+    config_objects = []
+    config = None
+    router_ids = set() # ids of every router so far, no two sections may share one
+    with open(filename, "r") as topology_file:
+        for line_num, line in enumerate(topology_file, 1): # one pass over the file, line numbers start at 1
+            if line.startswith("#"): # comment
+                continue
+            if line.startswith("router-id "): # a new router's section starts
+                if config is not None:
+                    config.infer_timers()
+                config = Config()
+                used_ids = set() # ids and ports are checked per router, as if it had a file of its own
+                used_ports = set()
+                config_objects.append(config)
+                parse_config_line(config, line, line_num, used_ids, used_ports)
+                if config.id in router_ids: # another section has this id
+                    raise ConfigError(line_num, RouterIdError(config.id, RouterIdError.EXISTS_ERROR))
+                router_ids.add(config.id)
+            elif config is None: # only blank lines may come before the first router
+                if line.strip(" \n\t") != "":
+                    raise ConfigError(line_num, ConfigError.INVALID_ERROR)
+            else:
+                parse_config_line(config, line, line_num, used_ids, used_ports)
+    if config is not None:
+        config.infer_timers()
+    validate_topology(config_objects)
+    return config_objects
+
+def validate_topology(config_objects):
+    """Check that the routers in a topology fit together: every router has input ports, no input port is used by two routers,
+    every output goes to a router in the topology on one of that router's input ports, and that
+    router has an output back with the same metric"""
+    routers = {config.id: config for config in config_objects}
+    port_owners = {} # input port -> id of the router listening on it
+    for config in config_objects:
+        if not config.inputs: # a router has to listen somewhere
+            raise TopologyError(config.id, PortError(None, PortError.EMPTY_ERROR))
+        for port in config.inputs:
+            if port in port_owners:
+                raise TopologyError(config.id, PortError(port, PortError.EXISTS_ERROR))
+            port_owners[port] = config.id
+    metrics = {(config.id, output.id): output.metric for config in config_objects for output in config.outputs}
+    for config in config_objects:
+        for output in config.outputs:
+            if output.id not in routers:
+                raise TopologyError(config.id, TopologyError.DANGLING_ERROR.format(output.id))
+            if port_owners.get(output.port) != output.id:
+                raise TopologyError(config.id, TopologyError.PORT_ERROR.format(output.port, output.id))
+            if metrics.get((output.id, config.id)) != output.metric:
+                raise TopologyError(config.id, TopologyError.ASYMMETRIC_ERROR.format(output.id, output.metric))
+
+def format_topology(config_objects):
+    """Return the text of a topology file holding every router in 'config_objects'"""
+    sections = []
+    for config in config_objects:
+        lines = ["router-id {}".format(config.id),
+                 "input-ports {}".format(", ".join(str(port) for port in config.inputs)),
+                 "outputs {}".format(", ".join("{}-{}-{}".format(output.port, output.metric, output.id) for output in config.outputs)),
+                 "period {}".format(config.period)]
+        if config.packet_format != "json":
+            lines.append("packet-format {}".format(config.packet_format))
+        if config.receive_buffer:
+            lines.append("receive-buffer {}".format(config.receive_buffer))
+        if config.networks:
+            lines.append("networks {}".format(", ".join(format_prefix(network) for network in config.networks)))
+        sections.append("\n".join(lines) + "\n")
+    return "\n".join(sections)
 
 def main():
     read_config(sys.argv[1])
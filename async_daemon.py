@@ -0,0 +1,200 @@
+import os
+import signal
+import asyncio
+from routing_daemon import *
+from timer_heap import *
+
+
+class RipProtocol(asyncio.DatagramProtocol):
+    """
+    Datagram endpoint for one of a router's input ports. Hands every datagram
+    it recieves to the AsyncRouter that owns it.
+
+    Attributes:
+    router -- the AsyncRouter this endpoint belongs to
+    port -- the input port the endpoint is bound to
+    transport -- the asyncio datagram transport bound to the input port
+    """
+
+    def __init__(self, router, port):
+        self.router = router
+        self.port = port
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        self.router.datagram_received(data, self.port)
+
+    def error_received(self, error):
+        pass # ICMP port unreachable from a neighbour that is down, its routes time out as usual
+
+
+class AsyncRouter(object):
+    """
+    Runs a RoutingDaemon on an asyncio event loop instead of a select loop. Each input
+    port gets its own datagram endpoint, and the daemon's timer heap is driven by a
+    single loop.call_at handle that always points at the next deadline, so many
+    routers can share one event loop and one process.
+
+    Attributes:
+    daemon -- the RoutingDaemon being driven
+    loop -- the event loop the router runs on
+    transports -- dictionary of input port -> its datagram transport
+    timer_handle -- call_at handle for the next timer deadline
+    deadline -- the deadline timer_handle is set for
+    closed -- future that is done once the router has stopped
+    control -- asyncio server for the daemon's control socket, or None
+
+    Methods:
+    start -- binds the input ports and sends the first update
+    stop -- closes the input ports and cancels the timers
+    serve -- coroutine that runs the router until it is stopped or cancelled
+    datagram_received -- applies a datagram from a peer router
+    reschedule -- points the call_at handle at the next timer deadline
+    bind -- opens and closes endpoints so there is one for each of the given ports
+    reload -- moves the router onto a changed config
+    run_command -- runs a control command
+    serve_control -- answers one control connection
+    fire -- handles the timers that have expired
+    """
+
+    def __init__(self, daemon):
+        self.daemon = daemon
+        self.loop = None
+        self.transports = {}
+        self.timer_handle = None
+        self.deadline = None
+        self.closed = None
+        self.control = None
+
+    async def start(self):
+        """binds a datagram endpoint to every input port and starts the update timer"""
+        self.loop = asyncio.get_running_loop()
+        self.closed = self.loop.create_future()
+        self.daemon.timers.clock = self.daemon.routing_table.clock = self.loop.time # deadlines on the loop's clock line up with call_at
+        await self.bind(self.daemon.input_ports)
+        if not self.transports:
+            raise OSError("router {} could not listen on any of its input ports".format(self.daemon.router_id))
+        if self.daemon.control_path:
+            if os.path.exists(self.daemon.control_path):
+                os.unlink(self.daemon.control_path) # left behind by an earlier run
+            self.control = await asyncio.start_unix_server(self.serve_control, self.daemon.control_path)
+        self.daemon.start_updates()
+        self.reschedule()
+
+    def stop(self):
+        """closes every endpoint and cancels the pending timer callback"""
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        for transport in self.transports.values():
+            transport.close()
+        self.transports = {}
+        if self.control is not None:
+            self.control.close()
+            self.control = None
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(None)
+
+    async def serve(self):
+        """runs the router until stop is called or the task is cancelled"""
+        await self.start()
+        try:
+            await self.closed
+        finally:
+            self.stop()
+
+    def datagram_received(self, data, port):
+        """applies a datagram from a peer router, recieved on input 'port', and sends a
+        triggered update if routes changed"""
+        self.daemon.drop_stats["received"] += 1
+        if self.daemon.capture is not None:
+            self.daemon.capture.write(self.daemon.timers.clock(), port, data)
+        changed_routes = self.daemon.handle_packet(data)
+        if changed_routes:
+            self.daemon.send_update(changed_routes)
+        self.reschedule()
+
+    def reschedule(self):
+        """moves the call_at handle to the next timer deadline, if it has changed"""
+        next_event = self.daemon.timers.next_deadline()
+        deadline = None if next_event is None else next_event[DEADLINE]
+        if deadline == self.deadline:
+            return
+        if self.timer_handle is not None:
+            self.timer_handle.cancel()
+            self.timer_handle = None
+        self.deadline = deadline
+        if deadline is not None:
+            self.timer_handle = self.loop.call_at(deadline, self.fire)
+
+    async def bind(self, ports):
+        """opens an endpoint for every port in 'ports' without one, and closes the rest"""
+        for port in list(self.transports):
+            if port not in ports:
+                self.transports.pop(port).close()
+        for port in ports:
+            if port not in self.transports:
+                try:
+                    transport, _ = await self.loop.create_datagram_endpoint(lambda: RipProtocol(self, port), local_addr=('127.0.0.1', port))
+                except OSError as error: # e.g. the port is taken, keep running on the others
+                    self.daemon.log.error(self.daemon.router_id, "could not listen on port {}: {}", port, error)
+                    continue
+                self.transports[port] = transport
+        self.daemon.sender = next(iter(self.transports.values()), None) # updates go out from the first input port
+
+    async def reload(self):
+        """re-reads the daemon's config and moves the router onto it, returns the reply for a control command"""
+        new_config = self.daemon.read_new_config()
+        if new_config is None:
+            return "error: config reload failed"
+        if new_config.id == self.daemon.router_id:
+            await self.bind(new_config.inputs)
+        changed = self.daemon.reload_config(new_config)
+        self.reschedule()
+        return "ok: {} route(s) changed".format(len(set(changed)))
+
+    async def run_command(self, command):
+        """runs a control command, returns the text to reply with"""
+        if command == "reload":
+            return await self.reload()
+        return self.daemon.handle_command(command)
+
+    async def serve_control(self, reader, writer):
+        try:
+            command = (await reader.read(4096)).decode(errors="replace").strip()
+            writer.write((await self.run_command(command) + "\n").encode())
+            await writer.drain()
+        except OSError:
+            pass
+        finally:
+            writer.close()
+
+    def fire(self):
+        """handles every timer due at the deadline this callback was set for"""
+        now = max(self.loop.time(), self.deadline) # call_at may run a callback up to one clock tick early
+        self.timer_handle = None
+        self.deadline = None
+        self.daemon.time_event_handler(now)
+        self.reschedule()
+
+
+async def run_routers(config_objects, setup=None):
+    """runs a router for every config object on the current event loop until cancelled.
+    'setup', if given, is called with each daemon before it starts."""
+    routers = [AsyncRouter(RoutingDaemon(config_object)) for config_object in config_objects]
+    for router in routers:
+        if setup is not None:
+            setup(router.daemon)
+    loop = asyncio.get_running_loop()
+    try: # SIGHUP reloads every router's config, inside the loop rather than in a signal handler
+        loop.add_signal_handler(signal.SIGHUP, lambda: [loop.create_task(router.reload()) for router in routers])
+    except (NotImplementedError, AttributeError): # no SIGHUP on this platform
+        pass
+    try:
+        await asyncio.gather(*[router.serve() for router in routers])
+    finally:
+        for router in routers:
+            router.stop()
@@ -0,0 +1,236 @@
+import sys
+import os
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import tracemalloc
+from simulator import *
+from routing_daemon import *
+from oracle import verify_simulation
+
+"""Convergence and scalability benchmarks for the routing daemon, run on the simulator.
+
+Every scenario is run on a generated topology with a fixed seed, so two runs of the
+same commit do the same work. Results are written as JSON so runs from different
+commits can be compared with --compare.
+
+steady_state measures what a converged network with no changes costs over STEADY_PERIODS
+update periods, the traffic --adaptive (adaptive periodic updates) is there to cut.
+
+Usage: python benchmark_convergence.py [--sizes 25 100] [--output results.json] [--compare old.json]
+"""
+
+SCENARIOS = ("cold_start", "link_failure", "router_death", "flapping_link", "steady_state")
+TOPOLOGIES = {
+    "ring": lambda size, seed: ring_topology(size, seed=seed),
+    "grid": lambda size, seed: grid_topology(int(size ** 0.5), int(size ** 0.5), seed=seed),
+    "random": lambda size, seed: random_topology(size, 4, seed=seed),
+    "scale_free": lambda size, seed: scale_free_topology(size, 2, seed=seed),
+}
+PROFILED = ("recieve_table", "update", "serialize") # RoutingDaemon methods whose CPU time is reported
+FLAPS = 3 # times the flapping link goes down and back up
+STEADY_PERIODS = 20 # update periods the steady_state scenario runs for
+
+
+class MethodTimer(object):
+    """Wraps RoutingDaemon methods to add up the CPU time and calls spent in each.
+
+    Attributes:
+    cpu -- dictionary of method name -> CPU seconds spent in it
+    calls -- dictionary of method name -> number of calls
+    originals -- dictionary of method name -> the unwrapped method
+    """
+
+    def __init__(self, names):
+        self.cpu = {name: 0.0 for name in names}
+        self.calls = {name: 0 for name in names}
+        self.originals = {name: getattr(RoutingDaemon, name) for name in names}
+
+    def wrap(self, name, method):
+        cpu, calls, clock = self.cpu, self.calls, time.process_time
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                cpu[name] += clock() - started
+                calls[name] += 1
+        return timed
+
+    def __enter__(self):
+        for name, method in self.originals.items():
+            setattr(RoutingDaemon, name, self.wrap(name, method))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, method in self.originals.items():
+            setattr(RoutingDaemon, name, method)
+
+    def reset(self):
+        for name in self.cpu:
+            self.cpu[name] = 0.0
+            self.calls[name] = 0
+
+
+def busiest_router(links):
+    """the router with the most links, ties going to the lowest id"""
+    degree = {}
+    for router_a, router_b, _ in links:
+        degree[router_a] = degree.get(router_a, 0) + 1
+        degree[router_b] = degree.get(router_b, 0) + 1
+    return min(degree, key=lambda router_id: (-degree[router_id], router_id))
+
+
+def run_scenario(scenario, links, period, seed, timer, adaptive=False):
+    """runs one scenario and returns the virtual time it took to converge, or None if it did not.
+    Only the part after the network first converges is measured, except for cold_start."""
+    sim = Simulation(build_configs(links, period), seed=seed)
+    for daemon in sim.daemons.values():
+        daemon.adaptive_updates = adaptive
+    config_object = sim.config_objects[links[0][0]]
+    settle = config_object.garbage + 2 * period # long enough for timeouts and garbage collection to play out
+    limit = 20 * settle
+    sim.start()
+    if scenario == "cold_start":
+        converged = sim.run_until_converged(2 * period, limit)
+        return sim, converged
+    sim.run_until_converged(2 * period, limit)
+    timer.reset()
+    sim.network.stats = dict.fromkeys(sim.network.stats, 0)
+    sim.changes = 0
+    started = sim.clock.now
+    router_a, router_b, _ = links[0]
+    if scenario == "steady_state": # nothing changes, only the periodic updates are measured
+        sim.run(started + STEADY_PERIODS * period)
+        return sim, 0.0 if sim.changes == 0 else None
+    if scenario == "link_failure":
+        sim.network.set_link(router_a, router_b, up=False)
+    elif scenario == "router_death":
+        sim.kill_router(busiest_router(links))
+    elif scenario == "flapping_link":
+        for flap in range(FLAPS): # down long enough for the routes over it to time out, then back up
+            sim.network.set_link(router_a, router_b, up=False)
+            sim.run(sim.clock.now + config_object.timeout + period)
+            sim.network.set_link(router_a, router_b, up=True)
+            sim.run(sim.clock.now + 2 * period)
+    converged = sim.run_until_converged(settle, started + limit)
+    if converged is None:
+        return sim, None
+    return sim, max(converged, started) - started
+
+
+def measure(scenario, topology, size, period, seed, trace_memory, verify=False, adaptive=False):
+    """runs a scenario and collects its results into a dictionary, with the number of routes
+    that are not shortest paths if 'verify' is set"""
+    links = TOPOLOGIES[topology](size, seed)
+    with MethodTimer(PROFILED) as timer:
+        wall_started, cpu_started = time.perf_counter(), time.process_time()
+        sim, converged = run_scenario(scenario, links, period, seed, timer, adaptive)
+        wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+    result = {
+        "scenario": scenario,
+        "topology": topology,
+        "routers": len(sim.daemons),
+        "links": len(links),
+        "converge_seconds": converged,
+        "packets": sim.network.stats["packets"],
+        "bytes": sim.network.stats["bytes"],
+        "route_changes": sim.changes,
+        "cpu_seconds": {name: round(timer.cpu[name], 6) for name in PROFILED},
+        "calls": dict(timer.calls),
+        "total_cpu_seconds": round(cpu, 6),
+        "wall_seconds": round(wall, 6),
+    }
+    if verify:
+        result["mismatches"] = len(verify_simulation(sim))
+    if trace_memory: # a second run under tracemalloc, so its overhead does not skew the timings
+        tracemalloc.start()
+        with MethodTimer(()) as untimed:
+            run_scenario(scenario, links, period, seed, untimed, adaptive)
+        result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result
+
+
+def git_commit():
+    """the commit the benchmark is run from, if it is run from a git checkout"""
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def result_key(result):
+    return (result["scenario"], result["topology"], result["routers"])
+
+
+def compare(results, baseline_file):
+    """prints how each result moved against the same scenario in an earlier results file"""
+    with open(baseline_file) as baseline:
+        baseline_results = {result_key(result): result for result in json.load(baseline)["results"]}
+    print('|{:>14} |{:>11} |{:>8} |{:>12} |{:>12} |{:>12} |'.format('Scenario', 'Topology', 'Routers', 'Converge', 'Bytes', 'CPU'))
+    print("-" * 82)
+    for result in results:
+        old = baseline_results.get(result_key(result))
+        if old is None:
+            continue
+        ratios = []
+        for field in ("converge_seconds", "bytes", "total_cpu_seconds"):
+            if old[field] and result[field] is not None:
+                ratios.append("{:.2f}x".format(float(result[field]) / old[field]))
+            else:
+                ratios.append("-")
+        print('|{:>14} |{:>11} |{:>8} |{:>12} |{:>12} |{:>12} |'.format(result["scenario"], result["topology"], result["routers"], *ratios))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="RIP convergence and scalability benchmarks")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[25, 100], help="numbers of routers to benchmark")
+    arg_parser.add_argument("--topologies", nargs="+", default=["ring", "random"], choices=sorted(TOPOLOGIES))
+    arg_parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=SCENARIOS)
+    arg_parser.add_argument("--period", type=int, default=30, help="update period of every router in seconds")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    arg_parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run that measures peak memory")
+    arg_parser.add_argument("--output", default="bench_output.json", help="file the JSON results are written to")
+    arg_parser.add_argument("--compare", help="earlier results file to compare against")
+    arg_parser.add_argument("--verify", action="store_true", help="check every converged table against the shortest path oracle")
+    arg_parser.add_argument("--adaptive", action="store_true", help="run the routers with adaptive periodic updates")
+    args = arg_parser.parse_args()
+    EVENT_LOG.level = WARNING # every router would log its route changes
+
+    results = []
+    print('|{:>14} |{:>11} |{:>8} |{:>10} |{:>9} |{:>11} |{:>9} |{:>12} |'.format('Scenario', 'Topology', 'Routers', 'Converge', 'Packets', 'Bytes', 'CPU (s)', 'Peak mem'))
+    print("-" * 101)
+    for topology in args.topologies:
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                result = measure(scenario, topology, size, args.period, args.seed, not args.no_memory, args.verify, args.adaptive)
+                results.append(result)
+                converge = "-" if result["converge_seconds"] is None else "{:.1f}".format(result["converge_seconds"])
+                print('|{:>14} |{:>11} |{:>8} |{:>10} |{:>9} |{:>11} |{:>9.2f} |{:>12} |'.format(scenario, topology, result["routers"], converge, result["packets"], result["bytes"], result["total_cpu_seconds"], result.get("peak_memory_bytes", "-")))
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "period": args.period,
+        "adaptive": args.adaptive,
+        "seed": args.seed,
+        "results": results,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print("Results written to {}".format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+    wrong = [result for result in results if result.get("mismatches")]
+    for result in wrong:
+        print("{} on {} {}: {} routes are not shortest paths".format(result["scenario"], result["routers"], result["topology"], result["mismatches"]))
+    if wrong:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+import sys
+import time
+import random
+import argparse
+from forwarding import *
+
+"""Benchmark of ForwardingTable compiles and longest prefix match lookups.
+
+Each run compiles a table of 'size' random prefixes, with lengths spread roughly as in
+an Internet routing table (mostly /24, then /16 to /23, a few longer and shorter), over
+NEXT_HOPS next hops. It then looks up random addresses, half of them inside a prefix,
+one at a time with lookup_one, as a batch list with lookup, and as a batch NumPy array
+when NumPy is installed. A sample of the answers is checked against a plain longest
+prefix match over the prefixes.
+
+Usage: python benchmark_forwarding.py [--sizes 1000 100000] [--lookups 1000000]
+"""
+
+NEXT_HOPS = 32
+LENGTHS = [8] * 1 + [12] * 2 + list(range(16, 24)) * 5 + [24] * 55 + list(range(25, 33)) * 1 # length of each random prefix is drawn from this
+CHECKED = 10000 # lookups checked against the plain longest prefix match
+
+
+def make_routes(size, rng):
+    """'size' random (address, length, next hop) prefixes, no two the same"""
+    routes = {}
+    while len(routes) < size:
+        length = rng.choice(LENGTHS)
+        address = rng.getrandbits(32) & ((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+        routes[(address, length)] = rng.randint(1, NEXT_HOPS)
+    return [(address, length, next_hop) for (address, length), next_hop in routes.items()]
+
+
+def make_addresses(routes, count, rng):
+    """'count' addresses, every other one inside a random prefix and the rest anywhere"""
+    addresses = []
+    for index in range(count):
+        if index % 2:
+            addresses.append(rng.getrandbits(32))
+        else:
+            address, length, _ = rng.choice(routes)
+            addresses.append(address | (rng.getrandbits(32) & ((1 << (32 - length)) - 1)))
+    return addresses
+
+
+def plain_lookup(routes_by_length, address):
+    """the longest prefix match, trying every length from longest to shortest"""
+    for length in range(32, -1, -1):
+        next_hop = routes_by_length[length].get(address & ((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF))
+        if next_hop is not None:
+            return next_hop
+    return NO_ROUTE
+
+
+def check(table, routes, addresses):
+    """returns True if the table agrees with the plain longest prefix match on 'addresses'"""
+    routes_by_length = [{} for _ in range(33)]
+    for address, length, next_hop in routes:
+        routes_by_length[length][address] = next_hop
+    return all(table.lookup_one(address) == plain_lookup(routes_by_length, address) for address in addresses)
+
+
+def best_time(function, repeat):
+    """returns the fastest of 'repeat' calls of 'function', in seconds"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Forwarding table lookup benchmark")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="numbers of prefixes in the table")
+    arg_parser.add_argument("--lookups", type=int, default=1000000, help="addresses looked up in each batch")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="runs of each lookup, the fastest is reported")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    rng = random.Random(args.seed)
+    if numpy is None:
+        print("NumPy is not installed, the array lookup is left out")
+
+    print('|{:>9} |{:>12} |{:>12} |{:>16} |{:>16} |{:>16} |'.format('Prefixes', 'Compile (ms)', 'Memory (kB)', 'one (M/s)', 'batch (M/s)', 'array (M/s)'))
+    print("-" * 94)
+    for size in args.sizes:
+        routes = make_routes(size, rng)
+        addresses = make_addresses(routes, args.lookups, rng)
+        started = time.perf_counter()
+        table = ForwardingTable(routes)
+        compile_time = time.perf_counter() - started
+        if not check(table, routes, addresses[:CHECKED]):
+            print("Forwarding table disagrees with the plain longest prefix match on {} prefixes".format(size))
+            sys.exit(1)
+        memory = sum(len(level) * level.itemsize for level in table.levels) / 1024
+        lookup_one = table.lookup_one
+        one_time = best_time(lambda: [lookup_one(address) for address in addresses], args.repeat)
+        batch_time = best_time(lambda: table.lookup(addresses), args.repeat)
+        array_rate = "-"
+        if numpy is not None:
+            address_array = numpy.array(addresses, dtype=numpy.uint32)
+            if list(table.lookup(address_array[:CHECKED])) != table.lookup(addresses[:CHECKED]):
+                print("Array lookup disagrees with the list lookup on {} prefixes".format(size))
+                sys.exit(1)
+            array_rate = "{:.2f}".format(len(addresses) / best_time(lambda: table.lookup(address_array), args.repeat) / 1e6)
+        print('|{:>9} |{:>12.1f} |{:>12.0f} |{:>16.2f} |{:>16.2f} |{:>16} |'.format(size, compile_time * 1000, memory,
+              len(addresses) / one_time / 1e6, len(addresses) / batch_time / 1e6, array_rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+import sys
+import timeit
+from packet_class import *
+
+"""Benchmark the JSON and binary packet formats against each other.
+
+Usage: python benchmark_packet.py [entries ...]
+"""
+
+DEFAULT_SIZES = [25, 250, 2500]
+REPEATS = 5
+
+
+def make_packet(size):
+    """builds a packet with 'size' entries, like a routing table of that many routers"""
+    entries = [RipEntry('AF_INET', router_id, router_id % 16) for router_id in range(1, size + 1)]
+    return Packet(2, 2, 1, entries)
+
+
+def time_call(function, number):
+    """returns the best time per call in microseconds"""
+    return min(timeit.repeat(function, number=number, repeat=REPEATS)) / number * 1e6
+
+
+def benchmark(size):
+    """times encoding and decoding a packet of 'size' entries in each format"""
+    packet = make_packet(size)
+    number = max(1, 20000 // size) # keep each run to a similar amount of work
+    results = {}
+    for packet_format in FORMATS:
+        data = packet.to_bytes(packet_format)
+        encode = time_call(lambda: packet.to_bytes(packet_format), number)
+        decode = time_call(lambda: Packet.from_bytes(data), number)
+        results[packet_format] = (len(data), encode, decode)
+    return results
+
+
+def main():
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    print('|{:>8} |{:>8} |{:>10} |{:>12} |{:>12} |'.format('Entries', 'Format', 'Bytes', 'Encode (us)', 'Decode (us)'))
+    print("-" * 61)
+    for size in sizes:
+        results = benchmark(size)
+        for packet_format in FORMATS:
+            length, encode, decode = results[packet_format]
+            print('|{:>8} |{:>8} |{:>10} |{:>12.1f} |{:>12.1f} |'.format(size, packet_format, length, encode, decode))
+        json_result, binary_result = results["json"], results["binary"]
+        print('|{:>8} |{:>8} |{:>9.1f}x |{:>11.1f}x |{:>11.1f}x |'.format(size, 'speedup', float(json_result[0]) / binary_result[0], json_result[1] / binary_result[1], json_result[2] / binary_result[2]))
+
+
+if __name__ == "__main__":
+    main()
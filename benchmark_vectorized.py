@@ -0,0 +1,116 @@
+import sys
+import time
+import random
+import argparse
+from Bellman_Ford import *
+from routing_table import *
+from routing_daemon import MAX_ENTRIES
+
+"""Benchmark of DistanceVector.apply against the NumPy kernel, apply_vectors, on large tables.
+
+Each run builds a router with two neighbours and a table of 'size' destinations learnt
+through the first neighbour, then applies a full table from the second neighbour in
+which a fraction of the routes are better. Both kernels start from identical tables
+and must end with identical tables and the same changed destinations. The same table
+is then applied again, as a periodic update from a stable neighbour would be, which
+changes nothing.
+
+The daemon never applies a whole table at once: a neighbour sends it in datagrams of at
+most MAX_ENTRIES routes, each applied on its own. The second set of rows applies the same
+table that way, datagram by datagram, with the loop, with apply_vectors forced on every
+datagram, and through apply_table, which is what the daemon runs with --vectorized.
+
+Usage: python benchmark_vectorized.py [--sizes 10000 100000] [--repeat 5]
+"""
+
+ROUTER_ID = 1
+NEIGHBOURS = {2: 1, 3: 2} # neighbour id -> link cost
+
+
+def build_engine(size, rng_seed):
+    """a router that has learnt 'size' destinations through neighbour 2, and the table neighbour 3 sends it"""
+    rng = random.Random(rng_seed)
+    routes = {ROUTER_ID: (ROUTER_ID, 0)}
+    for neighbour, cost in NEIGHBOURS.items():
+        routes[neighbour] = (neighbour, cost)
+    recieved = {}
+    for dest in range(10, size + 10):
+        routes[dest] = (2, rng.randint(2, 12))
+        recieved[dest] = (3, rng.randint(1, 15))
+    return routes, recieved
+
+
+def datagrams(recieved, entries):
+    """splits 'recieved' into tables of at most 'entries' routes, as the neighbour sends it"""
+    items = list(recieved.items())
+    return [dict(items[start:start + entries]) for start in range(0, len(items), entries)]
+
+
+def apply_timed(kernel, engine, tables):
+    """applies each of 'tables' in turn with one kernel, returns the time taken and the changed destinations"""
+    changed = []
+    started = time.perf_counter()
+    for recieved in tables:
+        if kernel == "vectorized":
+            changed += engine.apply_vectors(*table_vectors(recieved), 3)
+        elif kernel == "dispatched":
+            changed += engine.apply_table(recieved, 3, vectorized=True)
+        else:
+            changed += engine.apply(recieved, 3)
+    return time.perf_counter() - started, changed
+
+
+def run_kernel(kernel, routes, tables, repeat):
+    """applies 'tables' to a fresh table, then again to the updated table, 'repeat' times.
+    Returns the best time of each, the last table and the changes the first apply made."""
+    best_first = best_steady = None
+    for _ in range(repeat):
+        table = RoutingTable(routes)
+        engine = DistanceVector(ROUTER_ID, table, dict(NEIGHBOURS))
+        first, changed = apply_timed(kernel, engine, tables)
+        steady, _ = apply_timed(kernel, engine, tables)
+        best_first = first if best_first is None else min(best_first, first)
+        best_steady = steady if best_steady is None else min(best_steady, steady)
+    return best_first, best_steady, table, changed
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Vectorized distance vector kernel benchmark")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 30000, 100000], help="numbers of destinations in the table")
+    arg_parser.add_argument("--repeat", type=int, default=5, help="runs of each kernel, the fastest is reported")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    if numpy is None:
+        print("NumPy is not installed, the vectorized kernel is unavailable")
+        sys.exit(1)
+
+    print('|{:>10} |{:>10} |{:>14} |{:>14} |{:>9} |{:>14} |{:>14} |{:>9} |'.format('Entries', 'Changed', 'apply (ms)', 'vectors (ms)', 'Speedup', 'steady apply', 'steady vectors', 'Speedup'))
+    print("-" * 110)
+    for size in args.sizes:
+        routes, recieved = build_engine(size, args.seed)
+        loop_time, loop_steady, loop_table, loop_changed = run_kernel("loop", routes, [recieved], args.repeat)
+        vector_time, vector_steady, vector_table, vector_changed = run_kernel("vectorized", routes, [recieved], args.repeat)
+        if loop_table != vector_table or sorted(loop_changed) != sorted(vector_changed):
+            print("Kernels disagree on {} entries".format(size))
+            sys.exit(1)
+        print('|{:>10} |{:>10} |{:>14.2f} |{:>14.2f} |{:>8.1f}x |{:>14.2f} |{:>14.2f} |{:>8.1f}x |'.format(size, len(loop_changed), loop_time * 1000, vector_time * 1000, loop_time / vector_time,
+              loop_steady * 1000, vector_steady * 1000, loop_steady / vector_steady))
+
+    print()
+    print("Applied as the daemon does, in datagrams of {} routes".format(MAX_ENTRIES))
+    print('|{:>10} |{:>10} |{:>14} |{:>14} |{:>14} |{:>14} |'.format('Entries', 'Datagrams', 'apply (ms)', 'vectors (ms)', 'daemon (ms)', 'steady daemon'))
+    print("-" * 88)
+    for size in args.sizes:
+        routes, recieved = build_engine(size, args.seed)
+        tables = datagrams(recieved, MAX_ENTRIES)
+        loop_time, _, loop_table, loop_changed = run_kernel("loop", routes, tables, args.repeat)
+        vector_time, _, vector_table, vector_changed = run_kernel("vectorized", routes, tables, args.repeat)
+        daemon_time, daemon_steady, daemon_table, daemon_changed = run_kernel("dispatched", routes, tables, args.repeat)
+        if not loop_table == vector_table == daemon_table or not sorted(loop_changed) == sorted(vector_changed) == sorted(daemon_changed):
+            print("Kernels disagree on {} entries in datagrams".format(size))
+            sys.exit(1)
+        print('|{:>10} |{:>10} |{:>14.2f} |{:>14.2f} |{:>14.2f} |{:>14.2f} |'.format(size, len(tables), loop_time * 1000, vector_time * 1000, daemon_time * 1000, daemon_steady * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+import time
+import struct
+
+"""Capture logs of the datagrams a router recieves, for replaying its exact update stream
+offline (see replay.py).
+
+A capture log is append-only. It starts with one CAPTURE_HEADER and then holds one
+record per datagram:
+    record header -- RECORD: monotonic time recieved, ingress port, datagram length
+    datagram      -- the datagram's bytes, as read off the socket
+Everything is in network byte order, so a log can be replayed on any machine. Writes go
+through the file object's buffer, so capturing costs a struct pack and two buffered
+writes per datagram. A router killed mid-write leaves at most a partial last record,
+which the reader stops short of.
+"""
+
+CAPTURE_MAGIC = b"RIPC"
+CAPTURE_VERSION = 1
+CAPTURE_HEADER = struct.Struct("!4sHid") # magic, version, router id, wall clock time the capture started
+RECORD = struct.Struct("!dHI") # 14 bytes before every datagram
+CAPTURE_BUFFER = 1 << 16 # bytes buffered before they are written to the file
+
+
+class CaptureError(ValueError):
+    # Raised when a file is not a capture log, or is a capture of another router.
+    pass
+
+
+class CaptureWriter(object):
+    """
+    Appends the datagrams a router recieves to a capture log.
+
+    Attributes:
+    path -- path of the capture log.
+    router_id -- the id of the router capturing.
+    capture_file -- the log, opened for appending.
+    records -- datagrams written since the writer was opened.
+
+    Methods:
+    write -- appends one datagram.
+    flush -- writes out whatever is buffered.
+    close -- flushes and closes the log.
+    """
+
+    def __init__(self, path, router_id):
+        self.path = path
+        self.router_id = router_id
+        self.records = 0
+        self.capture_file = open(path, "ab", buffering=CAPTURE_BUFFER)
+        if self.capture_file.tell() == 0: # a new log, an existing one carries on where it ended
+            self.capture_file.write(CAPTURE_HEADER.pack(CAPTURE_MAGIC, CAPTURE_VERSION, router_id, time.time()))
+        else:
+            with open(path, "rb") as existing:
+                if read_header(existing, path) != router_id:
+                    self.capture_file.close()
+                    raise CaptureError("{} is a capture of another router".format(path))
+
+    def write(self, when, port, data):
+        """appends 'data', recieved on input 'port' at monotonic time 'when'"""
+        self.capture_file.write(RECORD.pack(when, port, len(data)))
+        self.capture_file.write(data)
+        self.records += 1
+
+    def flush(self):
+        self.capture_file.flush()
+
+    def close(self):
+        self.capture_file.close()
+
+
+def read_header(capture_file, path):
+    """reads the header of an open capture log, returns the id of the router that wrote it"""
+    header = capture_file.read(CAPTURE_HEADER.size)
+    if len(header) < CAPTURE_HEADER.size:
+        raise CaptureError("{} is too short to be a capture log".format(path))
+    magic, version, router_id, _ = CAPTURE_HEADER.unpack(header)
+    if magic != CAPTURE_MAGIC or version != CAPTURE_VERSION:
+        raise CaptureError("{} is not a version {} capture log".format(path, CAPTURE_VERSION))
+    return router_id
+
+
+def read_capture(path):
+    """returns (router id, records) for the capture log at 'path', records being a list of
+    (monotonic time, ingress port, datagram) in the order they were recieved. The datagrams
+    are memoryviews of the log read into memory in one go. A log appended to by a restarted
+    router can go back in time where the new capture starts, the times from there on are
+    moved up to carry on from the last datagram before it."""
+    with open(path, "rb") as capture_file:
+        router_id = read_header(capture_file, path)
+        data = memoryview(capture_file.read())
+    records = []
+    offset = 0
+    shift = 0.0
+    last = float("-inf")
+    while offset + RECORD.size <= len(data):
+        when, port, length = RECORD.unpack_from(data, offset)
+        offset += RECORD.size
+        if offset + length > len(data): # cut short when the router stopped
+            break
+        if when + shift < last: # a monotonic clock of another process or boot
+            shift = last - when
+        last = when + shift
+        records.append((last, port, data[offset:offset + length]))
+        offset += length
+    return router_id, records
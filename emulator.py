@@ -0,0 +1,458 @@
+import os
+import sys
+import time
+import struct
+import argparse
+import multiprocessing
+from multiprocessing import shared_memory
+from simulator import *
+
+"""Multi-core network emulator. Splits a topology across worker processes, each running
+a shard of the routers as a Simulation, so a large network is not held to the one core
+a single Python process gets.
+
+The workers run in lockstep epochs of virtual time. An epoch is never longer than the
+link delay, so a datagram sent during one cannot arrive before the next one starts: a
+worker can run a whole epoch on its own, and datagrams between workers only need to
+be handed over between epochs. They travel through shared memory rings, two for every
+ordered pair of workers. The coordinator (the Emulator, in the parent process) starts
+each epoch at the earliest event any worker has waiting, so idle virtual time is
+skipped, and detects convergence from the route changes each worker reports.
+
+Usage: python emulator.py [--size 10000] [--topology random] [--workers 1 2 4]
+"""
+
+RING_SIZE = 1 << 22 # bytes of datagrams each worker can hand another in one exchange
+TOPOLOGIES = {
+    "ring": lambda size, seed: ring_topology(size, seed=seed),
+    "grid": lambda size, seed: grid_topology(int(size ** 0.5), int(size ** 0.5), seed=seed),
+    "random": lambda size, seed: random_topology(size, 4, seed=seed),
+    "scale_free": lambda size, seed: scale_free_topology(size, 2, seed=seed),
+}
+
+
+class Ring(object):
+    """
+    Single producer, single consumer ring of datagrams in a block of shared memory. The
+    block starts with the read position, the write position and the capacity; the rest
+    is the ring, holding a RECORD header and the datagram for each entry, wrapping around
+    the end. Positions only ever grow and are taken modulo the capacity. The emulator
+    never writes to a ring while its reader is taking from it, so no locking is needed.
+
+    Attributes:
+    memory -- the SharedMemory block
+    capacity -- bytes in the ring
+
+    Methods:
+    put -- appends a datagram, returns False if the ring has no room for it
+    take -- removes and returns every datagram in the ring
+    """
+    HEADER = struct.Struct("=QQQ") # read position, write position, capacity
+    RECORD = struct.Struct("=dIH") # delivery time, reciever id, datagram length
+
+    def __init__(self, memory, create=False):
+        self.memory = memory
+        if create:
+            self.HEADER.pack_into(memory.buf, 0, 0, 0, memory.size - self.HEADER.size)
+        self.capacity = self.HEADER.unpack_from(memory.buf)[2]
+
+    def write_at(self, position, data):
+        buffer, start = self.memory.buf, self.HEADER.size
+        offset = position % self.capacity
+        first = min(len(data), self.capacity - offset)
+        buffer[start + offset:start + offset + first] = data[:first]
+        if first < len(data): # wraps around the end of the ring
+            buffer[start:start + len(data) - first] = data[first:]
+
+    def read_at(self, position, size):
+        buffer, start = self.memory.buf, self.HEADER.size
+        offset = position % self.capacity
+        first = min(size, self.capacity - offset)
+        data = bytes(buffer[start + offset:start + offset + first])
+        if first < size:
+            data += bytes(buffer[start:start + size - first])
+        return data
+
+    def put(self, when, reciever_id, data):
+        head, tail, _ = self.HEADER.unpack_from(self.memory.buf)
+        size = self.RECORD.size + len(data)
+        if self.capacity - (tail - head) < size:
+            return False
+        self.write_at(tail, self.RECORD.pack(when, reciever_id, len(data)) + data)
+        struct.pack_into("=Q", self.memory.buf, 8, tail + size) # published after the datagram is in place
+        return True
+
+    def take(self):
+        head, tail, _ = self.HEADER.unpack_from(self.memory.buf)
+        datagrams = []
+        while head < tail:
+            when, reciever_id, length = self.RECORD.unpack(self.read_at(head, self.RECORD.size))
+            datagrams.append((when, reciever_id, self.read_at(head + self.RECORD.size, length)))
+            head += self.RECORD.size + length
+        struct.pack_into("=Q", self.memory.buf, 0, head)
+        return datagrams
+
+
+class ShardNetwork(Network):
+    """
+    Network of one worker. Datagrams to routers in the worker's shard are scheduled as
+    in the simulator; those to routers in other shards are put on the ring to the worker
+    that owns them, or held back in order if that ring is full.
+
+    Attributes:
+    owners -- dictionary of router id -> index of the worker running it
+    index -- index of this worker
+    rings -- dictionary of (parity, worker index) -> Ring datagrams for that worker are put on
+    parity -- which of the two sets of rings datagrams are put on this epoch
+    backlog -- dictionary of worker index -> list of datagrams waiting for room on its ring
+    earliest -- earliest delivery time of the datagrams handed to other workers this epoch
+
+    Methods:
+    flush -- moves held back datagrams onto the rings, returns whether any are still held back
+    """
+
+    def __init__(self, simulation, delay=0.01, loss=0.0, seed=None):
+        Network.__init__(self, simulation, delay, loss, seed)
+        self.owners = {}
+        self.index = 0
+        self.rings = {}
+        self.parity = 0
+        self.backlog = {}
+        self.earliest = float("inf")
+        self.stats["crossed"] = 0
+
+    def carry(self, reciever_id, when, data):
+        worker = self.owners.get(reciever_id, self.index)
+        if worker == self.index:
+            Network.carry(self, reciever_id, when, data)
+            return
+        self.stats["crossed"] += 1
+        self.earliest = min(self.earliest, when)
+        backlog = self.backlog.setdefault(worker, [])
+        if backlog or not self.rings[(self.parity, worker)].put(when, reciever_id, data): # keep the datagrams in order
+            backlog.append((when, reciever_id, data))
+
+    def flush(self):
+        for worker, backlog in self.backlog.items():
+            ring = self.rings[(self.parity, worker)]
+            sent = 0
+            for when, reciever_id, data in backlog:
+                if not ring.put(when, reciever_id, data):
+                    break
+                sent += 1
+            del backlog[:sent]
+        return any(self.backlog.values())
+
+
+class ShardSimulation(Simulation):
+    """
+    The routers of one worker, run as a Simulation whose network reaches the other
+    workers through shared memory rings. Routers in other shards can be named in every
+    method; a worker only acts on its own.
+
+    There are two rings from every worker to every other, used on alternate epochs: at
+    the start of an epoch a worker takes what was put on the rings during the last one
+    while the other workers are already putting this epoch's datagrams on the other set.
+
+    Attributes:
+    index -- index of this worker
+    incoming -- dictionary of parity -> list of the Rings other workers put datagrams for this one on
+
+    Methods:
+    drain -- schedules the datagrams waiting on the incoming rings of the current parity
+    run_epoch -- takes the last epoch's datagrams, then runs this one on the other set of rings
+    next_event -- virtual time of the earliest event waiting here or handed to another worker
+    report -- the reply sent to the coordinator after every command
+    """
+    network_class = ShardNetwork
+
+    def __init__(self, config_objects, index, owners, ports, delay=0.01, loss=0.0, seed=None):
+        Simulation.__init__(self, config_objects, delay, loss, seed)
+        self.index = index
+        self.incoming = {0: [], 1: []}
+        self.network.index = index
+        self.network.owners = owners
+        self.network.ports.update(ports)
+
+    def drain(self):
+        for ring in self.incoming[self.network.parity]:
+            for when, reciever_id, data in ring.take():
+                self.schedule(when, "deliver", reciever_id, data)
+
+    def run_epoch(self, until):
+        self.drain()
+        self.network.parity ^= 1
+        self.network.earliest = float("inf")
+        self.run(until)
+
+    def next_event(self):
+        return min(self.events[0][0] if self.events else float("inf"), self.network.earliest)
+
+    def report(self):
+        """(route changes, time of the last change, whether datagrams are held back, next event time)"""
+        return (self.changes, self.last_change, self.network.flush(), self.next_event())
+
+    def kill_router(self, router_id):
+        if router_id in self.daemons:
+            Simulation.kill_router(self, router_id)
+
+    def revive_router(self, router_id):
+        if router_id in self.daemons:
+            Simulation.revive_router(self, router_id)
+
+    def set_link_cost(self, router_a, router_b, metric):
+        for router_id, neighbour in ((router_a, router_b), (router_b, router_a)):
+            daemon = self.daemons.get(router_id)
+            if daemon is None:
+                continue
+            for output in daemon.output_ports:
+                if output.id == neighbour:
+                    output.metric = metric
+            if router_id in self.dead:
+                continue
+            changed_routes = daemon.set_link_cost(neighbour, metric)
+            daemon.send_update(changed_routes)
+            self.record_changes(changed_routes)
+            self.wake(router_id)
+
+
+def run_worker(index, config_objects, owners, ports, ring_names, connection, delay, loss, seed):
+    """body of a worker process: builds its shard and runs the coordinator's commands until told to stop.
+    'ring_names' is a dictionary of (parity, from worker, to worker) -> shared memory name."""
+    EVENT_LOG.level = WARNING # thousands of routers would log every route change
+    memories = {key: shared_memory.SharedMemory(name) for key, name in ring_names.items() if index in key[1:]}
+    simulation = ShardSimulation(config_objects, index, owners, ports, delay, loss, None if seed is None else seed + index)
+    for (parity, source, to), memory in memories.items():
+        if source == index:
+            simulation.network.rings[(parity, to)] = Ring(memory)
+        else:
+            simulation.incoming[parity].append(Ring(memory))
+    network = simulation.network
+    try:
+        while True:
+            command, argument = connection.recv()
+            if command == "stop":
+                break
+            elif command == "run":
+                simulation.run_epoch(argument)
+            elif command == "drain":
+                simulation.drain()
+                connection.send(None)
+                continue
+            elif command == "flush":
+                pass # the report flushes
+            elif command == "start":
+                simulation.start()
+            elif command == "kill":
+                simulation.kill_router(argument)
+            elif command == "revive":
+                simulation.revive_router(argument)
+            elif command == "link_cost":
+                simulation.set_link_cost(*argument)
+            elif command == "stats":
+                connection.send(dict(network.stats, changes=simulation.changes, routers=len(simulation.daemons)))
+                continue
+            elif command == "tables":
+                connection.send(simulation.routing_tables())
+                continue
+            connection.send(simulation.report())
+    finally:
+        for memory in memories.values():
+            memory.close()
+        connection.close()
+
+
+class Emulator(object):
+    """
+    Coordinator of the worker processes. Offers the same methods as Simulation, so a
+    scenario written for the simulator runs on the emulator unchanged.
+
+    Routers are split into contiguous blocks of ids, one per worker, which keeps most
+    links of the generated topologies inside a worker. Each epoch starts at the earliest
+    event waiting in any worker or on any ring, so idle virtual time is skipped, and is
+    one round trip to the workers: every worker takes the datagrams handed to it in the
+    last epoch, runs to the end of this one, and reports back. A worker whose ring to
+    another filled up holds the rest back; the coordinator then has every worker drain
+    and flush until nothing is held back, before the next epoch starts.
+
+    Attributes:
+    config_objects -- dictionary of router id -> Config
+    delay -- one way link delay, and the longest an epoch can be, in seconds
+    workers -- number of worker processes
+    owners -- dictionary of router id -> index of the worker running it
+    processes -- the worker processes
+    connections -- the coordinator's end of each worker's pipe
+    memories -- the SharedMemory block of each ring, unlinked on close
+    now -- virtual time every worker has run to
+    next_event -- virtual time of the earliest event waiting anywhere
+    last_change -- virtual time at which any routing table last changed
+    changes -- number of route changes made across every worker
+    epochs -- number of epochs run
+
+    Methods:
+    start -- starts every router
+    run -- runs every worker in lockstep until the given virtual time
+    run_until_converged -- runs until no routing table has changed for a while
+    kill_router -- stops a router
+    revive_router -- restarts a killed router
+    set_link_cost -- changes the metric of the link between two routers
+    routing_tables -- every live router's routing table
+    stats -- network statistics summed over the workers
+    close -- stops the workers and frees the rings
+    """
+
+    def __init__(self, config_objects, workers=None, delay=0.01, loss=0.0, seed=None, ring_size=RING_SIZE):
+        if delay <= 0:
+            raise ValueError("the emulator needs a link delay above zero to run workers in lockstep")
+        self.config_objects = {config_object.id: config_object for config_object in config_objects}
+        self.delay = delay
+        self.now = 0.0
+        self.next_event = float("inf")
+        self.last_change = 0.0
+        self.changes = 0
+        self.epochs = 0
+        ids = sorted(self.config_objects)
+        workers = self.workers = max(1, min(workers or os.cpu_count() or 1, len(ids)))
+        shards = [ids[len(ids) * worker // workers:len(ids) * (worker + 1) // workers] for worker in range(workers)]
+        self.owners = {router_id: worker for worker, shard in enumerate(shards) for router_id in shard}
+        ports = {port: config_object.id for config_object in config_objects for port in config_object.inputs}
+        self.memories = {}
+        for parity in (0, 1):
+            for source in range(workers):
+                for to in range(workers):
+                    if source != to:
+                        memory = shared_memory.SharedMemory(create=True, size=ring_size)
+                        Ring(memory, create=True)
+                        self.memories[(parity, source, to)] = memory
+        ring_names = {key: memory.name for key, memory in self.memories.items()}
+        self.processes = []
+        self.connections = []
+        for worker, shard in enumerate(shards):
+            connection, worker_end = multiprocessing.Pipe()
+            process = multiprocessing.Process(target=run_worker, name="emulator-{}".format(worker), daemon=True,
+                                              args=(worker, [self.config_objects[router_id] for router_id in shard], self.owners, ports, ring_names, worker_end, delay, loss, seed))
+            process.start()
+            worker_end.close()
+            self.processes.append(process)
+            self.connections.append(connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def broadcast(self, command, argument=None):
+        """sends a command to every worker at once, then returns their replies in worker order"""
+        for connection in self.connections:
+            connection.send((command, argument))
+        return [connection.recv() for connection in self.connections]
+
+    def settle(self, reports):
+        """records what the workers reported, then exchanges datagrams until none are held back"""
+        while any(report[2] for report in reports):
+            self.broadcast("drain")
+            reports = self.broadcast("flush")
+        self.changes = sum(report[0] for report in reports)
+        self.last_change = max(report[1] for report in reports)
+        self.next_event = min(report[3] for report in reports)
+
+    def start(self):
+        self.settle(self.broadcast("start"))
+
+    def run(self, until):
+        """runs every worker, an epoch at a time, to virtual time 'until'"""
+        while self.next_event <= until:
+            end = min(self.next_event + self.delay, until)
+            self.settle(self.broadcast("run", end))
+            self.epochs += 1
+            self.now = end
+        if self.now < until: # nothing left to do before 'until', just moves every clock on
+            self.settle(self.broadcast("run", until))
+            self.now = until
+
+    def run_until_converged(self, settle, limit):
+        """runs until no routing table has changed for 'settle' seconds, or until virtual time 'limit'.
+        Returns the time of the last change, or None if the network had not settled by the limit."""
+        started = self.now
+        while True:
+            settled_at = max(self.last_change, started) + settle
+            self.run(min(settled_at, limit))
+            if self.now >= max(self.last_change, started) + settle:
+                return self.last_change
+            if self.now >= limit:
+                return None
+
+    def kill_router(self, router_id):
+        self.settle(self.broadcast("kill", router_id))
+
+    def revive_router(self, router_id):
+        self.settle(self.broadcast("revive", router_id))
+
+    def set_link_cost(self, router_a, router_b, metric):
+        self.settle(self.broadcast("link_cost", (router_a, router_b, metric)))
+
+    def routing_tables(self):
+        tables = {}
+        for shard_tables in self.broadcast("tables"):
+            tables.update(shard_tables)
+        return tables
+
+    def stats(self):
+        totals = {}
+        for shard_stats in self.broadcast("stats"):
+            for name, value in shard_stats.items():
+                totals[name] = totals.get(name, 0) + value
+        return totals
+
+    def close(self):
+        if not self.processes:
+            return
+        for connection in self.connections:
+            try:
+                connection.send(("stop", None))
+            except OSError: # the worker has already gone
+                pass
+        for process in self.processes:
+            process.join()
+        for connection in self.connections:
+            connection.close()
+        for memory in self.memories.values():
+            memory.close()
+            memory.unlink()
+        self.processes = []
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Multi-core RIP network emulator")
+    arg_parser.add_argument("--size", type=int, default=10000, help="number of routers")
+    arg_parser.add_argument("--topology", default="random", choices=sorted(TOPOLOGIES))
+    arg_parser.add_argument("--workers", type=int, nargs="+", default=[os.cpu_count() or 1], help="numbers of worker processes to run the network on, one run each")
+    arg_parser.add_argument("--period", type=int, default=30, help="update period of every router in seconds")
+    arg_parser.add_argument("--delay", type=float, default=0.01, help="one way link delay in seconds, also the epoch length")
+    arg_parser.add_argument("--ring-size", type=int, default=RING_SIZE, help="bytes in each shared memory ring")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+
+    links = TOPOLOGIES[args.topology](args.size, args.seed)
+    config_objects = build_configs(links, args.period)
+    print('|{:>8} |{:>8} |{:>10} |{:>9} |{:>10} |{:>12} |{:>10} |{:>12} |{:>8} |'.format('Workers', 'Routers', 'Converge', 'Epochs', 'Wall (s)', 'Datagrams', 'Crossed', 'Datagrams/s', 'Speedup'))
+    print("-" * 106)
+    baseline = None
+    for workers in args.workers:
+        started = time.perf_counter()
+        with Emulator(config_objects, workers, args.delay, seed=args.seed, ring_size=args.ring_size) as emulator:
+            emulator.start()
+            converged = emulator.run_until_converged(2 * args.period, 40 * args.period)
+            wall = time.perf_counter() - started
+            stats = emulator.stats()
+        rate = stats["delivered"] / wall
+        baseline = baseline or rate
+        converge = "-" if converged is None else "{:.1f}".format(converged)
+        print('|{:>8} |{:>8} |{:>10} |{:>9} |{:>10.2f} |{:>12} |{:>10} |{:>12.0f} |{:>7.2f}x |'.format(emulator.workers, stats["routers"], converge, emulator.epochs, wall,
+              stats["delivered"], stats["crossed"], rate, rate / baseline))
+
+
+if __name__ == "__main__":
+    main()
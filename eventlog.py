@@ -0,0 +1,138 @@
+import sys
+import time
+import atexit
+import threading
+import collections
+
+"""Event log for the routing daemons. Events are queued by the daemon and written out in
+batches by a background thread, so a busy router never waits on its console."""
+
+DEBUG, INFO, WARNING, ERROR = 10, 20, 30, 40
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR}
+LEVEL_NAMES = {level: name.upper() for name, level in LEVELS.items()}
+LOG_RATE = 200 # events per second let through once the burst is used up
+LOG_BURST = 1000 # events let through back to back
+FLUSH_INTERVAL = 0.2 # seconds the writer waits between batches
+
+
+class EventLog(object):
+    """
+    Leveled, rate limited event log written by a background thread.
+
+    log() only checks the level and the rate limit and appends the event, unformatted, to
+    a queue; the writer thread formats every event waiting and writes them with a single
+    write every FLUSH_INTERVAL seconds. The rate limit is a token bucket: LOG_BURST events
+    can go through at once, then LOG_RATE a second. Events over the limit are dropped and
+    counted, and the count is written with the next event let through. Errors, and events
+    logged with limited=False, are never dropped. The writer thread is started by the first
+    event and is a daemon thread; the log is flushed when the interpreter exits.
+
+    Attributes:
+    stream -- file the events are written to, None for whatever sys.stdout is at the time
+    level -- lowest level written
+    rate -- events let through per second once the burst is used up
+    burst -- events let through back to back
+    clock -- clock the rate limit runs on
+    queue -- events waiting to be written, as (time, level, source, message, args)
+    tokens -- events that can be let through now
+    refilled -- clock time the tokens were last topped up
+    suppressed -- events dropped by the rate limit since the last one written
+    thread -- the writer thread, None until the first event
+
+    Methods:
+    enabled_for -- whether events of a level are written
+    log -- queues an event
+    debug, info, warning, error -- queue an event of that level
+    flush -- writes every queued event now
+    close -- writes every queued event and stops the writer thread
+    """
+
+    def __init__(self, stream=None, level=INFO, rate=LOG_RATE, burst=LOG_BURST, clock=time.monotonic):
+        self.stream = stream
+        self.level = level
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.queue = collections.deque()
+        self.tokens = burst
+        self.refilled = clock()
+        self.suppressed = 0
+        self.thread = None
+        self.wakeup = threading.Event()
+        self.write_lock = threading.Lock()
+        self.running = False
+
+    def enabled_for(self, level):
+        return level >= self.level
+
+    def log(self, level, source, message, *args, limited=True):
+        """queues 'message'.format(*args) from 'source' (a router id, or None) at 'level'.
+        Events logged with limited=False, like output asked for by hand, skip the rate limit."""
+        if level < self.level:
+            return
+        if level < ERROR and limited:
+            if self.tokens < 1:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.refilled) * self.rate)
+                self.refilled = now
+                if self.tokens < 1:
+                    self.suppressed += 1
+                    return
+            self.tokens -= 1
+        if self.suppressed:
+            self.queue.append((time.time(), WARNING, source, "{} events dropped by the log rate limit", (self.suppressed,)))
+            self.suppressed = 0
+        self.queue.append((time.time(), level, source, message, args))
+        if self.thread is None:
+            self.start()
+
+    def debug(self, source, message, *args):
+        self.log(DEBUG, source, message, *args)
+
+    def info(self, source, message, *args):
+        self.log(INFO, source, message, *args)
+
+    def warning(self, source, message, *args):
+        self.log(WARNING, source, message, *args)
+
+    def error(self, source, message, *args):
+        self.log(ERROR, source, message, *args)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="event-log", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def run(self):
+        while self.running:
+            self.wakeup.wait(FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        """formats and writes every queued event in one write"""
+        with self.write_lock:
+            queue = self.queue
+            lines = []
+            while queue:
+                when, level, source, message, args = queue.popleft()
+                text = message.format(*args) if args else message
+                stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(when))
+                prefix = "" if source is None else "router {}: ".format(source)
+                lines.append("{}.{:03d} {:<7} {}{}\n".format(stamp, int(when % 1 * 1000), LEVEL_NAMES.get(level, level), prefix, text))
+            if lines:
+                stream = self.stream or sys.stdout
+                try:
+                    stream.write("".join(lines))
+                    stream.flush()
+                except (OSError, ValueError): # the console went away, nothing left to tell
+                    pass
+
+    def close(self):
+        self.running = False
+        self.wakeup.set()
+        self.flush()
+
+
+EVENT_LOG = EventLog() # shared by every daemon in the process unless given one of its own
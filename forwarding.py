@@ -0,0 +1,144 @@
+from array import array
+try:
+   import numpy # optional, only the batch lookup of large arrays of addresses uses it
+except ImportError:
+   numpy = None
+
+"""Read-only forwarding table compiled from converged routes, for longest prefix match
+lookups of IPv4 addresses that never touch the routing table being computed.
+
+The table is a multibit trie with strides of 16, 8 and 8 bits. The first level is one
+array of 65536 entries indexed by the top 16 bits of the address, the second and third
+levels are chunks of 256 entries indexed by the next 8 bits. Prefixes are expanded into
+every entry they cover (controlled prefix expansion), so a lookup is at most three array
+reads and no comparisons. An entry is:
+    0      -- no route
+    n > 0  -- route through next_hops[n]
+    ~c < 0 -- continue in chunk c of the next level
+Prefixes are written shortest first, so a longer prefix simply overwrites the entries of
+the shorter ones it sits inside.
+
+A ForwardingTable is never changed once compiled. A router compiles a new one when its
+routes change and swaps it in by assigning the attribute, so a reader holding the old one
+keeps a consistent table until it next looks the attribute up.
+"""
+
+LEVEL_BITS = (16, 8, 8) # stride of each level of the trie
+CHUNK = 256 # entries in a second or third level chunk
+NO_ROUTE = -1 # next hop given for an address no prefix covers
+
+
+class ForwardingTable(object):
+    """
+    Longest prefix match table of IPv4 prefix -> next hop router id.
+
+    Attributes:
+    routes -- tuple of the (address, length, next hop) prefixes compiled, shortest first.
+    next_hops -- list of next hop router ids, indexed by the leaf entries (next_hops[0] is NO_ROUTE).
+    levels -- the three array('i') levels of the trie.
+    vectors -- the levels and next_hops as NumPy arrays sharing their memory, or None without NumPy.
+
+    Methods:
+    lookup -- the next hop of every address in a batch.
+    lookup_one -- the next hop of one address.
+    """
+
+    def __init__(self, routes=()):
+        self.routes = tuple(sorted(routes, key=lambda route: route[1]))
+        self.next_hops = [NO_ROUTE]
+        hop_index = {}
+        first = array('i', [0]) * (1 << LEVEL_BITS[0])
+        second = array('i')
+        third = array('i')
+        for address, length, next_hop in self.routes:
+            leaf = hop_index.get(next_hop)
+            if leaf is None:
+                leaf = hop_index[next_hop] = len(self.next_hops)
+                self.next_hops.append(next_hop)
+            if length <= 16:
+                start, count, level = address >> 16, 1 << (16 - length), first
+            else:
+                base = self.chunk(first, address >> 16, second)
+                if length <= 24:
+                    start, count, level = base + ((address >> 8) & 255), 1 << (24 - length), second
+                else:
+                    base = self.chunk(second, base + ((address >> 8) & 255), third)
+                    start, count, level = base + (address & 255), 1 << (32 - length), third
+            level[start:start + count] = array('i', [leaf]) * count # shorter prefixes come first, so no chunk is overwritten
+        self.levels = (first, second, third)
+        self.vectors = None
+        if numpy is not None:
+            self.vectors = tuple(numpy.frombuffer(level, dtype=numpy.intc) if len(level) else numpy.zeros(1, dtype=numpy.intc) for level in self.levels) + (numpy.array(self.next_hops, dtype=numpy.int64),)
+
+    @staticmethod
+    def chunk(level, index, next_level):
+        """returns the start of the chunk in 'next_level' that entry 'index' of 'level' leads
+        to, adding one filled with the entry's route if there is none yet"""
+        entry = level[index]
+        if entry < 0:
+            return ~entry * CHUNK
+        chunk = len(next_level) // CHUNK
+        next_level.extend(array('i', [entry]) * CHUNK) # addresses not under the longer prefix keep the shorter one's route
+        level[index] = ~chunk
+        return chunk * CHUNK
+
+    def __len__(self):
+        return len(self.routes)
+
+    def lookup_one(self, address):
+        """returns the next hop for 'address', an integer, or NO_ROUTE"""
+        first, second, third = self.levels
+        entry = first[address >> 16]
+        if entry < 0:
+            entry = second[~entry * CHUNK + ((address >> 8) & 255)]
+            if entry < 0:
+                entry = third[~entry * CHUNK + (address & 255)]
+        return self.next_hops[entry]
+
+    def lookup(self, addresses):
+        """returns the next hop (or NO_ROUTE) of every address in 'addresses'. A NumPy array
+        of addresses is looked up with array indexing and gives a NumPy array back, anything
+        else gives a list."""
+        if self.vectors is not None and isinstance(addresses, numpy.ndarray):
+            return self.lookup_vectors(addresses)
+        first, second, third = self.levels
+        next_hops = self.next_hops
+        results = []
+        append = results.append
+        for address in addresses:
+            entry = first[address >> 16]
+            if entry < 0:
+                entry = second[~entry * CHUNK + ((address >> 8) & 255)]
+                if entry < 0:
+                    entry = third[~entry * CHUNK + (address & 255)]
+            append(next_hops[entry])
+        return results
+
+    def lookup_vectors(self, addresses):
+        """lookup for a NumPy array of addresses, each level is read for every address still
+        pointing into it at once"""
+        first, second, third, next_hops = self.vectors
+        addresses = addresses.astype(numpy.int64, copy=False)
+        entries = first[addresses >> 16]
+        deeper = numpy.flatnonzero(entries < 0)
+        if len(deeper):
+            deep_addresses = addresses[deeper]
+            deep_entries = second[(~entries[deeper]).astype(numpy.int64) * CHUNK + ((deep_addresses >> 8) & 255)]
+            deepest = numpy.flatnonzero(deep_entries < 0)
+            if len(deepest):
+                deep_entries[deepest] = third[(~deep_entries[deepest]).astype(numpy.int64) * CHUNK + (deep_addresses[deepest] & 255)]
+            entries[deeper] = deep_entries
+        return next_hops[entries]
+
+
+def parse_address(text):
+    """returns the dotted quad 'text' as an integer"""
+    octets = [int(octet) for octet in text.split(".")]
+    if len(octets) != 4 or not all(0 <= octet <= 255 for octet in octets):
+        raise ValueError("'{}' is not an IPv4 address".format(text))
+    return (octets[0] << 24) | (octets[1] << 16) | (octets[2] << 8) | octets[3]
+
+
+def format_address(address):
+    """returns the integer 'address' as a dotted quad"""
+    return "{}.{}.{}.{}".format(address >> 24, (address >> 16) & 255, (address >> 8) & 255, address & 255)
@@ -1,51 +1,133 @@
 import sys
-from parser import *
-from daemon import *
-from ConfigParser import *
-import time
-
-filename = sys.argv[1]
-config_object2 = read_config(filename)
-daemon = RoutingDaemon(config_object2) # creates routing daemon
-daemon.create_daemon()
+import signal
+import argparse
+import asyncio
+from Parser import *
+from routing_daemon import *
+from async_daemon import *
+
 processing = True
 
-def main():
-    daemon.add_timer(daemon.update_period[0], "{}".format(daemon.router_id), "update", -1)
-    daemon.send_table()
+def parse_args(argv):
+    """reads the command line: one config file, or several when running on asyncio, or a topology file"""
+    arg_parser = argparse.ArgumentParser(description="RIP routing daemon")
+    arg_parser.add_argument("configs", nargs="*", help="router config file(s)")
+    arg_parser.add_argument("--topology", metavar="FILE", help="read every router from one topology file instead of config files")
+    arg_parser.add_argument("--router", type=int, action="append", metavar="ID", help="run only this router from the topology file, may be given more than once")
+    arg_parser.add_argument("--asyncio", action="store_true", help="run on an asyncio event loop, hosting a router for every config file given")
+    arg_parser.add_argument("--vectorized", action="store_true", help="apply large recieved tables with the NumPy kernel (needs NumPy installed)")
+    arg_parser.add_argument("--adaptive-updates", action="store_true", help="jitter every update period, and send keepalives instead of the full table while the routes are stable")
+    arg_parser.add_argument("--metrics-listen", metavar="ADDRESS", help="serve Prometheus metrics on a loopback 'host:port' or a Unix socket path, '{id}' is replaced by the router id")
+    arg_parser.add_argument("--metrics-file", metavar="PATH", help="write Prometheus metrics to this textfile every {} seconds, '{{id}}' is replaced by the router id".format(TEXTFILE_INTERVAL))
+    arg_parser.add_argument("--profile", action="store_true", help="start with profiling on, SIGUSR1 switches it on and off while running")
+    arg_parser.add_argument("--profile-dir", metavar="DIR", default="profiles", help="directory phase times and collapsed stacks are written to")
+    arg_parser.add_argument("--profile-window", type=float, default=PROFILE_WINDOW, help="seconds each cProfile snapshot covers")
+    arg_parser.add_argument("--profile-interval", type=float, default=PROFILE_INTERVAL, help="seconds between the starts of cProfile snapshots")
+    arg_parser.add_argument("--log-level", choices=sorted(LEVELS, key=LEVELS.get), default="info", help="lowest level of event written to the log")
+    arg_parser.add_argument("--log-rate", type=float, default=LOG_RATE, help="events per second the log lets through after a burst")
+    arg_parser.add_argument("--control", metavar="PATH", help="accept control commands (reload, table, metrics, lookup ADDRESS...) on this Unix socket, '{id}' is replaced by the router id")
+    arg_parser.add_argument("--snapshot", metavar="PATH", help="save the routing table here every --snapshot-interval seconds and restore it on start, '{id}' is replaced by the router id")
+    arg_parser.add_argument("--snapshot-interval", type=float, default=SNAPSHOT_INTERVAL, help="seconds between snapshots")
+    arg_parser.add_argument("--capture", metavar="PATH", help="append every datagram recieved to this capture log, for replay.py, '{id}' is replaced by the router id")
+    args = arg_parser.parse_args(argv)
+    if not args.configs and not args.topology:
+        arg_parser.error("give router config files or --topology")
+    if not args.asyncio: # the select loop runs exactly one router
+        if len(args.configs) > 1 or (args.configs and args.topology):
+            arg_parser.error("only one router can run without --asyncio, give one config file")
+        if args.topology and len(set(args.router or ())) != 1:
+            arg_parser.error("--topology without --asyncio needs exactly one --router")
+    return args
+
+def config_source(args, router_id, filename):
+    """returns a function that reads the router's config again, from its file or the topology"""
+    def read_again():
+        if filename is not None:
+            return load_config(filename)
+        for config in load_topology(args.topology):
+            if config.id == router_id:
+                return config
+        raise ConfigError(None, RouterIdError(router_id, "Router Is No Longer In The Topology"))
+    return read_again
+
+def setup_daemon(daemon, args):
+    """applies the command line options to a daemon before it starts"""
+    daemon.vectorized = args.vectorized
+    daemon.adaptive_updates = args.adaptive_updates
+    if args.profile:
+        daemon.start_profiling(args.profile_dir, args.profile_window, args.profile_interval)
+    if args.metrics_listen:
+        MetricsServer(daemon, args.metrics_listen.replace("{id}", str(daemon.router_id))).start()
+    if args.metrics_file:
+        daemon.start_metrics_file(args.metrics_file.replace("{id}", str(daemon.router_id)))
+    if args.snapshot:
+        daemon.start_snapshots(args.snapshot.replace("{id}", str(daemon.router_id)), args.snapshot_interval)
+    if args.capture:
+        daemon.start_capture(args.capture.replace("{id}", str(daemon.router_id)))
+
+def handle_signals(daemons, args):
+    """makes SIGUSR1 switch profiling on or off, SIGUSR2 log the routing table, and SIGHUP
+    reload the config, for every daemon in the process"""
+    def toggle(signum, frame):
+        for daemon in daemons:
+            daemon.toggle_profiling(args.profile_dir, args.profile_window, args.profile_interval)
+    def show_table(signum, frame):
+        for daemon in daemons:
+            daemon.log_routing_table()
+    def reload(signum, frame):
+        for daemon in daemons:
+            daemon.request("reload") # run by the loop, not inside the handler
+    signal.signal(signal.SIGUSR1, toggle)
+    signal.signal(signal.SIGUSR2, show_table)
+    signal.signal(signal.SIGHUP, reload)
+
+def run_select_loop(daemon):
+    """runs a single router with a select loop"""
+    daemon.start_updates()
     while processing:
-        print(daemon.duration_list)
-        have_updated = False
-        if daemon.is_input_available(): #If there is an update from a peer router
-            for recieved in daemon.available:
-                packet, address = recieved.recvfrom(4096)
-                data, router_id = daemon.recieve_table(packet)
-                for dest in set(data.keys()) - {daemon.router_id}:
-                    if data[dest][1] != 16:
-                        daemon.remove_timer("timeout", dest)
-                        daemon.add_timer(daemon.timeout[0], "refreshed timer", "timeout", dest)
-                updated_routes, routes_did_change = daemon.update(data, router_id)
-                for time in daemon.duration_list:
-                    for route in updated_routes:
-                        if time[2] == "garbage" and time[3] == route:
-                            daemon.remove_timer(time[2], time[3])
-                if routes_did_change:
-                    have_updated = True
-            daemon.available = set()
-        if have_updated:
-            # Send triggered update
-           daemon.remove_timer("update", -1)
-           daemon.send_update()
-           daemon.add_timer(daemon.update_period[0], "{}".format(daemon.router_id), "update", -1)   
-        dest_list = daemon.routing_table.keys()
-        for item in daemon.routing_table:
-            if daemon.routing_table[item][0] not in dest_list:
-                daemon.routing_table[item] = (daemon.routing_table[item][0], 16)         
-        daemon.time_event_handler()                     
-        daemon.print_routing_table()
-                
+        changed_routes = daemon.receive_batch(daemon.timers.time_until_next()) # drains every update waiting, or waits for the next timer
+        if changed_routes:
+            daemon.send_update(changed_routes) # Send triggered update
+        daemon.time_event_handler()
+        daemon.run_commands() # reloads and control commands, queued while waiting
+
+def main():
+    args = parse_args(sys.argv[1:])
+    config_objects = [read_config(filename) for filename in args.configs]
+    sources = {config.id: filename for config, filename in zip(config_objects, args.configs)}
+    if args.topology:
+        config_objects += [config for config in read_topology(args.topology) if not args.router or config.id in args.router]
+        missing = set(args.router or ()) - {config.id for config in config_objects}
+        if missing:
+            sys.exit("router {} is not in {}".format(", ".join(str(router_id) for router_id in sorted(missing)), args.topology))
+    EVENT_LOG.level = LEVELS[args.log_level]
+    EVENT_LOG.rate = args.log_rate
+    daemons = []
+    handle_signals(daemons, args)
+    def setup(daemon):
+        setup_daemon(daemon, args)
+        daemon.config_source = config_source(args, daemon.router_id, sources.get(daemon.router_id))
+        if args.control:
+            daemon.control_path = args.control.replace("{id}", str(daemon.router_id))
+        daemons.append(daemon)
+    try:
+        if args.asyncio:
+            asyncio.run(run_routers(config_objects, setup)) # every router shares the one event loop
+            return
+        daemon = RoutingDaemon(config_objects[0]) # creates routing daemon
+        setup(daemon)
+        daemon.create_daemon()
+        if daemon.control_path:
+            daemon.open_control(daemon.control_path)
+        run_select_loop(daemon)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for daemon in daemons: # write out whatever the profilers collected, the capture and the last snapshot
+            daemon.stop_profiling()
+            daemon.stop_capture()
+            if daemon.snapshot_file:
+                daemon.write_snapshot()
+
 if __name__ == "__main__":
     main()
-
-run_rip.py
-Displaying run_rip.py.
@@ -0,0 +1,225 @@
+import os
+import time
+import socket
+import bisect
+import threading
+
+"""Metrics for a RoutingDaemon: counters and histograms kept as plain numbers while the
+daemon runs, turned into Prometheus text format only when something reads them."""
+
+DURATION_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0) # seconds spent in one call
+LATENESS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0) # seconds a timer fired after its deadline
+TEXTFILE_INTERVAL = 15 # seconds between writes of the metrics textfile
+CONTENT_TYPE = "text/plain; version=0.0.4" # Prometheus text exposition format
+
+
+class Histogram(object):
+    """
+    Counts observations into cumulative buckets, as a Prometheus histogram.
+
+    Attributes:
+    buckets -- upper bounds of the buckets, in increasing order
+    counts -- number of observations in each bucket, plus one for those above the last bound
+    total -- sum of every observation
+    count -- number of observations
+
+    Methods:
+    observe -- adds an observation
+    render -- the histogram as Prometheus text lines
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def render(self, name, labels=""):
+        """returns the _bucket, _sum and _count lines, 'labels' being extra label pairs like 'phase="update"'"""
+        separator = "," if labels else ""
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), list(self.counts)):
+            cumulative += count
+            lines.append('{}_bucket{{{}{}le="{}"}} {}'.format(name, labels, separator, "+Inf" if bound == float("inf") else repr(bound), cumulative))
+        braces = "{{{}}}".format(labels) if labels else ""
+        lines.append("{}_sum{} {}".format(name, braces, repr(self.total)))
+        lines.append("{}_count{} {}".format(name, braces, self.count))
+        return lines
+
+
+class Metrics(object):
+    """
+    Instrumentation of one RoutingDaemon. The daemon only ever adds to these numbers;
+    route counts, churn and the daemon's own stats dictionaries are read from the daemon
+    when the metrics are rendered, so they cost nothing while nobody is reading.
+
+    Attributes:
+    packets_in -- dictionary of sending router id -> packets recieved from it
+    bytes_in -- dictionary of sending router id -> bytes recieved from it
+    packets_out -- dictionary of output port -> packets sent to it
+    bytes_out -- dictionary of output port -> bytes sent to it
+    phases -- dictionary of daemon method name -> Histogram of the seconds spent in each call
+    timer_lateness -- Histogram of how late timers fired after their deadline
+    started -- time the metrics were created, for the process uptime
+
+    Methods:
+    observe_phase -- records the time spent in one call of a daemon method
+    packet_in -- counts a packet recieved from a router
+    packet_out -- counts a packet sent to a port
+    render -- every metric of a daemon in Prometheus text format
+    """
+
+    def __init__(self):
+        self.packets_in = {}
+        self.bytes_in = {}
+        self.packets_out = {}
+        self.bytes_out = {}
+        self.phases = {name: Histogram(DURATION_BUCKETS) for name in ("recieve_table", "update", "serialize")}
+        self.timer_lateness = Histogram(LATENESS_BUCKETS)
+        self.started = time.time()
+
+    def observe_phase(self, name, started):
+        """records a call of 'name' that began at perf_counter() time 'started'"""
+        self.phases[name].observe(time.perf_counter() - started)
+
+    def packet_in(self, router_id, size):
+        self.packets_in[router_id] = self.packets_in.get(router_id, 0) + 1
+        self.bytes_in[router_id] = self.bytes_in.get(router_id, 0) + size
+
+    def packet_out(self, port, size):
+        self.packets_out[port] = self.packets_out.get(port, 0) + 1
+        self.bytes_out[port] = self.bytes_out.get(port, 0) + size
+
+    def render(self, daemon):
+        """returns every metric of 'daemon' as Prometheus text. Safe to call from another
+        thread: the dictionaries are copied before they are read."""
+        router = 'router="{}"'.format(daemon.router_id)
+        neighbour_of = {output.port: output.id for output in daemon.output_ports}
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+
+        def per_neighbour(name, help_text, values, by_port=False):
+            family(name, "counter", help_text)
+            for key, value in sorted(dict(values).items()):
+                neighbour = neighbour_of.get(key, "unknown") if by_port else key
+                lines.append('{}{{{},neighbour="{}"}} {}'.format(name, router, neighbour, value))
+
+        per_neighbour("rip_packets_received_total", "Packets recieved from each neighbour.", self.packets_in)
+        per_neighbour("rip_bytes_received_total", "Bytes recieved from each neighbour.", self.bytes_in)
+        per_neighbour("rip_packets_sent_total", "Packets sent to each neighbour.", self.packets_out, by_port=True)
+        per_neighbour("rip_bytes_sent_total", "Bytes sent to each neighbour.", self.bytes_out, by_port=True)
+        family("rip_datagrams_total", "counter", "Datagrams read from the input sockets, and those dropped, by reason.")
+        for reason, value in sorted(dict(daemon.drop_stats).items()):
+            name = "received" if reason == "received" else "dropped_" + reason
+            lines.append('rip_datagrams_total{{{},result="{}"}} {}'.format(router, name, value))
+        family("rip_decode_failures_total", "counter", "Datagrams that could not be decoded into a packet.")
+        lines.append("rip_decode_failures_total{{{}}} {}".format(router, daemon.drop_stats["malformed"]))
+        family("rip_triggered_updates_total", "counter", "Triggered updates sent, coalesced into a hold-down, or suppressed.")
+        for outcome in ("sent", "coalesced", "suppressed"):
+            lines.append('rip_triggered_updates_total{{{},outcome="{}"}} {}'.format(router, outcome, daemon.trigger_stats[outcome]))
+        family("rip_periodic_updates_total", "counter", "Periodic updates sent, as full tables or as keepalives.")
+        for kind, value in sorted(dict(daemon.update_stats).items()):
+            lines.append('rip_periodic_updates_total{{{},kind="{}"}} {}'.format(router, kind.rstrip("s"), value))
+        family("rip_update_stretch", "gauge", "Update periods from one full table to the next.")
+        lines.append("rip_update_stretch{{{}}} {}".format(router, daemon.update_stretch))
+        family("rip_table_cache_total", "counter", "Full table sends served from the per-neighbour cache, and rebuilt.")
+        for outcome, value in sorted(dict(daemon.cache_stats).items()):
+            lines.append('rip_table_cache_total{{{},outcome="{}"}} {}'.format(router, outcome, value))
+        family("rip_phase_seconds", "histogram", "Seconds spent in each call of the daemon's decode, compute and encode methods.")
+        for name, histogram in sorted(self.phases.items()):
+            lines += histogram.render("rip_phase_seconds", '{},phase="{}"'.format(router, name))
+        family("rip_timer_lateness_seconds", "histogram", "Seconds timers fired after their deadline.")
+        lines += self.timer_lateness.render("rip_timer_lateness_seconds", router)
+        family("rip_routes", "gauge", "Routes in the routing table, including the router itself.")
+        lines.append("rip_routes{{{}}} {}".format(router, len(daemon.routing_table)))
+        family("rip_route_changes_total", "counter", "Routes added, changed or removed since the daemon started.")
+        lines.append("rip_route_changes_total{{{}}} {}".format(router, daemon.routing_table.version))
+        family("rip_send_queue_length", "gauge", "Datagrams waiting for the pacing timer.")
+        lines.append("rip_send_queue_length{{{}}} {}".format(router, len(daemon.send_queue)))
+        family("rip_start_time_seconds", "gauge", "Unix time the daemon started.")
+        lines.append("rip_start_time_seconds{{{}}} {}".format(router, repr(self.started)))
+        return "\n".join(lines) + "\n"
+
+
+def write_textfile(daemon, path):
+    """writes the daemon's metrics to 'path' for a node exporter textfile collector. The file
+    is written under a temporary name and renamed, so a reader never sees half of it."""
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "w") as textfile:
+        textfile.write(daemon.metrics.render(daemon))
+    os.replace(temporary, path)
+
+
+class MetricsServer(object):
+    """
+    Serves a daemon's metrics from a background thread, on a loopback TCP port or a Unix
+    socket. Every connection gets the metrics in Prometheus text format behind a minimal
+    HTTP response, so both a Prometheus scrape and 'curl' or 'nc' can read them. The
+    metrics are only rendered when a connection comes in.
+
+    Attributes:
+    daemon -- the RoutingDaemon whose metrics are served
+    address -- "host:port" (or just a port) for TCP, or a filesystem path for a Unix socket
+    listener -- the listening socket
+    thread -- the daemon thread accepting connections
+
+    Methods:
+    start -- opens the listening socket and starts serving
+    stop -- closes the listening socket
+    """
+
+    def __init__(self, daemon, address):
+        self.daemon = daemon
+        self.address = address
+        self.listener = None
+        self.thread = None
+
+    def start(self):
+        if "/" in self.address: # a path, serve on a Unix socket
+            if os.path.exists(self.address):
+                os.unlink(self.address) # left behind by an earlier run
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(self.address)
+        else:
+            host, _, port = self.address.rpartition(":")
+            self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.listener.bind((host or "127.0.0.1", int(port)))
+        self.listener.listen(8)
+        self.thread = threading.Thread(target=self.serve, name="metrics-{}".format(self.daemon.router_id), daemon=True)
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                connection, _ = self.listener.accept()
+            except OSError: # the listener was closed
+                return
+            try:
+                connection.settimeout(1.0)
+                try:
+                    connection.recv(4096) # the request, whatever it is, gets the metrics
+                except socket.timeout:
+                    pass
+                body = self.daemon.metrics.render(self.daemon).encode()
+                header = "HTTP/1.0 200 OK\r\nContent-Type: {}\r\nContent-Length: {}\r\n\r\n".format(CONTENT_TYPE, len(body))
+                connection.sendall(header.encode() + body)
+            except OSError: # the reader went away
+                pass
+            finally:
+                connection.close()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.close()
+            if "/" in self.address and os.path.exists(self.address):
+                os.unlink(self.address)
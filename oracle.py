@@ -0,0 +1,299 @@
+import sys
+import time
+import argparse
+from routing_table import *
+from simulator import *
+try:
+   import numpy # optional, without it the reference is computed and checked one router at a time
+except ImportError:
+   numpy = None
+
+"""Shortest path oracle: computes, from the routers' configs alone, the cost every router's
+routing table should converge to, and diffs the tables the daemons actually hold against it.
+
+The graph is the routers' outputs: router u reaches neighbour v at the metric of u's output
+to v. Dead routers and links that are down are left out. Costs are capped at INFINITY, as
+RIP counts anything that far as unreachable. A route is correct when its cost is the
+reference cost and its next hop is a neighbour on a shortest path, so where there are
+several equally short paths any of them is accepted.
+
+Every source runs Dial's algorithm, a Dijkstra over a bucket per cost below INFINITY. With
+NumPy, BLOCK sources run it together on bit sets, one bit per source, so each step covers
+the whole block with a few array operations; without NumPy each source runs it alone.
+
+Usage: python oracle.py [--sizes 1000 3000] [--topologies random] [--simulate]
+"""
+
+BLOCK = 1024 # sources worked through together, a step reads BLOCK / 8 bytes per link
+TOPOLOGIES = {
+    "ring": lambda size, metrics, seed: ring_topology(size, metrics, seed),
+    "grid": lambda size, metrics, seed: grid_topology(int(size ** 0.5), int(size ** 0.5), metrics, seed),
+    "random": lambda size, metrics, seed: random_topology(size, 4, metrics, seed),
+    "scale_free": lambda size, metrics, seed: scale_free_topology(size, 2, metrics, seed),
+}
+
+
+def graph(config_objects, dead=(), down_links=()):
+    """returns (ids, links): the sorted ids of the live routers, and a list of (router,
+    neighbour, metric) for every output between two live routers over a link that is up.
+    'down_links' holds (router a, router b) pairs, down in both directions."""
+    down = set(down_links)
+    ids = sorted(config_object.id for config_object in config_objects if config_object.id not in dead)
+    live = set(ids)
+    links = []
+    for config_object in config_objects:
+        if config_object.id not in live:
+            continue
+        for output in config_object.outputs:
+            if output.id in live and (config_object.id, output.id) not in down and (output.id, config_object.id) not in down:
+                links.append((config_object.id, output.id, output.metric))
+    return ids, links
+
+
+class Reference(object):
+    """
+    The cost from every live router to every other, computed from their configs.
+
+    Attributes:
+    ids -- sorted list of the live router ids
+    index -- dictionary of router id -> its row and column in costs
+    links -- dictionary of router id -> dictionary of neighbour id -> link metric
+    costs -- ids x ids costs, INFINITY where there is no path: a NumPy uint8 matrix, or a list of bytearray rows without NumPy
+
+    Methods:
+    cost -- the reference cost from one router to another
+    diff -- the routes of one router's table that do not match the reference
+    """
+
+    def __init__(self, config_objects, dead=(), down_links=()):
+        self.ids, links = graph(config_objects, dead, down_links)
+        self.index = {router_id: position for position, router_id in enumerate(self.ids)}
+        self.links = {router_id: {} for router_id in self.ids}
+        for router_id, neighbour, metric in links:
+            self.links[router_id][neighbour] = metric
+        if numpy is not None:
+            self.costs = self.relax_blocks(links)
+        else:
+            self.costs = [self.dial(router_id) for router_id in self.ids]
+
+    def relax_blocks(self, links):
+        """the cost matrix, computed BLOCK sources at a time by Dial's algorithm run on bit
+        sets. For every cost c from 1 up, the routers first reached at cost c from each
+        source are those with a link of metric m from a router first reached at cost c - m,
+        less those already reached. A block keeps one bit per source for every router at
+        every cost, so a step is a gather and an OR over BLOCK / 8 bytes per link."""
+        count = len(self.ids)
+        costs = numpy.empty((count, count), dtype=numpy.uint8)
+        by_metric = [] # (metric, from rows, to rows, reduceat starts, target rows) per metric, links grouped by the router they lead to
+        for metric in sorted(set(metric for _, _, metric in links if metric < INFINITY)):
+            pairs = sorted((self.index[neighbour], self.index[router_id]) for router_id, neighbour, link_metric in links if link_metric == metric)
+            tos = numpy.array([to for to, _ in pairs], dtype=numpy.intp)
+            starts = numpy.flatnonzero(numpy.r_[True, tos[1:] != tos[:-1]])
+            by_metric.append((metric, numpy.array([from_ for _, from_ in pairs], dtype=numpy.intp), starts, tos[starts]))
+        longest = max([metric for metric, _, _, _ in by_metric] or [1])
+        for first in range(0, count, BLOCK):
+            sources = numpy.arange(first, min(first + BLOCK, count))
+            columns = numpy.arange(len(sources))
+            block = numpy.full((count, len(sources)), INFINITY, dtype=numpy.uint8) # a row per router, a column per source
+            block[sources, columns] = 0
+            levels = [numpy.packbits(block == 0, axis=1, bitorder="little")] # levels[c] -- bits of the routers first reached at cost c
+            reached = levels[0].copy()
+            empty = 0 # costs in a row at which nothing new was reached
+            for cost in range(1, INFINITY):
+                level = numpy.zeros_like(reached)
+                for metric, froms, starts, targets in by_metric:
+                    if metric > cost:
+                        break
+                    level[targets] |= numpy.bitwise_or.reduceat(levels[cost - metric][froms], starts, axis=0)
+                level &= ~reached
+                levels.append(level)
+                if not level.any():
+                    empty += 1
+                    if empty >= longest: # no link is long enough to reach past the gap
+                        break
+                    continue
+                empty = 0
+                reached |= level
+                block[numpy.unpackbits(level, axis=1, count=len(sources), bitorder="little").view(bool)] = cost
+            costs[first:first + len(sources)] = block.T
+        return costs
+
+    def dial(self, source):
+        """the row of costs from 'source', by Dial's algorithm: a bucket per cost below
+        INFINITY, worked through in order"""
+        row = bytearray([INFINITY]) * len(self.ids)
+        row[self.index[source]] = 0
+        buckets = [[] for _ in range(INFINITY)]
+        buckets[0].append(source)
+        for cost in range(INFINITY):
+            for router_id in buckets[cost]:
+                if row[self.index[router_id]] != cost: # reached more cheaply since it was queued
+                    continue
+                for neighbour, metric in self.links[router_id].items():
+                    through = cost + metric
+                    position = self.index[neighbour]
+                    if through < row[position]:
+                        row[position] = through
+                        buckets[through].append(neighbour)
+        return row
+
+    def cost(self, source, dest):
+        """the reference cost from router 'source' to router 'dest', INFINITY if unreachable"""
+        return int(self.costs[self.index[source]][self.index[dest]])
+
+    def diff(self, router_id, table):
+        """returns (router id, destination, reference cost, route, problem) for every route of
+        'table', router_id's routing table (a RoutingTable or a dictionary of destination ->
+        (next hop, cost)), that is wrong, and for every reachable router missing from it.
+        'route' is the (next hop, cost) in the table or None, and 'problem' is one of
+        "missing", "unreachable", "cost", "next hop" or "unknown" (a destination that is not
+        a live router)."""
+        if numpy is not None:
+            return self.diff_vectors(router_id, table)
+        row = self.costs[self.index[router_id]]
+        mismatches = []
+        seen = set()
+        for dest, (next_hop, cost) in table.items():
+            seen.add(dest)
+            if dest not in self.index:
+                if cost < INFINITY:
+                    mismatches.append((router_id, dest, INFINITY, (next_hop, cost), "unknown"))
+                continue
+            expected = row[self.index[dest]]
+            problem = self.check(router_id, dest, next_hop, min(cost, INFINITY), expected)
+            if problem:
+                mismatches.append((router_id, dest, expected, (next_hop, cost), problem))
+        for dest, position in self.index.items():
+            if dest not in seen and row[position] < INFINITY:
+                mismatches.append((router_id, dest, row[position], None, "missing"))
+        return mismatches
+
+    def check(self, router_id, dest, next_hop, cost, expected):
+        """the problem with one route, or None if it is right"""
+        if cost != expected:
+            if cost >= INFINITY:
+                return "missing"
+            return "unreachable" if expected >= INFINITY else "cost"
+        if cost >= INFINITY or dest == router_id:
+            return None
+        link = self.links[router_id].get(next_hop)
+        if link is None or link + self.costs[self.index[next_hop]][self.index[dest]] != expected:
+            return "next hop"
+        return None
+
+    def diff_vectors(self, router_id, table):
+        """diff, comparing the whole row at once"""
+        ids = numpy.array(self.ids, dtype=numpy.int64)
+        dests, next_hops, metrics = table_arrays(table)
+        columns = numpy.minimum(numpy.searchsorted(ids, dests), len(ids) - 1)
+        known = ids[columns] == dests
+        mismatches = [(router_id, int(dest), INFINITY, (int(next_hop), int(cost)), "unknown")
+                      for dest, next_hop, cost in zip(dests[~known], next_hops[~known], metrics[~known]) if cost < INFINITY]
+        columns, next_hops = columns[known], next_hops[known]
+        actual = numpy.full(len(ids), INFINITY, dtype=numpy.int64)
+        actual[columns] = numpy.minimum(metrics[known], INFINITY)
+        hops = numpy.full(len(ids), -1, dtype=numpy.int64)
+        hops[columns] = next_hops
+        recorded = numpy.full(len(ids), INFINITY, dtype=numpy.int64) # the costs as the table has them, for the report
+        recorded[columns] = metrics[known]
+        expected = self.costs[self.index[router_id]].astype(numpy.int64)
+
+        link_costs = numpy.full(len(ids), 2 * INFINITY, dtype=numpy.int64) # not a neighbour, never on a shortest path
+        for neighbour, metric in self.links[router_id].items():
+            link_costs[self.index[neighbour]] = metric
+        hop_columns = numpy.minimum(numpy.searchsorted(ids, hops), len(ids) - 1)
+        hop_known = ids[hop_columns] == hops
+        through = numpy.where(hop_known, link_costs[hop_columns] + self.costs[hop_columns, numpy.arange(len(ids))], 2 * INFINITY)
+        wrong_hop = (actual == expected) & (expected < INFINITY) & (through != expected)
+        wrong_hop[self.index[router_id]] = False
+        for position in numpy.flatnonzero((actual != expected) | wrong_hop):
+            cost, reference = int(actual[position]), int(expected[position])
+            route = None if hops[position] < 0 else (int(hops[position]), int(recorded[position]))
+            if cost == reference:
+                problem = "next hop"
+            elif cost >= INFINITY:
+                problem = "missing"
+            else:
+                problem = "unreachable" if reference >= INFINITY else "cost"
+            mismatches.append((router_id, self.ids[position], reference, route, problem))
+        return mismatches
+
+
+def table_arrays(table):
+    """returns NumPy arrays of the destinations, next hops and costs in 'table', read
+    straight from a RoutingTable's slot arrays, or from a dictionary's items"""
+    if isinstance(table, RoutingTable):
+        used = (numpy.frombuffer(table.flags, dtype=numpy.uint8) & USED).astype(bool)
+        return tuple(numpy.frombuffer(values, dtype=numpy.intc)[used].astype(numpy.int64) for values in (table.ids, table.next_hops, table.metrics))
+    routes = list(table.items())
+    dests = numpy.fromiter((dest for dest, _ in routes), dtype=numpy.int64, count=len(routes))
+    next_hops = numpy.fromiter((route[0] for _, route in routes), dtype=numpy.int64, count=len(routes))
+    metrics = numpy.fromiter((route[1] for _, route in routes), dtype=numpy.int64, count=len(routes))
+    return dests, next_hops, metrics
+
+
+def verify(config_objects, routing_tables, dead=(), down_links=()):
+    """diffs every table in 'routing_tables', a dictionary of router id -> routing table,
+    against the reference for 'config_objects'. Returns every mismatch (see Reference.diff)."""
+    reference = Reference(config_objects, dead, down_links)
+    mismatches = []
+    for router_id, table in sorted(routing_tables.items()):
+        if router_id in reference.index:
+            mismatches += reference.diff(router_id, table)
+    return mismatches
+
+
+def verify_simulation(simulation):
+    """verifies every live router of a Simulation, against the links and routers that are up now"""
+    down_links = [key for key, (_, _, up) in simulation.network.links.items() if not up]
+    tables = {router_id: daemon.routing_table for router_id, daemon in simulation.daemons.items() if router_id not in simulation.dead}
+    return verify(list(simulation.config_objects.values()), tables, simulation.dead, down_links)
+
+
+def format_mismatch(mismatch):
+    router_id, dest, expected, route, problem = mismatch
+    return "router {} to {}: {}, reference cost {}, table has {}".format(router_id, dest, problem, expected,
+                                                                          "no route" if route is None else "via {}, cost {}".format(*route))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Verify converged routing tables against shortest paths")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 3000], help="numbers of routers")
+    arg_parser.add_argument("--topologies", nargs="+", default=["random"], choices=sorted(TOPOLOGIES))
+    arg_parser.add_argument("--metrics", type=int, nargs=2, default=[1, 4], metavar=("LOW", "HIGH"), help="range link metrics are drawn from")
+    arg_parser.add_argument("--simulate", action="store_true", help="run the routers on the simulator to convergence and verify their tables, not only time the reference")
+    arg_parser.add_argument("--period", type=int, default=30, help="update period of the simulated routers")
+    arg_parser.add_argument("--seed", type=int, default=1)
+    args = arg_parser.parse_args()
+    EVENT_LOG.level = WARNING # every router would log its route changes
+    if numpy is None:
+        print("NumPy is not installed, using Dial's algorithm for every router")
+
+    print('|{:>11} |{:>8} |{:>8} |{:>15} |{:>12} |{:>12} |'.format('Topology', 'Routers', 'Links', 'Reference (s)', 'Verify (s)', 'Mismatches'))
+    print("-" * 79)
+    failed = False
+    for topology in args.topologies:
+        for size in args.sizes:
+            config_objects = build_configs(TOPOLOGIES[topology](size, tuple(args.metrics), args.seed), args.period)
+            started = time.perf_counter()
+            reference = Reference(config_objects)
+            reference_time = time.perf_counter() - started
+            verify_time, mismatches = "-", "-"
+            if args.simulate:
+                sim = Simulation(config_objects, seed=args.seed)
+                sim.start()
+                sim.run_until_converged(2 * args.period, 100 * args.period)
+                started = time.perf_counter()
+                found = verify_simulation(sim)
+                verify_time, mismatches = "{:.3f}".format(time.perf_counter() - started), len(found)
+                for mismatch in found[:10]:
+                    print(format_mismatch(mismatch))
+                failed = failed or bool(found)
+            print('|{:>11} |{:>8} |{:>8} |{:>15.3f} |{:>12} |{:>12} |'.format(topology, size, sum(len(links) for links in reference.links.values()) // 2,
+                                                                              reference_time, verify_time, mismatches))
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
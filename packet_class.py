@@ -1,42 +1,151 @@
 import json
+import struct
+
+HEADER = struct.Struct("!BBH")
+# command, version, sending router id (RFC 2453 puts a must-be-zero field here, we carry the router id in it, or 0 if it needs a ROUTER_ID_TAG entry).
+ENTRY = struct.Struct("!HHIIII")
+# address family, route tag, address (the destination router id), subnet mask, next hop, metric. 20 bytes as in RFC 2453.
+REQUEST = 1
+RESPONSE = 2
+# RFC 2453 commands: a request asks the reciever for its whole table, a response carries routes.
+AF_INET = 2
+# RFC 2453 address family identifier for IP.
+PREFIX_TAG = 1
+# Route tag of an entry carrying a network prefix: address and subnet mask are the prefix, next hop is the router it is attached to.
+ROUTER_ID_TAG = 2
+# Route tag of a leading entry carrying the sending router id when it does not fit the header's 16 bits (the header then has 0).
+KEEPALIVE_TAG = 3
+# Route tag of the one entry of a keepalive, a response that only says the sender is up and its routes unchanged.
+HEADER_ID_LIMIT = 0xFFFF
+# Largest router id carried in the header itself.
+ID_LIMIT = 1 << 31
+# Router ids are 0 < id < ID_LIMIT, as the routing table stores them as signed 32 bit integers.
+MAX_METRIC = 16
+# Largest metric an entry can carry, RIP's infinity.
+FORMATS = ("json", "binary")
+# Wire formats a daemon can send, both are always accepted on receive.
+
+
+class PacketError(ValueError):
+    # Raised when a datagram cannot be decoded into a Packet.
+    pass
+
+
 class Packet(object):
     # Packet structure for use in all transmissions.
-    
-    def __init__ (self, command=None, version=None, rid=None, entries=None):
-        self.command = 2
-        # This should always be 2 for respabs(onse packets (which is all we will be using).
+
+    def __init__ (self, command=None, version=None, rid=None, entries=None, prefixes=None, keepalive=False):
+        self.command = RESPONSE if command is None else command
+        # 2 for response packets, 1 for a request for the whole table.
         self.version = 2
         # This is always 2.
         self.rid = rid
-        # This will be the routers id number. 
+        # This will be the routers id number.
         self.entries = entries
         #this is a list of rip entries (see class below).
-        
-        
-    def to_bytes (self):
+        self.prefixes = prefixes if prefixes is not None else []
+        #this is a list of prefix entries (see class below), sent after the rip entries.
+        self.keepalive = keepalive
+        # True for a keepalive, which carries no entries.
+
+
+    def to_bytes (self, packet_format="json"):
+        #Translates the Packet class into bytes in the given wire format.
+        if packet_format == "binary":
+            return self.to_binary()
+        return self.to_json()
+
+    def to_json (self):
         #Translates the Packet class into a dict that JSON can turn into bytes.
-        new_entries = []
+        new_entries = [entry.to_bytes2() for entry in self.entries]
+        packet_dict = {'command': self.command, 'version': self.version, 'rid': self.rid, 'entries': new_entries}
+        if self.prefixes: # left out when empty, as routers without prefixes always sent it
+            packet_dict['prefixes'] = [entry.to_bytes2() for entry in self.prefixes]
+        if self.keepalive:
+            packet_dict['keepalive'] = True
+        return json.dumps(packet_dict).encode()
+
+    def to_binary (self):
+        #Translates the Packet class into a 4 byte header followed by a 20 byte record per entry.
+        wide_id = self.rid > HEADER_ID_LIMIT # sent in a leading entry instead
+        data = bytearray(HEADER.size + ENTRY.size * (len(self.entries) + len(self.prefixes) + wide_id + self.keepalive))
+        HEADER.pack_into(data, 0, self.command, self.version, 0 if wide_id else self.rid)
+        offset = HEADER.size
+        if wide_id:
+            ENTRY.pack_into(data, offset, AF_INET, ROUTER_ID_TAG, self.rid, 0, 0, 0)
+            offset += ENTRY.size
+        if self.keepalive:
+            ENTRY.pack_into(data, offset, AF_INET, KEEPALIVE_TAG, 0, 0, 0, 0)
+            offset += ENTRY.size
         for entry in self.entries:
-            new_entry = entry.to_bytes2()        
-            new_entries.append(new_entry)
-        self.entries = new_entries
-        return json.dumps(self.__dict__)
-    
-    @classmethod     
+            ENTRY.pack_into(data, offset, AF_INET, 0, entry.router_id, 0, 0, entry.metric)
+            offset += ENTRY.size
+        for entry in self.prefixes:
+            ENTRY.pack_into(data, offset, AF_INET, PREFIX_TAG, entry.prefix, prefix_mask(entry.length), entry.origin, entry.metric)
+            offset += ENTRY.size
+        return bytes(data)
+
+    @classmethod
     def from_bytes (cls, mydict):
-        # Translates bytes into a Packet object.
-        new_data = json.loads(mydict)
-        table_entries = []
-        for entry in new_data['entries']:
-            entry = json.loads(entry)
-            table_entry = RipEntry(entry['abs(addr_identifier'],entry['router_id'],entry['metric'])
-            table_entries.append(table_entry)
-        command = new_data['command']
-        version = new_data['version']
-        rid = new_data['rid']
-        return cls(command,version,rid,table_entries)                        
-        
-        
+        # Translates bytes in either wire format into a Packet object. JSON packets always start with '{'.
+        if isinstance(mydict, str):
+            return cls.from_json(mydict)
+        if mydict[:1] == b"{":
+            return cls.from_json(bytes(mydict)) # json cannot read a memoryview
+        return cls.from_binary(mydict)
+
+    @classmethod
+    def from_json (cls, mydict):
+        # Translates JSON bytes into a Packet object.
+        try:
+            new_data = json.loads(mydict)
+            table_entries = []
+            for entry in new_data['entries']:
+                entry = json.loads(entry)
+                table_entry = RipEntry(entry['addr_identifier'],entry['router_id'],entry['metric'])
+                table_entries.append(table_entry)
+            prefix_entries = []
+            for entry in new_data.get('prefixes', ()):
+                entry = json.loads(entry)
+                prefix_entries.append(PrefixEntry(entry['addr_identifier'], entry['prefix'], entry['length'], entry['origin'], entry['metric']))
+            command = new_data['command']
+            version = new_data['version']
+            rid = new_data['rid']
+            keepalive = new_data.get('keepalive', False) is True
+        except (ValueError, KeyError, TypeError) as error:
+            raise PacketError("Malformed JSON packet: {}".format(error))
+        check_entries(rid, table_entries, prefix_entries)
+        return cls(command,version,rid,table_entries,prefix_entries,keepalive)
+
+    @classmethod
+    def from_binary (cls, data):
+        # Translates binary bytes into a Packet object, unpacking straight out of the buffer.
+        view = memoryview(data)
+        if len(view) < HEADER.size or (len(view) - HEADER.size) % ENTRY.size:
+            raise PacketError("Malformed binary packet of {} bytes".format(len(view)))
+        command, version, rid = HEADER.unpack_from(view)
+        records = list(ENTRY.iter_unpack(view[HEADER.size:]))
+        if rid == 0 and records and records[0][1] == ROUTER_ID_TAG: # a router id too large for the header
+            rid = records.pop(0)[2]
+        keepalive = len(records) == 1 and records[0][1] == KEEPALIVE_TAG
+        if keepalive:
+            records = []
+        table_entries = [RipEntry('AF_INET', router_id, metric) for _, tag, router_id, _, _, metric in records if tag != PREFIX_TAG]
+        prefix_entries = []
+        if len(table_entries) != len(records): # only look for prefixes in a packet that has some
+            for _, tag, prefix, mask, origin, metric in records:
+                if tag == PREFIX_TAG:
+                    prefix_entries.append(PrefixEntry('AF_INET', prefix, mask_length(mask), origin, metric))
+            check_entries(rid, table_entries, prefix_entries)
+        else: # only routes, every field is already an integer so only the ranges need checking
+            if not 0 < rid < ID_LIMIT:
+                raise PacketError("Invalid sending router id {}".format(rid))
+            for record in records:
+                if not 0 < record[2] < ID_LIMIT or record[5] > MAX_METRIC:
+                    raise PacketError("Invalid entry for router {} with metric {}".format(record[2], record[5]))
+        return cls(command,version,rid,table_entries,prefix_entries,keepalive)
+
+
 class RipEntry():
     # Structure of routing entires
     def __init__(self, addr_identifier, router_id, metric):
@@ -46,10 +155,60 @@ class RipEntry():
         # Router id of router described in entry
         self.metric = metric
         # metric of entry.
-        
+
     def to_bytes2 (self):
         #Translates a RipEntry object into a dict that JSON can turn into bytes.
         return json.dumps(self.__dict__)
 
-Packets.py
-Displaying Packets.py.
+
+class PrefixEntry():
+    # Structure of prefix entries, a network prefix and the router attached to it
+    def __init__(self, addr_identifier, prefix, length, origin, metric):
+        self.addr_identifier = addr_identifier
+        #This will be AF_INET
+        self.prefix = prefix
+        # Network address of the prefix, as an integer
+        self.length = length
+        # Prefix length in bits
+        self.origin = origin
+        # Router id of the router the prefix is attached to
+        self.metric = metric
+        # metric of the route to the origin router.
+
+    def to_bytes2 (self):
+        #Translates a PrefixEntry object into a dict that JSON can turn into bytes.
+        return json.dumps(self.__dict__)
+
+
+def valid_id(rid):
+    # True if 'rid' is an integer the routing table can store as a router id.
+    return type(rid) is int and 0 < rid < ID_LIMIT
+
+def valid_metric(metric):
+    # True if 'metric' is an integer from 0 to MAX_METRIC.
+    return type(metric) is int and 0 <= metric <= MAX_METRIC
+
+def check_entries(rid, table_entries, prefix_entries):
+    # Raises PacketError unless the sender, every destination and origin is a valid router id,
+    # every metric is valid, and every prefix is an IPv4 prefix. The routing table and the
+    # engine trust what they are given, so a decoded packet must be safe to hand them.
+    if not valid_id(rid):
+        raise PacketError("Invalid sending router id {!r}".format(rid))
+    for entry in table_entries:
+        if not valid_id(entry.router_id) or not valid_metric(entry.metric):
+            raise PacketError("Invalid entry for router {!r} with metric {!r}".format(entry.router_id, entry.metric))
+    for entry in prefix_entries:
+        valid_prefix = type(entry.prefix) is int and 0 <= entry.prefix <= 0xFFFFFFFF and type(entry.length) is int and 0 <= entry.length <= 32
+        if not valid_prefix or not valid_id(entry.origin) or not valid_metric(entry.metric):
+            raise PacketError("Invalid prefix entry {!r}/{!r} for router {!r}".format(entry.prefix, entry.length, entry.origin))
+
+def prefix_mask(length):
+    # Subnet mask of a prefix 'length' bits long, as an integer.
+    return (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+
+def mask_length(mask):
+    # Prefix length of a subnet mask, raising PacketError if its bits are not contiguous.
+    length = bin(mask).count("1")
+    if mask != prefix_mask(length):
+        raise PacketError("Subnet mask {:#010x} is not contiguous".format(mask))
+    return length
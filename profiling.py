@@ -0,0 +1,213 @@
+import os
+import time
+import cProfile
+import pstats
+
+"""Profiling for a RoutingDaemon: timed spans around each phase of the main loop, and
+cProfile snapshots taken over a short window every so often, written as collapsed stacks
+that flamegraph.pl, speedscope or inferno can draw."""
+
+PROFILE_WINDOW = 10 # seconds each cProfile snapshot covers
+PROFILE_INTERVAL = 60 # seconds from the start of one snapshot to the start of the next
+MAX_STACK_DEPTH = 64 # callers followed up from a function when rebuilding its stacks
+MIN_STACK_WEIGHT = 1 # microseconds below which a stack is left out of the collapsed output
+
+
+class NullSpan(object):
+    # Span that does nothing, handed out while profiling is off.
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class NullProfiler(object):
+    # Profiler used while profiling is off. span() costs one method call and records nothing.
+    enabled = False
+
+    def span(self, name):
+        return NULL_SPAN
+
+    def close(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Span(object):
+    """Times one phase of the daemon for a Profiler. There is one Span per phase name,
+    reused for every call, so starting a span allocates nothing."""
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.stack.append([self.name, self.profiler.clock(), 0])
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.end_span()
+        return False
+
+
+class Profiler(object):
+    """
+    Times the phases of a daemon and takes sampled cProfile snapshots.
+
+    Every phase keeps a count of calls, its inclusive time, and its self time, which leaves
+    out any phase nested inside it (a triggered update sent while handling a timer counts
+    as "send", not "timers"). A phase nested inside itself is only counted once.
+
+    Every interval seconds cProfile runs for window seconds. When a window ends, its stacks
+    are written to '<prefix>-<n>.collapsed' in the output directory, one "caller;...;function
+    microseconds" line per stack, and the phase times so far to '<prefix>-phases.txt'.
+    cProfile only records who called each function, not the whole stack, so the stacks are
+    rebuilt by sharing each function's time among its callers in proportion to the time
+    spent in the calls from each. Windows start and end between top level phases, and only
+    one cProfile can run in a process at a time, so when several routers share a process a
+    router whose window would overlap another's skips it.
+
+    Attributes:
+    directory -- directory the snapshots and phase times are written to
+    prefix -- start of every file name written
+    window -- seconds each cProfile snapshot covers
+    interval -- seconds between the starts of two snapshots
+    clock -- nanosecond clock the spans are timed with
+    totals -- dictionary of phase name -> [calls, inclusive ns, self ns]
+    stack -- [name, start ns, ns spent in nested phases] of each phase currently running
+    spans -- dictionary of phase name -> its reusable Span
+    profile -- the cProfile.Profile running now, or None
+    window_ends -- clock time the running snapshot ends
+    next_window -- clock time the next snapshot starts
+    snapshots -- number of snapshots written
+
+    Methods:
+    span -- the context manager that times a phase
+    end_span -- finishes the innermost running phase
+    start_window -- starts a cProfile snapshot
+    end_window -- stops the running snapshot and writes it out
+    write_phases -- writes the phase times so far
+    close -- ends any running snapshot and writes the phase times
+    """
+    enabled = True
+
+    def __init__(self, directory, prefix, window=PROFILE_WINDOW, interval=PROFILE_INTERVAL, clock=time.perf_counter_ns):
+        self.directory = directory
+        self.prefix = prefix
+        self.window = window
+        self.interval = max(interval, window)
+        self.clock = clock
+        self.totals = {}
+        self.stack = []
+        self.spans = {}
+        self.profile = None
+        self.window_ends = 0
+        self.next_window = clock() # the first snapshot starts with the first phase
+        self.snapshots = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def span(self, name):
+        span = self.spans.get(name)
+        if span is None:
+            span = self.spans[name] = Span(self, name)
+        return span
+
+    def end_span(self):
+        stack = self.stack
+        name, started, nested = stack.pop()
+        now = self.clock()
+        elapsed = now - started
+        totals = self.totals.get(name)
+        if totals is None:
+            totals = self.totals[name] = [0, 0, 0]
+        totals[0] += 1
+        totals[2] += elapsed - nested
+        if not any(frame[0] == name for frame in stack): # recursion into the same phase is already inside its inclusive time
+            totals[1] += elapsed
+        if stack:
+            stack[-1][2] += elapsed
+        elif self.profile is not None:
+            if now >= self.window_ends:
+                self.end_window()
+        elif now >= self.next_window:
+            self.start_window(now)
+
+    def start_window(self, now):
+        self.next_window = now + int(self.interval * 1e9)
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError: # another router in this process is taking its snapshot
+            return
+        self.profile = profile
+        self.window_ends = now + int(self.window * 1e9)
+
+    def end_window(self):
+        profile, self.profile = self.profile, None
+        profile.disable()
+        self.snapshots += 1
+        path = os.path.join(self.directory, "{}-{}.collapsed".format(self.prefix, self.snapshots))
+        write_atomically(path, "".join("{} {}\n".format(stack, weight) for stack, weight in sorted(collapsed_stacks(profile).items())))
+        self.write_phases()
+
+    def write_phases(self):
+        lines = ['{:>10} {:>10} {:>14} {:>14} {:>12}'.format('Phase', 'Calls', 'Total (ms)', 'Self (ms)', 'Mean (us)')]
+        for name in sorted(self.totals, key=lambda name: -self.totals[name][2]):
+            calls, inclusive, exclusive = self.totals[name]
+            lines.append('{:>10} {:>10} {:>14.3f} {:>14.3f} {:>12.2f}'.format(name, calls, inclusive / 1e6, exclusive / 1e6, inclusive / 1e3 / calls))
+        write_atomically(os.path.join(self.directory, "{}-phases.txt".format(self.prefix)), "\n".join(lines) + "\n")
+
+    def close(self):
+        self.next_window = float("inf") # a phase still running when profiling stops must not start a snapshot
+        if self.profile is not None:
+            self.end_window()
+        else:
+            self.write_phases()
+
+
+def write_atomically(path, text):
+    """writes 'text' to 'path' through a temporary file, so a reader never sees half of it"""
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "w") as output:
+        output.write(text)
+    os.replace(temporary, path)
+
+
+def function_label(function):
+    filename, line, name = function
+    if filename == "~": # a builtin
+        return name
+    return "{}:{}:{}".format(os.path.basename(filename), line, name)
+
+
+def collapsed_stacks(profile):
+    """returns a dictionary of "root;...;function" -> microseconds spent in that function under
+    those callers, rebuilt from the caller/callee pairs cProfile records"""
+    stats = pstats.Stats(profile).stats
+    stacks = {}
+
+    def climb(function, weight, path):
+        callers = stats.get(function, (0, 0, 0, 0, {}))[4]
+        callers = [(caller, timing[3]) for caller, timing in callers.items() if caller not in path] # skip recursion
+        share = sum(cumulative for _, cumulative in callers)
+        if not callers or share <= 0 or len(path) >= MAX_STACK_DEPTH: # reached the top of the recorded stack
+            stack = ";".join(function_label(frame) for frame in reversed(path))
+            stacks[stack] = stacks.get(stack, 0) + weight
+            return
+        for caller, cumulative in callers:
+            part = weight * cumulative / share
+            if part >= MIN_STACK_WEIGHT:
+                climb(caller, part, path + (caller,))
+
+    for function, (_, _, own_time, _, _) in stats.items():
+        weight = own_time * 1e6
+        if weight >= MIN_STACK_WEIGHT:
+            climb(function, weight, (function,))
+    return {stack: int(round(weight)) for stack, weight in stacks.items() if round(weight) > 0}
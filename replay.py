@@ -0,0 +1,156 @@
+import sys
+import time
+import random
+import hashlib
+import argparse
+from Parser import *
+from routing_daemon import *
+from simulator import VirtualClock
+from capture import *
+
+"""Replays a capture log (see capture.py) into a RoutingDaemon with no sockets, to profile
+and benchmark the decode and distance vector path on real traffic.
+
+The daemon is built from the captured router's config and runs on a virtual clock set to
+each datagram's capture time before it is handled, so its timers fire between datagrams
+as they did when it was captured. Datagrams go through handle_packet, and so through
+recieve_table and update, exactly as they did off the socket; whatever the daemon sends
+goes to a NullTransport that only counts it. A replay runs as fast as possible by
+default, or at the recorded speed (or a multiple of it) with --speed.
+
+The final routing table is summed up as a digest, so two versions of the engine (or the
+two kernels, with --vectorized) can be checked to end in the same state on the same input.
+
+Usage: python replay.py CAPTURE (--config FILE | --topology FILE) [--speed 1] [--repeat 3]
+"""
+
+REPLAY_SEED = 1 # seeds the update period jitter, so every run of a replay is the same
+WHOLE_REPLAY = 1e9 # seconds, a profile window and interval that cover any replay
+
+
+class NullTransport(object):
+    """Stands in for a router's sending socket during a replay, counting what is sent.
+
+    Attributes:
+    datagrams -- number of datagrams sent
+    bytes -- total size of the datagrams sent
+    """
+
+    def __init__(self):
+        self.datagrams = 0
+        self.bytes = 0
+
+    def sendto(self, data, address):
+        self.datagrams += 1
+        self.bytes += len(data)
+        return len(data)
+
+
+def build_daemon(config_object, clock, vectorized=False, log=None):
+    """creates a daemon on 'clock' whose sends go to a NullTransport"""
+    random.seed(REPLAY_SEED)
+    daemon = RoutingDaemon(config_object, clock, log)
+    daemon.sender = NullTransport()
+    daemon.pace_burst = sys.maxsize # nothing to overflow, send every datagram at once
+    daemon.vectorized = vectorized
+    return daemon
+
+
+def replay(daemon, clock, records, speed=0.0):
+    """feeds every (time, port, datagram) record into 'daemon', firing its timers on 'clock'
+    between them. 'speed' 0 goes as fast as possible, otherwise the gaps between datagrams
+    are kept, divided by 'speed'. Returns (seconds taken, route changes made)."""
+    changes = 0
+    if not records:
+        return 0.0, changes
+    first = records[0][0]
+    started = time.perf_counter()
+    for when, port, data in records:
+        if speed:
+            wait = (when - first) / speed - (time.perf_counter() - started)
+            if wait > 0:
+                time.sleep(wait)
+        clock.now = when
+        changes += len(daemon.time_event_handler(when)) # timers due before the datagram came in
+        daemon.drop_stats["received"] += 1
+        changed_routes = daemon.handle_packet(data)
+        if changed_routes:
+            daemon.send_update(changed_routes)
+        changes += len(changed_routes)
+    return time.perf_counter() - started, changes
+
+
+def table_digest(routing_table):
+    """a short digest of every route in 'routing_table', equal for equal tables"""
+    routes = ",".join("{}:{}:{}".format(dest, next_hop, cost) for dest, (next_hop, cost) in sorted(routing_table.items()))
+    return hashlib.sha1(routes.encode()).hexdigest()[:16]
+
+
+def find_config(args, router_id):
+    """the Config of the captured router, from --config or --topology"""
+    if args.config:
+        config_object = read_config(args.config)
+    else:
+        config_object = next((config for config in read_topology(args.topology) if config.id == router_id), None)
+        if config_object is None:
+            print("Router {} is not in {}".format(router_id, args.topology))
+            sys.exit(1)
+    if config_object.id != router_id:
+        print("The capture is of router {}, the config is for router {}".format(router_id, config_object.id))
+        sys.exit(1)
+    return config_object
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Replay a capture log into a routing daemon")
+    arg_parser.add_argument("capture", help="capture log written with --capture")
+    source = arg_parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--config", metavar="FILE", help="config file of the captured router")
+    source.add_argument("--topology", metavar="FILE", help="topology file holding the captured router")
+    arg_parser.add_argument("--speed", type=float, default=0.0, help="replay at this multiple of the recorded speed, 0 (the default) for as fast as possible")
+    arg_parser.add_argument("--repeat", type=int, default=1, help="replays, each into a fresh daemon, the fastest is reported")
+    arg_parser.add_argument("--vectorized", action="store_true", help="apply large tables with the NumPy kernel")
+    arg_parser.add_argument("--profile-dir", metavar="DIR", help="profile one more replay, not timed, into this directory")
+    arg_parser.add_argument("--log-level", choices=sorted(LEVELS, key=LEVELS.get), default="warning", help="lowest level of event the daemon logs")
+    arg_parser.add_argument("--table", action="store_true", help="print the routing table the replay ends with")
+    args = arg_parser.parse_args()
+    try:
+        router_id, records = read_capture(args.capture)
+    except (OSError, CaptureError) as error:
+        print(error)
+        sys.exit(1)
+    config_object = find_config(args, router_id)
+    EVENT_LOG.level = LEVELS[args.log_level]
+    if args.vectorized and numpy is None:
+        print("NumPy is not installed, replaying with the plain kernel")
+
+    best = None
+    for _ in range(max(1, args.repeat)):
+        clock = VirtualClock(records[0][0] if records else 0.0)
+        daemon = build_daemon(config_object, clock, args.vectorized)
+        elapsed, changes = replay(daemon, clock, records, args.speed)
+        if best is None or elapsed < best[0]:
+            best = (elapsed, changes, daemon)
+    elapsed, changes, daemon = best
+    if args.profile_dir: # the whole replay as one cProfile snapshot, plus the phase times
+        clock = VirtualClock(records[0][0] if records else 0.0)
+        profiled = build_daemon(config_object, clock, args.vectorized)
+        profiled.start_profiling(args.profile_dir, WHOLE_REPLAY, WHOLE_REPLAY)
+        replay(profiled, clock, records, args.speed)
+        profiled.stop_profiling()
+
+    decode = daemon.metrics.phases["recieve_table"]
+    update = daemon.metrics.phases["update"]
+    span = records[-1][0] - records[0][0] if records else 0.0
+    print("Router {}: {} datagrams over {:.1f} recorded seconds, {} malformed".format(router_id, len(records), span, daemon.drop_stats["malformed"]))
+    print("Replayed in {:.3f} s, {:.0f} datagrams/s, {} route changes, {} datagrams sent".format(elapsed, len(records) / elapsed if elapsed else 0.0, changes, daemon.sender.datagrams))
+    print('|{:>14} |{:>10} |{:>12} |{:>12} |'.format('Phase', 'Calls', 'Total (ms)', 'Mean (us)'))
+    for name, histogram in (("recieve_table", decode), ("update", update)):
+        print('|{:>14} |{:>10} |{:>12.2f} |{:>12.1f} |'.format(name, histogram.count, histogram.total * 1000, histogram.total / histogram.count * 1e6 if histogram.count else 0.0))
+    print("Routing table: {} routes, digest {}".format(len(daemon.routing_table), table_digest(daemon.routing_table)))
+    if args.table:
+        daemon.print_routing_table()
+
+
+if __name__ == "__main__":
+    main()
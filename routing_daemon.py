@@ -1,13 +1,36 @@
-from ConfigParser import *
-from Packets import *
-from BellmanFord import*
+from Parser import *
+from packet_class import *
+from Bellman_Ford import *
+from timer_heap import *
+from routing_table import *
+from metrics import *
+from profiling import *
+from eventlog import *
+from snapshot import *
+from forwarding import *
+from capture import *
+import os
 import socket
 import select
+import selectors
+import collections
+import sys
 import struct
 import json 
 import time
 import random
+import math
 
+MAX_ENTRIES = 25 # RFC 2453 limit on entries in one datagram
+MAX_LOGGED_CHANGES = 20 # route changes listed in one log event, the rest are counted
+PACE_BURST = 32 # datagrams sent back to back before pausing
+PACE_INTERVAL = 0.002 # seconds between bursts
+RECEIVE_BUFFER_SIZE = 65536 # larger than any UDP datagram, so a full buffer means the datagram was truncated
+SO_RXQ_OVFL = getattr(socket, "SO_RXQ_OVFL", 40 if sys.platform.startswith("linux") else None) # kernel drop counter, Linux only
+OVERFLOW_ANCILLARY_SIZE = socket.CMSG_SPACE(4) if SO_RXQ_OVFL is not None else 0
+SWEEP_DIVISIONS = 10 # route sweeps per timeout period, a route times out at most this fraction of the timeout late
+RESTORED_TIMEOUT_PERIODS = 2 # update periods a restored route waits to be confirmed before it times out
+REQUEST_HOLD_DOWN = 5 # least seconds between requests for the neighbours' tables, with adaptive updates
 
 class RoutingDaemon(object):
     """
@@ -23,26 +46,111 @@ class RoutingDaemon(object):
     input_ports -- list of the router's input ports
     output_ports -- list of output ports from the config parser
     in_sockets -- list of input sockets
+    selector -- selector the non-blocking input sockets are registered with
+    recv_buffer -- preallocated buffer every datagram is read into
+    drop_stats -- counts of datagrams recieved, and of those dropped as truncated, malformed or by the kernel
+    sender -- socket (or anything with a sendto method) updates are sent from
     outputs -- dictionary of output sockets
     available -- set of sockets that are available for listening
-    duration_list -- list of all timer events.
+    timers -- heap of all running timer events, keyed by (timer kind, router id).
+    duration_list -- list of all timer events in the order they will fire.
+    edges -- dictionary of neighbour id to link cost.
+    engine -- incremental distance vector engine working on the routing table.
+    packet_format -- wire format ("json" or "binary") used for sent updates.
+    pending_changes -- set of destinations changed since the last update was sent.
+    trigger_stats -- counts of triggered updates sent, entries they carried, and updates coalesced or suppressed.
+    update_cache -- dictionary of neighbour id to (table view version, datagrams) of the last full table built for it.
+    send_queue -- queue of (datagram, port) waiting to be sent.
+    pace_burst -- number of datagrams sent at once before waiting pace_interval seconds.
+    cache_stats -- counts of full table sends served from update_cache (hits) and rebuilt (misses).
+    vectorized -- whether recieved tables of VECTOR_MIN_ENTRIES or more are applied with the NumPy kernel, ignored when NumPy is not installed.
+    metrics -- packet, timing and timer counters, rendered in Prometheus text format on demand.
+    metrics_file -- path the metrics are written to every metrics_interval seconds, or None.
+    metrics_interval -- seconds between writes of metrics_file.
+    profiler -- times the receive, decode, compute, timers and send phases, NULL_PROFILER while profiling is off.
+    log -- the EventLog events are written to, EVENT_LOG unless one is given.
+    log_feed -- Subscription to the routing table's changes, read when route changes are logged.
+    trigger_feed -- Subscription to the routing table's changes, read when a triggered update is sent.
+    config_source -- function returning the router's Config as it is now on disk, for the reload command.
+    commands -- queue of (command, control connection or None) waiting to be run by run_commands.
+    wakeup -- (reader, writer) socket pair that wakes the selector when a command is queued.
+    control -- listening Unix socket control commands are read from, or None.
+    control_path -- path of the control socket, or None for no control socket.
+    heard -- dictionary of neighbour id -> time a packet last came from it.
+    sweep_interval -- seconds between sweeps of the routing table for timed out and collectable routes.
+    snapshot_file -- path the routing table and neighbours are saved to every snapshot_interval seconds, or None.
+    snapshot_interval -- seconds between snapshots.
+    origin_prefixes -- dictionary of router id -> dictionary of the (address, length) prefixes attached to it -> time last advertised, this router's from its config (never aged) and the rest learnt from updates.
+    prefix_version -- counts changes to origin_prefixes, part of the update_cache key.
+    forwarding -- the ForwardingTable compiled from the routes to every prefix, replaced whole when they change.
+    forwarding_feed -- Subscription to the routing table's changes, read to tell if forwarding needs compiling again.
+    capture -- CaptureWriter every recieved datagram is appended to, or None while not capturing.
+    adaptive_updates -- whether the update period is jittered afresh every period, and full tables stretched out to keepalives while nothing changes.
+    update_stretch -- update periods from one full table to the next, 1 unless adaptive updates have stretched it.
+    periods_since_table -- update periods since the last full table was sent.
+    update_stats -- counts of periodic full tables and keepalives sent.
+    last_request -- time the neighbours were last asked for their tables, or None.
     
     Methods:
+    start_updates -- starts the update timer and sends the first full table.
+    next_update_interval -- seconds until the next periodic update.
     send_table -- sends routing table to peer routers each 30 sec or when there's a triggered update
+    periodic_update -- sends a full table, or a keepalive while adaptive updates are stretched.
+    stretch_limit -- most update periods between full tables with adaptive updates.
+    send_keepalive -- sends a keepalive to every peer router.
+    send_request -- asks every peer router, or some of them, for its whole table.
+    answer_request -- sends the whole table to a peer router that asked for it.
+    transmit -- queues datagrams for a peer router and starts sending them.
+    flush_send_queue -- sends the next burst of queued datagrams.
+    encoded_table -- the full table datagrams for a neighbour, cached until its view of the table changes.
+    send_update -- queues changed routes for a rate limited triggered update.
+    send_triggered -- sends the queued changes to the peer routers.
     serialize -- serialises the routing table entries and preforms poison reverse.
     recieve_table -- recieves tables from peer routers.
-    update -- updates the routing table if there is a topological change.
+    learn_prefixes -- records the prefixes a peer router says other routers are attached to.
+    age_prefixes -- forgets the learnt prefixes no longer advertised.
+    prefix_entries -- the prefix entries of a full table for a neighbour.
+    update_forwarding -- compiles a new forwarding table if a route to a prefix has changed.
+    update -- updates the routing table if there is a topological change, returning the changed destinations.
+    handle_packet -- decodes a recieved packet, refreshes the routes it carries and updates the routing table.
     create_daemon -- binds sockets to input and output ports
+    open_input -- binds one input port.
+    close_input -- closes the socket of one input port.
+    reload_config -- applies a changed config to the running daemon.
+    set_link_cost -- moves the routes through a neighbour onto a new link cost.
+    open_control -- listens for control commands on a Unix socket.
+    service -- reads from the wakeup or control socket.
+    request -- queues a command from a signal handler and wakes the select loop.
+    run_commands -- runs the queued commands.
+    handle_command -- runs one command, returning its reply.
+    read_new_config -- reads the config again for a reload.
+    receive_batch -- waits for input and drains every ready socket, applying each datagram.
     is_input_available -- a method that listens to a socket and checks if there's data waiting, has a wait time.
     read_data -- grabs data in available set and decodes the message
-    add_timer -- adds timers to the duration array and calculates each timer.
+    add_timer -- starts (or restarts) a timer on the timer heap.
     get_time_out -- calculates the next timer to end.
-    remove_timer -- removes a timer once the time has ended.
+    remove_timer -- cancels a running timer.
     get_expired_timers -- grabs the timer that has ended.
     time_event_handler -- handles timers.
+    handle_timers -- handles the timers that have fired, inside the "timers" phase.
+    check_neighbour -- times out a neighbour that has gone silent, or pushes its deadline back.
+    sweep_routes -- times out routes that have not been refreshed and collects unreachable ones.
+    start_metrics_file -- starts writing the metrics to a Prometheus textfile on a timer.
+    write_metrics_file -- writes the metrics textfile once.
+    start_profiling -- starts timing phases and taking cProfile snapshots.
+    stop_profiling -- stops profiling, writing out what was collected.
+    toggle_profiling -- starts profiling if it is off, stops it if it is on.
+    log_route_changes -- logs the routes added, removed or changed since they were last logged.
+    format_routing_table -- the routing table as a printable table.
+    log_routing_table -- logs the whole routing table.
+    start_snapshots -- restores the last snapshot, then starts saving snapshots on a timer.
+    restore_snapshot -- loads the routes of a snapshot as stale routes that time out early.
+    write_snapshot -- saves a snapshot once.
+    start_capture -- starts appending every recieved datagram to a capture log.
+    stop_capture -- stops capturing and closes the log.
     """    
 
-    def __init__(self, config_object):
+    def __init__(self, config_object, clock=time.monotonic, log=None):
         self.config_object = config_object
         self.router_id = self.config_object.id
         self.input_ports = self.config_object.inputs
@@ -50,76 +158,622 @@ class RoutingDaemon(object):
         self.update_period = (int(random.uniform(self.config_object.period * 0.8, self.config_object.period * 1.2)), "Update timer: {} seconds.".format(self.config_object.period), "update")
         self.timeout = (self.config_object.timeout, "Timeout timer: {} seconds".format(self.config_object.timeout), "timeout", self.router_id)
         self.garbage = (self.config_object.garbage, "Garbage timer: {} seconds.".format(self.config_object.garbage), "garbage", self.router_id)
+        self.packet_format = self.config_object.packet_format
         self.in_sockets = []
+        self.selector = selectors.DefaultSelector()
+        self.recv_buffer = bytearray(RECEIVE_BUFFER_SIZE)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.drop_stats = {"received": 0, "truncated": 0, "malformed": 0, "kernel": 0}
+        self.kernel_drops = {}
+        self.sender = None
         self.outputs = [output.port for output in self.output_ports]
-        self.routing_table = {self.router_id:(self.router_id, 0)}
+        self.routing_table = RoutingTable({self.router_id:(self.router_id, 0)}, clock)
         self.edges = {output.id:output.metric for output in self.output_ports}
+        self.engine = DistanceVector(self.router_id, self.routing_table, self.edges)
         self.available = set()      
-        self.duration_list = [] 
+        self.timers = TimerHeap(clock)
+        self.pending_changes = set()
+        self.trigger_stats = {"sent": 0, "entries": 0, "coalesced": 0, "suppressed": 0}
+        self.update_cache = {}
+        self.send_queue = collections.deque()
+        self.pace_burst = PACE_BURST
+        self.pace_interval = PACE_INTERVAL
+        self.cache_stats = {"hits": 0, "misses": 0}
+        self.vectorized = False
+        self.metrics = Metrics()
+        self.metrics_file = None
+        self.metrics_interval = TEXTFILE_INTERVAL
+        self.profiler = NULL_PROFILER
+        self.log = EVENT_LOG if log is None else log
+        self.log_feed = self.routing_table.subscribe()
+        self.trigger_feed = self.routing_table.subscribe()
+        self.config_source = None
+        self.commands = collections.deque()
+        self.wakeup = None
+        self.control = None
+        self.control_path = None
+        self.snapshot_file = None
+        self.snapshot_interval = SNAPSHOT_INTERVAL
+        self.heard = {}
+        self.sweep_interval = self.config_object.timeout / SWEEP_DIVISIONS
+        self.add_timer(self.sweep_interval, "Route sweep", "sweep", -1)
+        self.origin_prefixes = {self.router_id: dict.fromkeys(self.config_object.networks, 0.0)}
+        self.prefix_version = 0
+        self.forwarding = ForwardingTable()
+        self.forwarding_feed = self.routing_table.subscribe()
+        self.forwarding_version = -1 # prefix_version forwarding was compiled at, compiled below
+        self.capture = None
+        self.adaptive_updates = False
+        self.update_stretch = 1
+        self.periods_since_table = 0
+        self.update_stats = {"tables": 0, "keepalives": 0}
+        self.last_request = None
+        self.update_forwarding()
         
+    def start_updates(self):
+        """starts the update timer and sends the first full table. With adaptive updates the
+        router also asks its neighbours for their tables, as they may be stretching theirs
+        out and a restarted router cannot wait that long."""
+        self.add_timer(self.next_update_interval(), "{}".format(self.router_id), "update", -1)
+        self.send_table()
+        if self.adaptive_updates:
+            self.send_request()
+
+    def next_update_interval(self):
+        """seconds to the next periodic update: the period jittered once at start, or with
+        adaptive updates jittered afresh every time, so routers that started together drift
+        apart instead of sending in step"""
+        if self.adaptive_updates:
+            return random.uniform(self.config_object.period * 0.8, self.config_object.period * 1.2)
+        return self.update_period[0]
+
     def send_table(self):
         """send a table to all of the peer routers. Put into packet format first."""
-        sender_sock = self.in_sockets[0]
+        with self.profiler.span("send"):
+            for output in self.output_ports:
+                self.transmit(self.encoded_table(output.id), output.port)
+        self.pending_changes = set() # the full table covers any triggered update still waiting
+        self.trigger_feed.skip()
+        self.periods_since_table = 0
+
+    def periodic_update(self):
+        """sends the update that is due every period. With adaptive updates only every
+        update_stretch'th one is the full table, the others are keepalives, and each full
+        table sent doubles the stretch up to stretch_limit periods. Any route change brings
+        it back to 1 (see send_update), so a stable network sends little more than
+        keepalives while a changing one sends full tables every period as usual."""
+        if not self.adaptive_updates:
+            self.send_table()
+            self.update_stats["tables"] += 1
+            return
+        self.periods_since_table += 1
+        limit = self.stretch_limit()
+        if self.periods_since_table < min(self.update_stretch, limit):
+            self.send_keepalive()
+            return
+        self.send_table()
+        self.update_stats["tables"] += 1
+        self.update_stretch = min(self.update_stretch * 2, limit)
+
+    def stretch_limit(self):
+        """the most update periods from one full table to the next: as many of the longest
+        jittered period as fit strictly inside the route timeout. A keepalive vouches for every
+        route through us without repeating them, so a triggered update lost on the way leaves
+        the neighbour with a wrong route until our next full table. The limit keeps that to
+        less than the timeout, as long as a route would take to time out if we had died."""
+        longest = self.config_object.period * 1.2
+        return max(1, math.ceil(self.timeout[0] / longest) - 1)
+
+    def send_keepalive(self):
+        """sends a keepalive, a response marked as one and carrying no routes, to every peer
+        router. It keeps us from timing out as a neighbour, and keeps the routes through us
+        from timing out (see handle_packet)."""
+        with self.profiler.span("send"):
+            for output in self.output_ports:
+                self.transmit([Packet(RESPONSE, 2, self.router_id, [], keepalive=True).to_bytes(self.packet_format)], output.port)
+        self.update_stats["keepalives"] += 1
+
+    def send_request(self, neighbours=None):
+        """asks every peer router, or only those in 'neighbours', for its whole table (RFC 2453 3.9.1)"""
+        self.last_request = self.timers.clock()
+        with self.profiler.span("send"):
+            for output in self.output_ports:
+                if neighbours is not None and output.id not in neighbours:
+                    continue
+                self.transmit([Packet(REQUEST, 2, self.router_id, []).to_bytes(self.packet_format)], output.port)
+
+    def answer_request(self, router_id):
+        """sends the whole table to 'router_id' if it is a peer router"""
         for output in self.output_ports:
-            data = self.serialize(self.routing_table, output.id)
-            sender_sock.sendto(data, ('127.0.0.1', output.port))
+            if output.id == router_id:
+                with self.profiler.span("send"):
+                    self.transmit(self.encoded_table(router_id), output.port)
+
+    def send_update(self, changed_dests=()):
+        """queues changed routes for a triggered update (RFC 2453 3.10.1). The first change
+        goes out straight away, changes made during the following 1-5 second hold-down are
+        coalesced into a single update sent when the hold-down ends. With adaptive updates
+        a change also brings full tables back to every period, and a route lost asks the
+        neighbours for their tables: one with another route to it may not send its full
+        table for stretch_limit periods otherwise."""
+        if changed_dests and self.adaptive_updates:
+            self.update_stretch = 1
+            now = self.timers.clock()
+            if self.last_request is None or now - self.last_request >= REQUEST_HOLD_DOWN:
+                if any(self.routing_table.get(dest, (None, INFINITY))[1] >= INFINITY for dest in changed_dests):
+                    self.send_request()
+        self.pending_changes.update(changed_dests)
+        if not self.pending_changes:
+            return
+        if ("triggered", -1) in self.timers: # still holding down after the last triggered update
+            self.trigger_stats["coalesced"] += 1
+            return
+        self.send_triggered()
+
+    def send_triggered(self):
+        """sends only the routes that changed since the last update to every peer router, unless
+        the periodic update is due before the hold-down would end"""
+        hold_down = random.uniform(1, 5)
+        next_update = self.timers.deadline("update", -1)
+        if next_update is not None and next_update - self.timers.clock() <= hold_down:
+            self.trigger_stats["suppressed"] += 1 # the full table is about to go out anyway
+            return
+        try: # leave out routes that have changed back since they were queued
+            self.pending_changes.intersection_update(dest for dest, _, _ in self.trigger_feed.changes())
+        except JournalTruncated: # too much changed to tell, send everything queued
+            pass
+        if not self.pending_changes:
+            return
+        with self.profiler.span("send"):
+            for output in self.output_ports:
+                self.transmit(self.serialize(self.routing_table, output.id, self.pending_changes), output.port)
+        self.trigger_stats["sent"] += 1
+        self.trigger_stats["entries"] += len(self.pending_changes)
+        self.pending_changes = set()
+        self.add_timer(hold_down, "Triggered update hold-down", "triggered", -1)
 
-    def serialize(self, routing_table, destination):
-        """serilize the entries. Carry out poison reverse"""
+    def transmit(self, datagrams, port):
+        """queues datagrams for a peer router's port and starts sending them"""
+        self.send_queue.extend((data, port) for data in datagrams)
+        if ("pace", -1) not in self.timers: # otherwise the pacing timer is already working through the queue
+            self.flush_send_queue()
+
+    def flush_send_queue(self):
+        """sends up to pace_burst queued datagrams, leaving the rest for the pacing timer so a
+        large table does not overflow the recievers' socket buffers"""
+        send_queue = self.send_queue
+        with self.profiler.span("send"):
+            for _ in range(min(self.pace_burst, len(send_queue))):
+                data, port = send_queue[0]
+                try:
+                    self.sender.sendto(data, ('127.0.0.1', port))
+                except BlockingIOError: # our own send buffer is full, try again after the interval
+                    break
+                send_queue.popleft()
+                self.metrics.packet_out(port, len(data))
+        if send_queue:
+            self.add_timer(self.pace_interval, "Paced send", "pace", -1)
+
+    def encoded_table(self, destination):
+        """returns the full table datagrams for 'destination', reusing the last ones built for
+        it unless a route it would see has changed since"""
+        view_version = (self.routing_table.view_version(destination), self.prefix_version)
+        cached = self.update_cache.get(destination)
+        if cached is not None and cached[0] == view_version:
+            self.cache_stats["hits"] += 1
+            return cached[1]
+        self.cache_stats["misses"] += 1
+        datagrams = self.serialize(self.routing_table, destination)
+        self.update_cache[destination] = (view_version, datagrams)
+        return datagrams
+
+    def serialize(self, routing_table, destination, dests=None):
+        """serilize the entries, or only those in 'dests' if given, into datagrams of at most
+        MAX_ENTRIES entries each. Carry out poison reverse"""
+        started = time.perf_counter()
         table_dict = self.routing_table
-        sending_dict = table_dict.copy()
-        for key,value in sending_dict.items():  #poison reverse
-            if value[0] == destination:
-                sending_dict[key] = (value[0], 16)  #poison reverse         
-        entries = []
-        for key in sending_dict.keys():
-            entry = RipEntry('AF_INET', key, sending_dict[key][1])
-            entries.append(entry)        
-        table_packet = Packet(2,2,self.router_id,entries)
-        serialised = table_packet.to_bytes()
+        if dests is None:
+            routes = table_dict.items()
+        else:
+            routes = [(key, table_dict[key]) for key in dests if key in table_dict] # routes deleted since they changed are left out
+        entries = [RipEntry('AF_INET', key, 16 if value[0] == destination else value[1]) for key, value in routes] #poison reverse
+        serialised = []
+        for start in range(0, len(entries) or 1, MAX_ENTRIES): # an empty update still goes out as a bare header
+            table_packet = Packet(2,2,self.router_id,entries[start:start + MAX_ENTRIES])
+            serialised.append(table_packet.to_bytes(self.packet_format))
+        if dests is None: # prefixes only go out with the full table, in datagrams of their own after the routes
+            prefixes = self.prefix_entries(destination)
+            for start in range(0, len(prefixes), MAX_ENTRIES):
+                serialised.append(Packet(2,2,self.router_id,[],prefixes[start:start + MAX_ENTRIES]).to_bytes(self.packet_format))
+        self.metrics.observe_phase("serialize", started)
         return serialised       
     
     def recieve_table(self, packet):
         """recieves table and infomation from peer routers. Will handle if a 
-        router and/or link goes down. Turns from packet into routing table"""
+        router and/or link goes down. Turns from packet into routing table, returned with the
+        sender's id and whether the packet was a keepalive"""
+        started = time.perf_counter()
         new_packet = Packet.from_bytes(packet)	
-        if new_packet.command == 2 and new_packet.version == 2:
+        if new_packet.command == REQUEST and new_packet.version == 2:
+            self.answer_request(new_packet.rid)
+            return None
+        if new_packet.command == RESPONSE and new_packet.version == 2:
             table_dict = {}
             sender_id = new_packet.rid
             for entry in new_packet.entries:
                 table_dict[entry.router_id] = (sender_id, entry.metric)  
-            return table_dict, sender_id    
+            if new_packet.prefixes: # sent in datagrams of their own, after the routes they depend on
+                self.learn_prefixes(new_packet.prefixes, sender_id)
+            self.metrics.observe_phase("recieve_table", started)
+            return table_dict, sender_id, new_packet.keepalive
         
-    def update(self, recieved_table_dict, source_of_rec):
-        """updates routing table using Bellman Ford, if entries in the routing table 
-        are different to the recieved updates from peer routers"""
-        new_routing_table, updated_dests = BellmanFord(self.routing_table, recieved_table_dict, source_of_rec, self.edges) 
-        if new_routing_table != self.routing_table:
+    def learn_prefixes(self, prefix_entries, source):
+        """records the router each prefix entry from 'source' says its prefix is attached to,
+        and when. Only the next hop of the route to that router speaks for its prefixes: the
+        others' copies may be out of date. The route to a prefix is the route to that router,
+        so the entry's metric is not needed. A prefix the next hop stops advertising is
+        forgotten by age_prefixes, and every prefix of a router when its route is deleted."""
+        now = self.timers.clock()
+        for entry in prefix_entries:
+            origin = entry.origin
+            if origin == self.router_id: # our own prefixes come from the config
+                continue
+            route = self.routing_table.get(origin)
+            if route is None or route[0] != source:
+                continue
+            prefixes = self.origin_prefixes.get(origin)
+            if prefixes is None:
+                prefixes = self.origin_prefixes[origin] = {}
+            prefix = (entry.prefix, entry.length)
+            if prefix not in prefixes:
+                self.prefix_version += 1
+                self.update_stretch = 1 # the next full table tells the neighbours
+            prefixes[prefix] = now
+
+    def age_prefixes(self, before):
+        """forgets every learnt prefix not advertised since 'before'. Prefixes only go out with
+        full tables, which stretch_limit keeps less than a timeout apart."""
+        for origin, prefixes in list(self.origin_prefixes.items()):
+            if origin == self.router_id:
+                continue
+            expired = [prefix for prefix, heard in prefixes.items() if heard < before]
+            if not expired:
+                continue
+            for prefix in expired:
+                del prefixes[prefix]
+            if not prefixes:
+                del self.origin_prefixes[origin]
+            self.prefix_version += 1
+            self.update_stretch = 1
+            self.log.info(self.router_id, "forgot {} prefix(es) of router {}", len(expired), origin)
+
+    def prefix_entries(self, destination):
+        """returns a PrefixEntry for every prefix attached to a router we have a reachable
+        route to, with the route's metric. The prefixes of routes through 'destination' are
+        left out rather than poisoned, as it would not learn them from us anyway. Entries
+        then only change with a route 'destination' would be sent unpoisoned, or with a
+        prefix, which is what the update_cache key covers."""
+        entries = []
+        for origin, prefixes in self.origin_prefixes.items():
+            route = self.routing_table.get(origin)
+            if route is None or route[1] >= INFINITY or route[0] == destination:
+                continue
+            entries += [PrefixEntry('AF_INET', address, length, origin, route[1]) for address, length in sorted(prefixes)]
+        return entries
+
+    def update_forwarding(self):
+        """compiles a new forwarding table when a prefix has been learnt or forgotten, or the
+        route to a router with prefixes has changed, and swaps it in. Each prefix goes to
+        the next hop of the cheapest route to a router attached to it, the lowest router id
+        winning a tie. A prefix of this router's own has itself as next hop."""
+        changed = self.forwarding_version != self.prefix_version
+        try:
+            for dest, _, new in self.forwarding_feed.changes():
+                if dest in self.origin_prefixes and dest != self.router_id:
+                    changed = True
+                    if new is None: # garbage collected, so are its prefixes
+                        del self.origin_prefixes[dest]
+                        self.prefix_version += 1
+        except JournalTruncated: # lost track, compile anyway
             changed = True
-            self.routing_table = new_routing_table
-        else:
-            changed = False
-        return updated_dests, changed
+        if not changed:
+            return
+        best = {} # prefix -> (metric, origin, next hop)
+        for origin, prefixes in self.origin_prefixes.items():
+            route = self.routing_table.get(origin)
+            if route is None or route[1] >= INFINITY:
+                continue
+            candidate = (route[1], origin, route[0])
+            for prefix in prefixes:
+                if prefix not in best or candidate < best[prefix]:
+                    best[prefix] = candidate
+        self.forwarding = ForwardingTable((address, length, next_hop) for (address, length), (_, _, next_hop) in best.items())
+        self.forwarding_version = self.prefix_version
+
+    def update(self, recieved_table_dict, source_of_rec):
+        """updates routing table using the incremental Bellman Ford engine, returns the
+        destinations whose route changed and whether there were any"""
+        started = time.perf_counter()
+        changed_dests = self.engine.apply_table(recieved_table_dict, source_of_rec, self.vectorized)
+        self.metrics.observe_phase("update", started)
+        return changed_dests, len(changed_dests) > 0
         
+    def handle_packet(self, packet):
+        """decodes a packet from a peer router, applies it to the routing table and refreshes
+        the routes it still carries. No timer is touched: routes age by their refreshed
+        time in the routing table, and the neighbour's deadline only moves on when it comes
+        up. Returns the destinations whose route changed."""
+        profiler = self.profiler
+        try:
+            with profiler.span("decode"):
+                recieved = self.recieve_table(packet)
+        except PacketError:
+            self.drop_stats["malformed"] += 1
+            return []
+        if recieved is None: # not a RIPv2 response
+            return []
+        data, router_id, keepalive = recieved
+        self.metrics.packet_in(router_id, len(packet))
+        if router_id in self.edges:
+            if router_id not in self.heard: # first word from this neighbour, start its deadline
+                self.add_timer(self.timeout[0], "Neighbour timer", "neighbour", router_id)
+            self.heard[router_id] = self.timers.clock()
+        with profiler.span("compute"):
+            updated_routes, routes_did_change = self.update(data, router_id)
+            if keepalive and router_id in self.edges: # the neighbour still has every route it gave us
+                self.routing_table.refresh_routes(self.engine.routes_via(router_id), router_id, confirm=False)
+            elif data:
+                self.routing_table.refresh_routes(data, router_id) # also confirms restored routes
+        self.log_route_changes(updated_routes)
+        self.update_forwarding()
+        return updated_routes
+
     def create_daemon(self):
-        """binds input port to a socket"""
+        """binds every input port to a non-blocking socket registered with the selector"""
+        self.wakeup = socket.socketpair()
+        for end in self.wakeup:
+            end.setblocking(False)
+        self.selector.register(self.wakeup[0], selectors.EVENT_READ, "wakeup")
         for inputs in self.input_ports:
-            soc_name = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            soc_name.bind(('127.0.0.1', inputs))
-            self.in_sockets.append(soc_name)
-            print('Listening at {}'.format(soc_name.getsockname()))
-            
+            self.open_input(inputs)
+
+    def open_control(self, path):
+        """listens for control commands, one per connection, on the Unix socket 'path'"""
+        if os.path.exists(path):
+            os.unlink(path) # left behind by an earlier run
+        self.control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.control.bind(path)
+        self.control.listen(4)
+        self.control.setblocking(False)
+        self.selector.register(self.control, selectors.EVENT_READ, "control")
+
+    def service(self, key):
+        """reads from the wakeup or control socket the selector found ready"""
+        if key.data == "wakeup": # a command was queued by a signal handler, the byte only woke us
+            try:
+                while key.fileobj.recv(4096):
+                    pass
+            except (BlockingIOError, InterruptedError):
+                pass
+        elif key.data == "control":
+            try:
+                connection, _ = self.control.accept()
+                connection.settimeout(1.0)
+                command = connection.recv(4096).decode(errors="replace").strip()
+            except OSError:
+                return
+            self.commands.append((command, connection)) # answered once run_commands has run it
+
+    def read_new_config(self):
+        """reads the config again through config_source, returns None (and logs why) if it cannot be read"""
+        if self.config_source is None:
+            self.log.error(self.router_id, "config reload failed, there is no config file to reload from")
+            return None
+        try:
+            return self.config_source()
+        except (Error, OSError) as error: # a bad config must not take the router down
+            self.log.error(self.router_id, "config reload failed:\n{}", error)
+            return None
+
+    def request(self, command):
+        """queues a command and wakes the select loop to run it. Safe to call from a signal handler."""
+        self.commands.append((command, None))
+        if self.wakeup is not None:
+            try:
+                self.wakeup[1].send(b"\0")
+            except OSError: # the wakeup socket is full, so the loop is waking anyway
+                pass
+
+    def run_commands(self):
+        """runs every queued command, replying on its control connection if it came from one"""
+        while self.commands:
+            command, connection = self.commands.popleft()
+            reply = self.handle_command(command)
+            if connection is not None:
+                try:
+                    connection.sendall((reply + "\n").encode())
+                except OSError:
+                    pass
+                connection.close()
+
+    def handle_command(self, command):
+        """runs a control command, returns the text to reply with. 'reload' re-reads the config
+        through config_source, 'table' gives the routing table, 'metrics' the metrics and
+        'lookup' followed by IPv4 addresses the next hop of each in the forwarding table."""
+        if command == "reload":
+            new_config = self.read_new_config()
+            if new_config is None:
+                return "error: config reload failed"
+            changed = self.reload_config(new_config)
+            return "ok: {} route(s) changed".format(len(set(changed)))
+        if command == "table":
+            return self.format_routing_table()
+        if command == "metrics":
+            return self.metrics.render(self)
+        if command.startswith("lookup "):
+            try:
+                addresses = [parse_address(address) for address in command[7:].split()]
+            except ValueError as error:
+                return "error: {}".format(error)
+            forwarding = self.forwarding # the same table for every address, even if a new one is swapped in
+            return "\n".join("{} via {}".format(format_address(address), "none" if next_hop == NO_ROUTE else next_hop)
+                             for address, next_hop in zip(addresses, forwarding.lookup(addresses)))
+        return "error: unknown command '{}', use reload, table, metrics or lookup".format(command)
+
+    def open_input(self, port):
+        """binds an input port to a non-blocking socket and registers it with the selector"""
+        soc_name = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.config_object.receive_buffer:
+            soc_name.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.config_object.receive_buffer)
+        if SO_RXQ_OVFL is not None: # ask the kernel to tell us how many datagrams it dropped
+            soc_name.setsockopt(socket.SOL_SOCKET, SO_RXQ_OVFL, 1)
+        soc_name.bind(('127.0.0.1', port))
+        soc_name.setblocking(False)
+        self.selector.register(soc_name, selectors.EVENT_READ)
+        self.in_sockets.append(soc_name)
+        if self.sender is None: # updates go out from the first input socket
+            self.sender = soc_name
+        self.log.info(self.router_id, "listening at {}", soc_name.getsockname())
+
+    def close_input(self, port):
+        """closes the socket bound to an input port, moving sending to another input socket if it was the sender"""
+        for soc_name in self.in_sockets:
+            if soc_name.getsockname()[1] == port:
+                self.selector.unregister(soc_name)
+                self.in_sockets.remove(soc_name)
+                self.kernel_drops.pop(soc_name.fileno(), None)
+                if self.sender is soc_name:
+                    self.sender = self.in_sockets[0] if self.in_sockets else None
+                soc_name.close()
+                self.log.info(self.router_id, "stopped listening on port {}", port)
+                return
+
+    def set_link_cost(self, neighbour, metric):
+        """moves every route through 'neighbour' onto the link's new cost, returns the changed
+        destinations. A cheaper link can also make the neighbour's routes to other destinations
+        the best ones, so it is asked for its table rather than waiting for its next full one."""
+        cheaper = metric < self.edges.get(neighbour, metric)
+        changed = self.engine.link_cost_changed(neighbour, metric)
+        if cheaper:
+            self.send_request([neighbour])
+        return changed
+
+    def reload_config(self, new_config):
+        """moves the running daemon onto 'new_config', changing only what differs: input
+        sockets are opened and closed, neighbours added, dropped or moved onto new link
+        costs, and the timers and packet format updated. Routes that do not depend on what
+        changed stay as they are. The routes that did change go out in one triggered update,
+        and new neighbours are sent the full table. Returns the changed destinations."""
+        if new_config.id != self.router_id:
+            self.log.error(self.router_id, "config reload ignored, the router id cannot change to {}", new_config.id)
+            return []
+        old_config, self.config_object = self.config_object, new_config
+        if self.in_sockets: # bound by create_daemon, an asyncio router manages its own endpoints
+            for port in self.input_ports:
+                if port not in new_config.inputs:
+                    self.close_input(port)
+            for port in new_config.inputs:
+                if port not in self.input_ports:
+                    try:
+                        self.open_input(port)
+                    except OSError as error: # e.g. the port is taken, keep running on the others
+                        self.log.error(self.router_id, "could not listen on port {}: {}", port, error)
+            if new_config.receive_buffer and new_config.receive_buffer != old_config.receive_buffer:
+                for soc_name in self.in_sockets:
+                    soc_name.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, new_config.receive_buffer)
+        self.input_ports = new_config.inputs
+
+        changed = []
+        new_edges = {output.id: output.metric for output in new_config.outputs}
+        for neighbour in list(self.edges):
+            if neighbour not in new_edges: # no longer linked, every route through it is lost
+                del self.edges[neighbour]
+                self.update_cache.pop(neighbour, None)
+                self.heard.pop(neighbour, None)
+                self.remove_timer("neighbour", neighbour)
+                changed += self.engine.neighbour_down(neighbour) # collected by the sweep in garbage seconds
+        added = [neighbour for neighbour in new_edges if neighbour not in self.edges]
+        for neighbour, metric in new_edges.items():
+            if neighbour in self.edges:
+                changed += self.set_link_cost(neighbour, metric)
+            else:
+                self.edges[neighbour] = metric # routes through it are learnt from its first update
+        self.output_ports = new_config.outputs
+        self.outputs = [output.port for output in self.output_ports]
+
+        if new_config.period != old_config.period:
+            self.update_period = (int(random.uniform(new_config.period * 0.8, new_config.period * 1.2)), "Update timer: {} seconds.".format(new_config.period), "update")
+            self.add_timer(self.next_update_interval(), "{}".format(self.router_id), "update", -1) # restart on the new period
+        self.timeout = (new_config.timeout, "Timeout timer: {} seconds".format(new_config.timeout), "timeout", self.router_id)
+        self.garbage = (new_config.garbage, "Garbage timer: {} seconds.".format(new_config.garbage), "garbage", self.router_id)
+        if new_config.timeout != old_config.timeout:
+            self.sweep_interval = new_config.timeout / SWEEP_DIVISIONS
+            self.add_timer(self.sweep_interval, "Route sweep", "sweep", -1)
+        if new_config.packet_format != self.packet_format:
+            self.packet_format = new_config.packet_format
+            self.update_cache.clear() # built in the old format
+        if set(new_config.networks) != set(self.origin_prefixes[self.router_id]):
+            self.origin_prefixes[self.router_id] = dict.fromkeys(new_config.networks, 0.0) # routers that learnt a dropped prefix forget it a timeout after our last full table with it
+            self.prefix_version += 1
+            self.update_stretch = 1
+
+        self.log.info(self.router_id, "config reloaded: {} neighbour(s) added, {} route(s) changed", len(added), len(set(changed)))
+        self.send_update(changed)
+        for output in self.output_ports:
+            if output.id in added:
+                self.transmit(self.encoded_table(output.id), output.port)
+        self.log_route_changes(changed)
+        self.update_forwarding()
+        return changed
             
+    def receive_batch(self, timeout):
+        """waits up to 'timeout' seconds (None waits forever) for input, then drains every ready
+        socket until it would block, applying each datagram as it is read. Returns the
+        destinations whose route changed across the whole batch."""
+        changed_routes = []
+        receive_span = self.profiler.span("receive")
+        for key, _ in self.selector.select(timeout):
+            if key.data is not None: # the wakeup or control socket, not a router
+                self.service(key)
+                continue
+            sock = key.fileobj
+            capture = self.capture
+            if capture is not None:
+                port = sock.getsockname()[1]
+            while True:
+                try:
+                    with receive_span:
+                        if SO_RXQ_OVFL is None:
+                            nbytes, address = sock.recvfrom_into(self.recv_buffer)
+                        else:
+                            nbytes, ancdata, flags, address = sock.recvmsg_into([self.recv_buffer], OVERFLOW_ANCILLARY_SIZE)
+                            self.count_kernel_drops(sock, ancdata)
+                except (BlockingIOError, InterruptedError): # drained
+                    break
+                except OSError: # e.g. an ICMP error queued on the socket, try again next wakeup
+                    break
+                self.drop_stats["received"] += 1
+                if capture is not None: # as read off the socket, before anything can reject it
+                    capture.write(self.timers.clock(), port, self.recv_view[:nbytes])
+                if nbytes == len(self.recv_buffer): # filled the whole buffer, so the datagram was cut short
+                    self.drop_stats["truncated"] += 1
+                    continue
+                changed_routes += self.handle_packet(self.recv_view[:nbytes])
+        return changed_routes
+
+    def count_kernel_drops(self, sock, ancdata):
+        """adds the datagrams the kernel dropped on 'sock' since the last read to drop_stats"""
+        for level, kind, data in ancdata:
+            if level == socket.SOL_SOCKET and kind == SO_RXQ_OVFL and len(data) >= 4:
+                dropped = struct.unpack("=I", data[:4])[0] # running total for the socket
+                last = self.kernel_drops.get(sock.fileno(), 0)
+                self.drop_stats["kernel"] += (dropped - last) & 0xFFFFFFFF
+                self.kernel_drops[sock.fileno()] = dropped
+
     def is_input_available(self):
-        """Checks if input is available and sets a wait time"""
-        wait_time = self.get_time_out()[0]
-        if wait_time == None:
-            available = select.select(self.in_sockets, [], [])[0]
-        else:
-            wait_time = abs(wait_time)
-        #print(wait_time)
-        available = select.select(self.in_sockets, [], [], wait_time)[0] #takes three lists of file descriptors, give array of input sockets to listen with timeout for 100ms
-        #available = select.select(self.in_sockets, [], [], 0.5)[0] #hack solution
+        """Checks if input is available, waiting no longer than the next timer"""
+        wait_time = self.timers.time_until_next() # None blocks until input arrives
+        available = select.select(self.in_sockets, [], [], wait_time)[0] #takes three lists of file descriptors, give array of input sockets to listen with a timeout
         for in_socket in available:
             self.available.add(in_socket) # add the binded ports into the set, available for listening.
         return len(self.available) > 0 # input is available if we have at least one input socket in available    
@@ -128,74 +782,239 @@ class RoutingDaemon(object):
         """read entries that are available and decodes them"""
         try:
             sock = self.available.pop() #poping off the items ready to read in the available set.
-            data = sock.recv(4096) # buffsize needs to be a small power of 2 -> max amount of data to be recv at once
-            decode, sender_id = self.recieve_table(data) # returns a tuple -> decode the message
+            data = sock.recv(RECEIVE_BUFFER_SIZE) # large enough for any datagram
+            decode, sender_id, _ = self.recieve_table(data) # returns a tuple -> decode the message
             return decode, sender_id
         except KeyError: # If there's nothing to be read -> raise an error.     
             return None          
              
+    @property
+    def duration_list(self):
+        """All running timers as (end_time, message, timer_id, router_id), soonest first"""
+        return self.timers.timers()
+
     def add_timer(self, duration, timer_message, timer_id, router_id):
-        """Calculates the duration for eachtimer and appends them to the duration list"""
-        print "Adding timer with duration", duration
-        current_time = int(time.time()) # grab the current time
-        end_time = current_time + duration  # calculate the remaining time
-        self.duration_list.append((end_time, timer_message, timer_id, router_id)) # append the time to the duration list
+        """Starts a timer that fires 'duration' seconds from now, replacing any running timer of the same type for the router"""
+        return self.timers.schedule(duration, timer_message, timer_id, router_id)
         
     def get_time_out(self):
-        """Grabs each time event from the duration list, when it's fired."""
-        print(self.duration_list)
-        next_event = None
-        for end_time, message, timer_id, router_id in self.duration_list:
-            if not next_event or (end_time < next_event[0] and end_time >= int(time.time())): # do the comparison 
-                next_event = (end_time, message, timer_id, router_id) # assign the next time event
-        current_time = int(time.time()) # grab the current time
+        """Grabs the next time event from the timer heap, with the time left until it fires."""
+        next_event = self.timers.next_deadline()
         if next_event is None: # no more timer events
             return None
-        return (next_event[0] - current_time, next_event[1], next_event[2], next_event[3]) #timer counts down to next event
+        end_time, _, timer_id, router_id, message, _ = next_event
+        return (max(0.0, end_time - self.timers.clock()), message, timer_id, router_id) #timer counts down to next event
     
     def remove_timer(self, timer_type, router_id):
-        """Removes timers that expire""" 
-        find_id = None
-        for i, event in enumerate(self.duration_list): # find the timer id
-            if event[3] == router_id and event[2] == timer_type: 
-                find_id = i
-        if find_id is not None: 
-            self.duration_list.pop(find_id)  #remove timer id
+        """Cancels a running timer""" 
+        return self.timers.cancel(timer_type, router_id)
         
-    def get_expired_timers(self):
-        """grabs the timers that have finished for processing""" 
-        tids = set()
-        now = int(time.time())
-        for end_time, message, timer_id, router_id in self.duration_list:
-            if end_time <= now:
-                tids.add((timer_id, message, timer_id, router_id))
-        return tids
+    def get_expired_timers(self, now=None):
+        """takes the timers that have finished by 'now' (default the current time) off the heap for processing, in the order they fired""" 
+        return self.timers.pop_expired(now)
         
-    def time_event_handler(self):
-        """a method for handling timer events, when to start each timer."""
-        fired = self.get_expired_timers()
+    def time_event_handler(self, now=None):
+        """a method for handling timer events, when to start each timer. Returns the destinations whose route changed."""
+        with self.profiler.span("timers"):
+            return self.handle_timers(now)
+
+    def handle_timers(self, now):
+        """handles every timer that has fired by 'now', returns the destinations whose route changed"""
+        changed_routes = []
+        fired = self.get_expired_timers(now)
+        fired_at = self.timers.clock() if now is None else now
         for timed_out, message, timer_id, router_id in fired:
-            self.remove_timer(timer_id, router_id)
+            self.metrics.timer_lateness.observe(max(0.0, fired_at - timed_out))
             if timer_id == "update": # update timer has timed out
-                print(timer_id)
-                self.send_table() #send the update routing table.
-                self.add_timer(self.update_period[0], "{}".format(self.router_id), "update", -1) #restart the update timer
-            elif timer_id == "timeout" : #timed out with no table from peer router
-                print(timer_id)
-                self.routing_table[router_id] = (self.routing_table[router_id][0], 16) #send the routing table with metric->16
-                self.send_table()
-                self.add_timer(self.garbage[0],"Garbage Timer", "garbage", router_id)#start garbage.
-            elif timer_id == "garbage":
-                print(timer_id)
-                del self.routing_table[router_id] # delete the entry
-                self.update(self.routing_table,self.router_id) # update table
+                self.log.debug(self.router_id, "sending periodic update")
+                self.periodic_update() #send the update routing table, or a keepalive
+                self.add_timer(self.next_update_interval(), "{}".format(self.router_id), "update", -1) #restart the update timer
+            elif timer_id == "neighbour": # a neighbour's deadline has come up
+                changed_routes += self.check_neighbour(router_id, fired_at)
+            elif timer_id == "sweep": # age every route at once
+                changed_routes += self.sweep_routes(fired_at)
+                self.add_timer(self.sweep_interval, "Route sweep", "sweep", -1)
+            elif timer_id == "triggered": # hold-down is over, send whatever was coalesced during it
+                if self.pending_changes:
+                    self.send_triggered()
+            elif timer_id == "pace": # send the next burst of queued datagrams
+                self.flush_send_queue()
+            elif timer_id == "metrics": # rewrite the metrics textfile
+                self.write_metrics_file()
+                self.add_timer(self.metrics_interval, "Metrics textfile", "metrics", -1)
+            elif timer_id == "snapshot": # save the routing table for a warm restart
+                self.write_snapshot()
+                self.add_timer(self.snapshot_interval, "Snapshot", "snapshot", -1)
+        self.log_route_changes(changed_routes)
+        self.update_forwarding()
+        return changed_routes
 
-    def print_routing_table(self):
-        print("-"*43)        
-        print("Routing table for Router {}".format(self.router_id))
-        print("-"*43)
-        print('|{:>12} |{:>12} |{:>12} |'.format('Destination','Next Hop','Cost'))
-        print("-"*43)
+    def check_neighbour(self, neighbour, now):
+        """takes down every route through 'neighbour' if nothing has come from it for the
+        timeout period, otherwise moves its deadline on to a timeout after the last packet.
+        Returns the destinations whose route changed."""
+        last_heard = self.heard.get(neighbour)
+        if last_heard is None or neighbour not in self.edges: # dropped by a reload since
+            return []
+        deadline = last_heard + self.timeout[0]
+        if deadline > now: # compared as a deadline, so a timer is never restarted with no time left
+            self.add_timer(deadline - now, "Neighbour timer", "neighbour", neighbour)
+            return []
+        self.log.info(self.router_id, "neighbour {} timed out", neighbour)
+        del self.heard[neighbour] # the deadline starts again with its next packet
+        changed = self.engine.neighbour_down(neighbour) # the direct route to it too, a route to it through another neighbour stays
+        self.send_update(changed)
+        return changed
+
+    def sweep_routes(self, now):
+        """marks unreachable every route not refreshed for the timeout period, and deletes
+        every route that has been unreachable for the garbage collection period. Prefixes not
+        advertised for the timeout period are forgotten too. Returns the destinations whose
+        route changed."""
+        self.age_prefixes(now - self.timeout[0])
+        timed_out, collectable = self.routing_table.aged(now - self.timeout[0], now - self.garbage[0])
+        if self.router_id in timed_out: # the router's own route is never refreshed, and never expires
+            timed_out.remove(self.router_id)
+        changed = []
+        for dest in timed_out:
+            changed += self.engine.expire(dest)
+        for dest in collectable:
+            changed += self.engine.remove_route(dest) # poisons any route through it too
+        if timed_out or collectable:
+            self.log.info(self.router_id, "{} route(s) timed out, {} garbage collected", len(timed_out), len(collectable))
+            self.send_update(changed) # a deleted route itself is skipped when serialising
+        return changed
+
+    def start_profiling(self, directory, window=PROFILE_WINDOW, interval=PROFILE_INTERVAL):
+        """times every phase from now on, and takes a 'window' second cProfile snapshot every
+        'interval' seconds, writing both into 'directory'"""
+        self.profiler.close()
+        self.profiler = Profiler(directory, "router{}".format(self.router_id), window, interval)
+
+    def stop_profiling(self):
+        """goes back to the null profiler, writing out the running snapshot and the phase times"""
+        profiler, self.profiler = self.profiler, NULL_PROFILER
+        profiler.close()
+
+    def toggle_profiling(self, directory, window=PROFILE_WINDOW, interval=PROFILE_INTERVAL):
+        """starts profiling if it is off and stops it if it is on, for a signal handler"""
+        if self.profiler.enabled:
+            self.stop_profiling()
+        else:
+            self.start_profiling(directory, window, interval)
+
+    def start_metrics_file(self, path, interval=TEXTFILE_INTERVAL):
+        """writes the metrics to the Prometheus textfile 'path' now and every 'interval' seconds"""
+        self.metrics_file = path
+        self.metrics_interval = interval
+        self.write_metrics_file()
+        self.add_timer(interval, "Metrics textfile", "metrics", -1)
+
+    def write_metrics_file(self):
+        try:
+            write_textfile(self, self.metrics_file)
+        except OSError as error: # a full disk must not take the router down
+            self.log.warning(self.router_id, "could not write metrics to {}: {}", self.metrics_file, error)
+
+    def start_snapshots(self, path, interval=SNAPSHOT_INTERVAL):
+        """restores the routes saved in the snapshot 'path', if there is one, then saves a new
+        snapshot there every 'interval' seconds. Called before the daemon sends its first table."""
+        self.snapshot_file = path
+        self.snapshot_interval = interval
+        self.restore_snapshot(path)
+        self.add_timer(interval, "Snapshot", "snapshot", -1)
+
+    def restore_snapshot(self, path):
+        """loads the routes of the snapshot 'path' into the routing table, so a restarted
+        router advertises the routes it had instead of looking to its neighbours like a
+        router that has lost them. Every restored route is marked stale and times out after
+        RESTORED_TIMEOUT_PERIODS update periods unless its next hop advertises it first. Routes
+        through a router that is no longer a neighbour are left out, and routes through a
+        link whose cost has changed since the snapshot are adjusted to the new cost. Returns
+        the number of routes restored."""
+        try:
+            neighbours, routes = read_snapshot(path, self.router_id, self.timeout[0] + self.garbage[0])
+        except FileNotFoundError: # first start, nothing to restore
+            return 0
+        except (OSError, SnapshotError) as error:
+            self.log.warning(self.router_id, "not restoring snapshot: {}", error)
+            return 0
+        short_timeout = min(self.timeout[0], RESTORED_TIMEOUT_PERIODS * self.config_object.period)
+        aged_to = self.timers.clock() - self.timeout[0] + short_timeout # the sweep times it out short_timeout from now
+        changed = []
+        for dest, next_hop, metric in routes:
+            if dest == self.router_id or next_hop not in self.edges:
+                continue
+            metric += self.edges[next_hop] - neighbours.get(next_hop, self.edges[next_hop])
+            if metric >= 16:
+                continue
+            self.engine.set_route(dest, next_hop, metric, changed)
+            self.routing_table.mark_stale(dest)
+            self.routing_table.refresh(dest, aged_to)
+        self.log_feed.skip() # restored routes are not changes to log
+        self.log.info(self.router_id, "restored {} routes from {}", self.routing_table.stale, path)
+        return self.routing_table.stale
+
+    def write_snapshot(self):
+        try:
+            write_snapshot(self.snapshot_file, self.router_id, self.routing_table, self.output_ports)
+        except OSError as error: # a full disk must not take the router down
+            self.log.warning(self.router_id, "could not write snapshot to {}: {}", self.snapshot_file, error)
+
+    def start_capture(self, path):
+        """appends every datagram recieved from now on to the capture log 'path', for replay.py"""
+        self.stop_capture()
+        self.capture = CaptureWriter(path, self.router_id)
+        self.log.info(self.router_id, "capturing recieved datagrams to {}", path)
+
+    def stop_capture(self):
+        capture, self.capture = self.capture, None
+        if capture is not None:
+            capture.close()
+            self.log.info(self.router_id, "captured {} datagrams to {}", capture.records, capture.path)
+
+    def log_route_changes(self, changed_routes):
+        """logs how the routes differ from when they were last logged, read from the routing
+        table's journal, as one event listing at most MAX_LOGGED_CHANGES of them. Costs
+        nothing when 'changed_routes' is empty, and next to nothing when the log is not
+        writing info events."""
+        if not changed_routes:
+            return
+        if not self.log.enabled_for(INFO):
+            self.log_feed.skip()
+            return
+        try:
+            journal = self.log_feed.changes()
+        except JournalTruncated:
+            self.log.info(self.router_id, "too many routes changed to list, {} routes now", len(self.routing_table))
+            return
+        changes = []
+        for dest, old, new in journal:
+            if new is None:
+                changes.append("-{}".format(dest))
+            elif old is None:
+                changes.append("+{} (via {}, cost {})".format(dest, new[0], new[1]))
+            else:
+                changes.append("~{} (via {}, cost {} -> via {}, cost {})".format(dest, old[0], old[1], new[0], new[1]))
+        if not changes:
+            return
+        more = len(changes) - MAX_LOGGED_CHANGES
+        listed = ", ".join(sorted(changes[:MAX_LOGGED_CHANGES]))
+        if more > 0:
+            listed += " and {} more".format(more)
+        self.log.info(self.router_id, "{} route(s) changed: {}", len(changes), listed)
+
+    def format_routing_table(self):
+        lines = ["-"*43, "Routing table for Router {}".format(self.router_id), "-"*43,
+                 '|{:>12} |{:>12} |{:>12} |'.format('Destination','Next Hop','Cost'), "-"*43]
         for key, value in self.routing_table.items():
-            print('|{:>12} |{:>12} |{:>12} |'.format(key,value[0],value[1]))
+            lines.append('|{:>12} |{:>12} |{:>12} |'.format(key,value[0],value[1]))
+        return "\n".join(lines)
+
+    def log_routing_table(self):
+        """logs the whole routing table, whatever the log level"""
+        self.log.log(max(INFO, self.log.level), self.router_id, "routing table\n{}", self.format_routing_table(), limited=False)
+
+    def print_routing_table(self):
+        print(self.format_routing_table())
         print('')
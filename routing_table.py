@@ -0,0 +1,391 @@
+import time
+import itertools
+import collections
+from array import array
+
+
+USED = 1 # flag bit set on every slot holding a route
+STALE = 2 # flag bit set on a route restored from a snapshot until a neighbour confirms it
+DIRECT_LIMIT = 1 << 20 # router ids below this live in the slot of the same number
+ID_LIMIT = 1 << 31 # router ids are stored as signed 32 bit integers, so must be below this
+INFINITY = 16 # RIP metric for an unreachable destination
+JOURNAL_LIMIT = 1 << 16 # changes kept in the journal, a reader further behind has to start again from the whole table
+
+
+class JournalTruncated(LookupError):
+    # Raised when the changes asked for are older than the oldest one the journal kept.
+    pass
+
+
+class RoutingTable(object):
+    """
+    Routing table of destination -> (next hop, cost), stored in parallel compact arrays.
+    Every destination owns a slot, an index into the arrays. Router ids are small
+    integers, so a destination below DIRECT_LIMIT simply uses the slot of the same number
+    and needs no index entry at all; larger ids are mapped to slots through the overflow
+    dictionary. Updating a route writes into the arrays in place, allocating nothing but
+    its journal entry. It reads like the dictionary it replaces: table[dest] gives a
+    (next hop, cost) tuple, and iteration, keys, items, get, 'in' and len all work as for
+    a dictionary.
+
+    The table also counts its own changes. Writing a route that is already there is not
+    a change. Every change bumps the table's version. A change that keeps a route on the
+    same next hop is also counted against that next hop: the neighbour on the other end
+    sees the route poisoned (cost 16) both before and after, so its view of the table has
+    not changed. view_version therefore only moves when something that neighbour would be
+    sent has changed.
+
+    Every change is also written to a journal as (destination, old route, new route),
+    the routes being (next hop, cost) tuples or None for no route, and every slot records
+    the version at which it last changed. changes_since turns the journal into the net
+    change to each destination since a version, so a reader that remembers the version it
+    last read at (a Subscription does this) can follow the table without copying it. The
+    journal keeps the last JOURNAL_LIMIT changes.
+
+    Attributes:
+    ids -- destination in each slot, -1 for a slot never used
+    next_hops -- next hop in each slot
+    metrics -- cost in each slot
+    flags -- flag bits in each slot, USED for a slot holding a route, STALE for a restored route not yet confirmed
+    refreshed -- time each slot's route last changed or was refreshed
+    versions -- version of the table at which each slot's route last changed
+    overflow -- dictionary of destination -> slot for ids of DIRECT_LIMIT and over
+    free -- list of slots freed by overflow destinations
+    count -- number of routes in the table
+    clock -- function giving the time stored in refreshed
+    version -- number of changes made to the table
+    hop_changes -- dictionary of next hop -> number of changes that kept a route through it
+    stale -- number of routes marked STALE
+    journal -- deque of (destination, old route, new route) for the last JOURNAL_LIMIT changes
+
+    Methods:
+    slot -- the slot of a destination, -1 if it has no route
+    set_route -- sets a route in place, returns whether it changed
+    remove -- deletes a route, freeing its slot
+    refresh -- records that a route has been confirmed without changing it
+    refresh_routes -- refreshes every reachable route a neighbour advertised through itself
+    aged -- the routes whose timeout or garbage collection time has passed
+    mark_stale -- marks a route as restored and not yet confirmed
+    confirm -- clears a route's stale mark, returns whether it had one
+    is_stale -- whether a route is still marked STALE
+    next_hop -- the next hop of a destination
+    metric -- the cost of a destination
+    view_version -- version of the table as seen, with poison reverse, by a neighbour
+    entry_version -- version at which a destination's route last changed
+    changes_since -- the net change to every route since a version
+    subscribe -- a Subscription reading the changes made from now on
+    """
+
+    def __init__(self, routes=None, clock=time.monotonic):
+        self.ids = array('i')
+        self.next_hops = array('i')
+        self.metrics = array('i')
+        self.flags = array('B')
+        self.refreshed = array('d')
+        self.versions = array('Q')
+        self.overflow = {}
+        self.free = []
+        self.count = 0
+        self.clock = clock
+        self.version = 0
+        self.hop_changes = {}
+        self.stale = 0
+        self.journal = collections.deque(maxlen=JOURNAL_LIMIT)
+        for dest, route in (routes or {}).items():
+            self.set_route(dest, route[0], route[1])
+        self.version = 0 # the starting routes are not changes
+        self.journal.clear()
+        self.versions = array('Q', [0]) * len(self.ids)
+
+    def grow(self, size):
+        """extends every array to 'size' slots"""
+        extra = size - len(self.ids)
+        if extra > 0:
+            self.ids.extend(array('i', [-1]) * extra)
+            self.next_hops.extend(array('i', [0]) * extra)
+            self.metrics.extend(array('i', [0]) * extra)
+            self.flags.extend(array('B', [0]) * extra)
+            self.refreshed.extend(array('d', [0.0]) * extra)
+            self.versions.extend(array('Q', [0]) * extra)
+
+    def slot(self, dest):
+        """returns the slot holding the route to 'dest', or -1 if there is no route"""
+        if 0 <= dest < DIRECT_LIMIT:
+            if dest < len(self.ids) and self.ids[dest] == dest and self.flags[dest] & USED:
+                return dest
+            return -1
+        return self.overflow.get(dest, -1)
+
+    def move(self, slot):
+        """moves the overflow route in 'slot' to another slot, so the destination whose id
+        is 'slot' can have it"""
+        dest = self.ids[slot]
+        new = self.overflow_slot()
+        self.ids[new], self.next_hops[new], self.metrics[new] = dest, self.next_hops[slot], self.metrics[slot]
+        self.flags[new], self.refreshed[new], self.versions[new] = self.flags[slot], self.refreshed[slot], self.versions[slot]
+        self.overflow[dest] = new
+        self.flags[slot] = 0
+
+    def overflow_slot(self):
+        """takes a free slot for a destination of DIRECT_LIMIT or over"""
+        while self.free:
+            slot = self.free.pop()
+            if not self.flags[slot] & USED: # a direct id may have claimed it since it was freed
+                return slot
+        slot = len(self.ids)
+        self.grow(slot + 1)
+        return slot
+
+    def new_slot(self, dest):
+        """takes the slot for a destination with no route yet"""
+        if not 0 <= dest < ID_LIMIT: # checked before anything is touched, so the table is left as it was
+            raise ValueError("Router id {} does not fit in the routing table".format(dest))
+        if dest < DIRECT_LIMIT:
+            slot = dest
+            self.grow(slot + 1)
+            if self.flags[slot] & USED: # an overflow destination is borrowing it
+                self.move(slot)
+            self.ids[slot] = dest
+        else:
+            slot = self.overflow_slot()
+            self.ids[slot] = dest
+            self.overflow[dest] = slot
+        self.flags[slot] = USED
+        self.count += 1
+        return slot
+
+    def set_route(self, dest, next_hop, metric):
+        """sets the route to 'dest' in place, returns True if it changed"""
+        slot = self.slot(dest)
+        if slot < 0:
+            slot = self.new_slot(dest)
+            old = None
+        else:
+            old_hop = self.next_hops[slot]
+            old = (old_hop, self.metrics[slot])
+            if old_hop == next_hop:
+                if old[1] == metric:
+                    return False
+                self.hop_changes[next_hop] = self.hop_changes.get(next_hop, 0) + 1
+            if self.flags[slot] & STALE: # a new route replaces what was restored
+                self.flags[slot] = USED
+                self.stale -= 1
+        self.next_hops[slot] = next_hop
+        self.metrics[slot] = metric
+        self.refreshed[slot] = self.clock()
+        self.version += 1
+        self.versions[slot] = self.version
+        self.journal.append((dest, old, (next_hop, metric)))
+        return True
+
+    def remove(self, dest):
+        """deletes the route to 'dest' and frees its slot"""
+        slot = self.slot(dest)
+        if slot < 0:
+            raise KeyError(dest)
+        if self.flags[slot] & STALE:
+            self.stale -= 1
+        old = (self.next_hops[slot], self.metrics[slot])
+        self.flags[slot] = 0
+        if dest in self.overflow:
+            del self.overflow[dest]
+            self.ids[slot] = -1
+            self.free.append(slot)
+        self.count -= 1
+        self.version += 1
+        self.versions[slot] = self.version
+        self.journal.append((dest, old, None))
+
+    def refresh(self, dest, when=None):
+        """stamps the route to 'dest' as confirmed at 'when' (default now) without changing it"""
+        self.refreshed[self.slot(dest)] = self.clock() if when is None else when
+
+    def refresh_routes(self, dests, next_hop, confirm=True):
+        """stamps every reachable route to one of 'dests' that goes through 'next_hop' as
+        confirmed now, and if 'confirm' clears its stale mark. Called with the destinations
+        of a packet from 'next_hop', so the routes it still advertises keep from timing out."""
+        now = self.clock()
+        ids, next_hops, metrics, flags, refreshed = self.ids, self.next_hops, self.metrics, self.flags, self.refreshed
+        size = len(ids)
+        for dest in dests:
+            if 0 <= dest < size and ids[dest] == dest: # direct slot, no lookup
+                slot = dest
+                if not flags[slot] & USED:
+                    continue
+            else:
+                slot = self.slot(dest)
+                if slot < 0:
+                    continue
+            if next_hops[slot] == next_hop and metrics[slot] < INFINITY:
+                refreshed[slot] = now
+                if confirm and flags[slot] & STALE:
+                    flags[slot] = USED
+                    self.stale -= 1
+
+    def aged(self, timeout_before, garbage_before):
+        """returns (timed out, collectable): the destinations of reachable routes last
+        refreshed before 'timeout_before', and of unreachable routes that have not changed
+        since before 'garbage_before'"""
+        timed_out, collectable = [], []
+        ids, metrics, flags = self.ids, self.metrics, self.flags
+        oldest = max(timeout_before, garbage_before)
+        for slot, stamp in enumerate(self.refreshed):
+            if stamp < oldest and flags[slot] & USED: # most routes are fresher than either limit
+                if metrics[slot] < INFINITY:
+                    if stamp < timeout_before:
+                        timed_out.append(ids[slot])
+                elif stamp < garbage_before:
+                    collectable.append(ids[slot])
+        return timed_out, collectable
+
+    def mark_stale(self, dest):
+        """marks the route to 'dest' as restored from a snapshot and not yet confirmed"""
+        slot = self.slot(dest)
+        if not self.flags[slot] & STALE:
+            self.flags[slot] |= STALE
+            self.stale += 1
+
+    def confirm(self, dest):
+        """clears the stale mark of the route to 'dest', returns True if it had one"""
+        slot = self.slot(dest)
+        if slot < 0 or not self.flags[slot] & STALE:
+            return False
+        self.flags[slot] = USED
+        self.stale -= 1
+        return True
+
+    def is_stale(self, dest):
+        slot = self.slot(dest)
+        return slot >= 0 and self.flags[slot] & STALE != 0
+
+    def next_hop(self, dest):
+        return self[dest][0]
+
+    def metric(self, dest):
+        return self[dest][1]
+
+    def used_slots(self):
+        """yields (destination, slot) for every route in the table"""
+        ids, flags = self.ids, self.flags
+        for slot in range(len(ids)):
+            if flags[slot] & USED:
+                yield ids[slot], slot
+
+    def view_version(self, neighbour):
+        """returns a number that changes whenever the poisoned table sent to 'neighbour' would change"""
+        return self.version - self.hop_changes.get(neighbour, 0)
+
+    def entry_version(self, dest):
+        """returns the version at which the route to 'dest' last changed, 0 if it has not
+        changed since the table was built, or -1 if there is no route"""
+        slot = self.slot(dest)
+        return self.versions[slot] if slot >= 0 else -1
+
+    def changes_since(self, version):
+        """returns a list of (destination, old route, new route) for every route that is
+        different now from what it was at 'version', in the order they first changed. A
+        route is a (next hop, cost) tuple, or None for no route. Raises JournalTruncated if
+        the journal no longer goes back to 'version'."""
+        behind = self.version - version
+        if behind <= 0:
+            return []
+        if behind > len(self.journal):
+            raise JournalTruncated(version)
+        net = {}
+        for dest, old, new in itertools.islice(self.journal, len(self.journal) - behind, None):
+            first = net.get(dest)
+            net[dest] = (old if first is None else first[0], new)
+        return [(dest, old, new) for dest, (old, new) in net.items() if old != new]
+
+    def subscribe(self):
+        """returns a Subscription that reads every change made to the table from now on"""
+        return Subscription(self)
+
+    def __getitem__(self, dest):
+        slot = self.slot(dest)
+        if slot < 0:
+            raise KeyError(dest)
+        return (self.next_hops[slot], self.metrics[slot])
+
+    def __setitem__(self, dest, route):
+        self.set_route(dest, route[0], route[1])
+
+    def __delitem__(self, dest):
+        self.remove(dest)
+
+    def __contains__(self, dest):
+        return self.slot(dest) >= 0
+
+    def __iter__(self):
+        return (dest for dest, _ in self.used_slots())
+
+    def __len__(self):
+        return self.count
+
+    def __eq__(self, other):
+        return dict(self.items()) == dict(other.items())
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def get(self, dest, default=None):
+        slot = self.slot(dest)
+        if slot < 0:
+            return default
+        return (self.next_hops[slot], self.metrics[slot])
+
+    def pop(self, dest, *default):
+        slot = self.slot(dest)
+        if slot >= 0:
+            route = (self.next_hops[slot], self.metrics[slot])
+            self.remove(dest)
+            return route
+        if default:
+            return default[0]
+        raise KeyError(dest)
+
+    def keys(self):
+        return [dest for dest, _ in self.used_slots()]
+
+    def values(self):
+        next_hops, metrics = self.next_hops, self.metrics
+        return [(next_hops[slot], metrics[slot]) for _, slot in self.used_slots()]
+
+    def items(self):
+        next_hops, metrics = self.next_hops, self.metrics
+        return [(dest, (next_hops[slot], metrics[slot])) for dest, slot in self.used_slots()]
+
+    def copy(self):
+        return dict(self.items())
+
+
+class Subscription(object):
+    """
+    Reader of a RoutingTable's change journal. Each read returns the net changes since
+    the last one, so a consumer sees every route that changed exactly once, with what it
+    was when last read and what it is now.
+
+    Attributes:
+    table -- the RoutingTable being followed
+    version -- version of the table at the last read
+
+    Methods:
+    changes -- the (destination, old route, new route) changes since the last read
+    skip -- moves on to now without reading
+    """
+
+    def __init__(self, table):
+        self.table = table
+        self.version = table.version
+
+    def changes(self):
+        """returns the changes since the last read and moves on to now. If the reader fell
+        more than JOURNAL_LIMIT changes behind it still moves on, and JournalTruncated is raised."""
+        version, self.version = self.version, self.table.version
+        return self.table.changes_since(version)
+
+    def skip(self):
+        self.version = self.table.version
@@ -0,0 +1,337 @@
+import heapq
+import itertools
+import random
+from Parser import *
+from routing_daemon import *
+from timer_heap import *
+
+"""In-process network simulator. Runs many RoutingDaemons against an in-memory
+transport on a virtual clock, so hours of RIP run in seconds without sockets."""
+
+BASE_PORT = 10000 # generated routers listen on BASE_PORT + router id, ports never touch the OS
+
+
+class VirtualClock(object):
+    """Clock the simulated daemons' timers run on. Only moves when the simulation advances it."""
+
+    def __init__(self, start=0.0):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryTransport(object):
+    """Stands in for a router's sending socket, handing datagrams to the simulated network.
+
+    Attributes:
+    network -- the Network the datagrams are sent into
+    router_id -- the id of the router sending them
+    """
+
+    def __init__(self, network, router_id):
+        self.network = network
+        self.router_id = router_id
+
+    def sendto(self, data, address):
+        self.network.send(self.router_id, data, address[1])
+        return len(data)
+
+
+class Network(object):
+    """
+    In-memory transport between simulated routers. Datagrams are addressed by port,
+    like the real daemon's, and delivered after the link's delay unless the link is
+    down, either router is dead, or the datagram is lost.
+
+    Attributes:
+    simulation -- the Simulation deliveries are scheduled on
+    ports -- dictionary of input port -> router id
+    delay -- default one way delay in seconds
+    loss -- default probability of losing a datagram
+    links -- dictionary of (sender id, reciever id) -> [delay, loss, up] overriding the defaults
+    random -- random number generator used for losses
+    stats -- counts of datagrams and bytes sent, delivered and dropped
+
+    Methods:
+    set_link -- changes the delay, loss or state of the link in both directions
+    send -- sends a datagram from a router to a port
+    carry -- hands a datagram that made it across its link to the reciever
+    """
+
+    def __init__(self, simulation, delay=0.01, loss=0.0, seed=None):
+        self.simulation = simulation
+        self.ports = {}
+        self.delay = delay
+        self.loss = loss
+        self.links = {}
+        self.random = random.Random(seed)
+        self.stats = {"packets": 0, "bytes": 0, "delivered": 0, "dropped": 0}
+
+    def set_link(self, router_a, router_b, delay=None, loss=None, up=None):
+        """changes the delay, loss or up/down state of the link between two routers in both directions"""
+        for key in ((router_a, router_b), (router_b, router_a)):
+            link = self.links.setdefault(key, [self.delay, self.loss, True])
+            if delay is not None:
+                link[0] = delay
+            if loss is not None:
+                link[1] = loss
+            if up is not None:
+                link[2] = up
+
+    def send(self, sender_id, data, port):
+        """sends a datagram from 'sender_id' to whichever router listens on 'port'"""
+        self.stats["packets"] += 1
+        self.stats["bytes"] += len(data)
+        reciever_id = self.ports.get(port)
+        delay, loss, up = self.links.get((sender_id, reciever_id), (self.delay, self.loss, True))
+        if reciever_id is None or not up or reciever_id in self.simulation.dead or (loss and self.random.random() < loss):
+            self.stats["dropped"] += 1
+            return
+        self.carry(reciever_id, self.simulation.clock.now + delay, data)
+
+    def carry(self, reciever_id, when, data):
+        """schedules the delivery of a datagram to 'reciever_id' at virtual time 'when'"""
+        self.simulation.schedule(when, "deliver", reciever_id, data)
+
+
+class Simulation(object):
+    """
+    Runs a set of RoutingDaemons, built from Config objects, on a virtual clock. Events
+    (datagram deliveries and timer wakeups) are kept in one heap and processed in time
+    order; every daemon's timer heap runs on the same VirtualClock.
+
+    Attributes:
+    config_objects -- dictionary of router id -> Config the routers are built from
+    clock -- the VirtualClock shared by every daemon
+    network -- the in-memory Network connecting the daemons
+    daemons -- dictionary of router id -> RoutingDaemon
+    dead -- set of ids of routers that have been killed
+    events -- heap of (time, sequence, kind, router id, data) events
+    wake_at -- dictionary of router id -> time of its next scheduled timer wakeup
+    last_change -- virtual time at which any routing table last changed
+    changes -- number of route changes made across every daemon
+
+    Methods:
+    start -- starts every router's update timer and sends the first updates
+    schedule -- adds an event to the event heap
+    run -- processes events until the given virtual time
+    run_until_converged -- runs until no routing table has changed for a while
+    kill_router -- stops a router, as if its process had died
+    revive_router -- restarts a killed router with an empty routing table
+    set_link_cost -- changes the metric of the link between two routers
+    routing_tables -- a copy of every live router's routing table
+    """
+    network_class = Network # subclasses can run the daemons over another transport
+
+    def __init__(self, config_objects, delay=0.01, loss=0.0, seed=None):
+        if seed is not None:
+            random.seed(seed) # the daemons draw their update periods and hold-downs from the random module
+        self.config_objects = {config_object.id: config_object for config_object in config_objects}
+        self.clock = VirtualClock()
+        self.network = self.network_class(self, delay, loss, seed)
+        self.daemons = {}
+        self.dead = set()
+        self.events = []
+        self.sequence = itertools.count()
+        self.wake_at = {}
+        self.last_change = 0.0
+        self.changes = 0
+        for config_object in config_objects:
+            for port in config_object.inputs:
+                self.network.ports[port] = config_object.id
+            self.daemons[config_object.id] = self.build_daemon(config_object)
+
+    def build_daemon(self, config_object):
+        """creates a daemon whose timers run on the virtual clock and which sends into the network"""
+        daemon = RoutingDaemon(config_object, self.clock)
+        daemon.sender = MemoryTransport(self.network, config_object.id)
+        return daemon
+
+    def start_daemon(self, daemon):
+        """starts a daemon's update timer and sends its first table"""
+        daemon.start_updates()
+        self.wake(daemon.router_id)
+
+    def start(self):
+        """starts every router"""
+        for daemon in self.daemons.values():
+            self.start_daemon(daemon)
+
+    def schedule(self, when, kind, router_id, data=None):
+        """adds a 'deliver' or 'timer' event for a router to the event heap"""
+        heapq.heappush(self.events, (when, next(self.sequence), kind, router_id, data))
+
+    def wake(self, router_id):
+        """makes sure a timer event is scheduled for the router's next timer deadline"""
+        next_event = self.daemons[router_id].timers.next_deadline()
+        if next_event is None:
+            return
+        deadline = next_event[DEADLINE]
+        scheduled = self.wake_at.get(router_id)
+        if scheduled is None or deadline < scheduled:
+            self.wake_at[router_id] = deadline
+            self.schedule(deadline, "timer", router_id)
+
+    def record_changes(self, changed_routes):
+        if changed_routes:
+            self.changes += len(changed_routes)
+            self.last_change = self.clock.now
+
+    def run(self, until):
+        """processes every event up to virtual time 'until' and leaves the clock there"""
+        events = self.events
+        while events and events[0][0] <= until:
+            when, _, kind, router_id, data = heapq.heappop(events)
+            if router_id in self.dead:
+                continue
+            self.clock.now = when
+            daemon = self.daemons[router_id]
+            if kind == "deliver":
+                self.network.stats["delivered"] += 1
+                if daemon.capture is not None: # as the socket loop captures, before anything can reject it
+                    daemon.capture.write(when, daemon.input_ports[0], data)
+                changed_routes = daemon.handle_packet(data)
+                if changed_routes:
+                    daemon.send_update(changed_routes)
+                self.record_changes(changed_routes)
+            else:
+                if self.wake_at.get(router_id) != when: # superseded by an earlier wakeup
+                    continue
+                del self.wake_at[router_id]
+                self.record_changes(daemon.time_event_handler(when))
+            self.wake(router_id)
+        self.clock.now = max(self.clock.now, until)
+
+    def run_until_converged(self, settle, limit):
+        """runs until no routing table has changed for 'settle' seconds, or until virtual time 'limit'.
+        Returns the time of the last change (which may be before the call), or None if the network had not settled by the limit."""
+        started = self.clock.now
+        while True:
+            settled_at = max(self.last_change, started) + settle
+            self.run(min(settled_at, limit))
+            if self.clock.now >= max(self.last_change, started) + settle: # nothing changed while running to settled_at
+                return self.last_change
+            if self.clock.now >= limit:
+                return None
+
+    def kill_router(self, router_id):
+        """stops a router: it sends nothing, and datagrams to it are dropped"""
+        self.dead.add(router_id)
+        self.wake_at.pop(router_id, None)
+
+    def revive_router(self, router_id):
+        """restarts a killed router from its config, with only itself in its routing table"""
+        self.dead.discard(router_id)
+        daemon = self.build_daemon(self.config_objects[router_id])
+        self.daemons[router_id] = daemon
+        self.start_daemon(daemon)
+
+    def set_link_cost(self, router_a, router_b, metric):
+        """changes the metric of the link between two routers at both ends"""
+        for router_id, neighbour in ((router_a, router_b), (router_b, router_a)):
+            daemon = self.daemons[router_id]
+            for output in daemon.output_ports:
+                if output.id == neighbour:
+                    output.metric = metric
+            if router_id in self.dead:
+                continue
+            changed_routes = daemon.set_link_cost(neighbour, metric)
+            daemon.send_update(changed_routes)
+            self.record_changes(changed_routes)
+            self.wake(router_id)
+
+    def routing_tables(self):
+        """returns a copy of every live router's routing table"""
+        return {router_id: dict(daemon.routing_table) for router_id, daemon in self.daemons.items() if router_id not in self.dead}
+
+
+def build_configs(links, period=30, packet_format="json"):
+    """builds a Config for every router in a list of (router a, router b, metric) links.
+    Router n listens on BASE_PORT + n."""
+    config_objects = {}
+    for router_a, router_b, metric in links:
+        for router_id, neighbour in ((router_a, router_b), (router_b, router_a)):
+            config_object = config_objects.get(router_id)
+            if config_object is None:
+                config_object = Config()
+                config_object.id = router_id
+                config_object.inputs = [BASE_PORT + router_id]
+                config_object.period = period
+                config_object.packet_format = packet_format
+                config_object.infer_timers()
+                config_objects[router_id] = config_object
+            config_object.outputs.append(Output(BASE_PORT + neighbour, metric, neighbour))
+    return [config_objects[router_id] for router_id in sorted(config_objects)]
+
+
+def link_metric(rng, metrics):
+    """draws a link metric from the (lowest, highest) range given"""
+    return rng.randint(metrics[0], metrics[1])
+
+
+def ring_topology(size, metrics=(1, 1), seed=None):
+    """links routers 1..size in a ring, two routers are a single link"""
+    if size < 2:
+        raise ValueError("a ring needs at least 2 routers, not {}".format(size))
+    rng = random.Random(seed)
+    if size == 2: # 1 -> 2 and 2 -> 1 would be the same link twice
+        return [(1, 2, link_metric(rng, metrics))]
+    return [(router_id, router_id % size + 1, link_metric(rng, metrics)) for router_id in range(1, size + 1)]
+
+
+def grid_topology(rows, columns, metrics=(1, 1), seed=None):
+    """links rows x columns routers in a grid, numbered row by row from 1"""
+    rng = random.Random(seed)
+    links = []
+    for row in range(rows):
+        for column in range(columns):
+            router_id = row * columns + column + 1
+            if column + 1 < columns:
+                links.append((router_id, router_id + 1, link_metric(rng, metrics)))
+            if row + 1 < rows:
+                links.append((router_id, router_id + columns, link_metric(rng, metrics)))
+    return links
+
+
+def random_topology(size, degree=3, metrics=(1, 1), seed=None):
+    """links 'size' routers with a random spanning tree, then adds random links until the
+    average degree is roughly 'degree'. Always connected."""
+    rng = random.Random(seed)
+    links = []
+    linked = set()
+    for router_id in range(2, size + 1): # random spanning tree
+        neighbour = rng.randint(1, router_id - 1)
+        links.append((neighbour, router_id, link_metric(rng, metrics)))
+        linked.add((neighbour, router_id))
+    extra = max(0, size * degree // 2 - (size - 1))
+    attempts = 0
+    while extra and attempts < extra * 10:
+        attempts += 1
+        router_a, router_b = sorted(rng.sample(range(1, size + 1), 2))
+        if (router_a, router_b) not in linked:
+            links.append((router_a, router_b, link_metric(rng, metrics)))
+            linked.add((router_a, router_b))
+            extra -= 1
+    return links
+
+
+def scale_free_topology(size, links_per_router=2, metrics=(1, 1), seed=None):
+    """links 'size' routers by preferential attachment (Barabasi-Albert), so a few routers
+    end up with many neighbours"""
+    rng = random.Random(seed)
+    links = []
+    endpoints = [] # every router appears once per link it has, so picking from it favours busy routers
+    first = min(links_per_router + 1, size)
+    for router_a in range(1, first + 1): # start from a small fully linked core
+        for router_b in range(router_a + 1, first + 1):
+            links.append((router_a, router_b, link_metric(rng, metrics)))
+            endpoints += [router_a, router_b]
+    for router_id in range(first + 1, size + 1):
+        neighbours = set()
+        while len(neighbours) < links_per_router:
+            neighbours.add(rng.choice(endpoints))
+        for neighbour in neighbours:
+            links.append((neighbour, router_id, link_metric(rng, metrics)))
+            endpoints += [neighbour, router_id]
+    return links
@@ -0,0 +1,95 @@
+import os
+import sys
+import mmap
+import time
+import struct
+from routing_table import *
+
+"""Snapshots of a router's routing table and neighbours in a fixed layout file, so a
+restarted router can pick up where it left off instead of relearning everything.
+
+Layout, in the byte order of the machine that wrote it (recorded in the header):
+    header     -- SNAPSHOT_HEADER: magic, layout version, byte order, router id, slot count,
+                  neighbour count, time written
+    neighbours -- NEIGHBOUR record per neighbour: id, link cost, port
+    ids, next hops, metrics -- the routing table's slot arrays, 4 bytes a slot each
+    flags      -- the routing table's flags array, 1 byte a slot
+The arrays are written straight out of the RoutingTable with tobytes() and read back
+through memoryviews of the mapped file, so neither side touches a slot in Python except
+the routes actually restored.
+"""
+
+SNAPSHOT_MAGIC = b"RIPS"
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("=4sHHiIId") # 28 bytes, keeps the arrays after it 4 byte aligned
+NEIGHBOUR = struct.Struct("=iiI")
+BYTE_ORDERS = {"little": 1, "big": 2}
+SNAPSHOT_INTERVAL = 30 # seconds between snapshots
+
+
+class SnapshotError(ValueError):
+    # Raised when a snapshot file cannot be read, or is not for this router.
+    pass
+
+
+def write_snapshot(path, router_id, table, output_ports):
+    """writes 'table' and the router's neighbours ('output_ports', a list of Output) to 'path'
+    through a temporary file and a rename, so a reader never sees half a snapshot"""
+    slots = len(table.ids)
+    header = SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, BYTE_ORDERS[sys.byteorder], router_id, slots, len(output_ports), time.time())
+    neighbours = b"".join(NEIGHBOUR.pack(output.id, output.metric, output.port) for output in output_ports)
+    temporary = "{}.{}.tmp".format(path, os.getpid())
+    with open(temporary, "wb") as snapshot_file:
+        snapshot_file.write(header)
+        snapshot_file.write(neighbours)
+        for values in (table.ids, table.next_hops, table.metrics, table.flags):
+            snapshot_file.write(values.tobytes())
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno()) # on disk before it replaces the last good snapshot
+    os.replace(temporary, path)
+
+
+def read_snapshot(path, router_id, max_age=None):
+    """maps the snapshot at 'path' and returns (neighbours, routes): a dictionary of neighbour
+    id -> link cost when the snapshot was written, and a list of (destination, next hop,
+    metric) for every route in it. Raises SnapshotError if the file is damaged, belongs to
+    another router, was written on a machine of the other byte order, or is older than
+    'max_age' seconds."""
+    with open(path, "rb") as snapshot_file:
+        try:
+            mapped = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError: # an empty file cannot be mapped
+            raise SnapshotError("Snapshot {} is empty".format(path))
+    view = memoryview(mapped)
+    arrays = []
+    try:
+        if len(view) < SNAPSHOT_HEADER.size:
+            raise SnapshotError("Snapshot {} is too short".format(path))
+        magic, version, byte_order, snapshot_id, slots, neighbour_count, written = SNAPSHOT_HEADER.unpack_from(view)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+            raise SnapshotError("{} is not a version {} snapshot".format(path, SNAPSHOT_VERSION))
+        if byte_order != BYTE_ORDERS[sys.byteorder]:
+            raise SnapshotError("Snapshot {} was written on a machine of the other byte order".format(path))
+        if snapshot_id != router_id:
+            raise SnapshotError("Snapshot {} is for router {}".format(path, snapshot_id))
+        if max_age is not None and time.time() - written > max_age:
+            raise SnapshotError("Snapshot {} is {:.0f} seconds old".format(path, time.time() - written))
+        offset = SNAPSHOT_HEADER.size + NEIGHBOUR.size * neighbour_count
+        if len(view) != offset + 13 * slots:
+            raise SnapshotError("Snapshot {} is {} bytes, its header says {}".format(path, len(view), offset + 13 * slots))
+        neighbours = {}
+        for neighbour, link_cost, _ in NEIGHBOUR.iter_unpack(view[SNAPSHOT_HEADER.size:offset]):
+            neighbours[neighbour] = link_cost
+        for _ in range(3): # ids, next hops, metrics
+            arrays.append(view[offset:offset + 4 * slots].cast("i"))
+            offset += 4 * slots
+        ids, next_hops, metrics = arrays
+        flags = view[offset:offset + slots]
+        arrays.append(flags)
+        routes = [(ids[slot], next_hops[slot], metrics[slot]) for slot in range(slots) if flags[slot] & USED]
+    finally:
+        for array_view in arrays: # every view must be released before the map can close
+            array_view.release()
+        view.release()
+        mapped.close()
+    return neighbours, routes
@@ -0,0 +1,157 @@
+import pytest
+from Bellman_Ford import *
+from routing_table import *
+from simulator import *
+from routing_daemon import *
+
+"""Checks of the incremental DistanceVector engine and its reverse index."""
+
+ROUTER_ID = 1
+EDGES = {2: 1, 3: 4} # neighbour id -> link cost
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def make_engine(routes=None):
+    table = RoutingTable(dict({ROUTER_ID: (ROUTER_ID, 0)}, **(routes or {})))
+    return DistanceVector(ROUTER_ID, table, dict(EDGES))
+
+
+def advertised(sender, routes):
+    """a recieved table from 'sender' of destination -> metric"""
+    return {dest: (sender, metric) for dest, metric in routes.items()}
+
+
+@pytest.fixture(params=["loop", "vectors"])
+def apply(request):
+    """applies a recieved table with the plain loop, and again with the NumPy kernel"""
+    if request.param == "vectors" and numpy is None:
+        pytest.skip("NumPy is not installed")
+    def apply(engine, sender, routes):
+        recieved = advertised(sender, routes)
+        if request.param == "vectors":
+            return engine.apply_vectors(*table_vectors(recieved), sender)
+        return engine.apply(recieved, sender)
+    return apply
+
+
+def check_via(engine):
+    """the reverse index holds exactly the destinations routed through each next hop"""
+    expected = {}
+    for dest, (next_hop, _) in engine.table.items():
+        expected.setdefault(next_hop, set()).add(dest)
+    assert {hop: dests for hop, dests in engine.via.items() if dests} == expected
+
+
+def test_learns_routes(apply):
+    engine = make_engine()
+    changed = apply(engine, 2, {5: 2, 6: 15, 7: 16})
+    assert sorted(changed) == [2, 5]
+    assert engine.table[5] == (2, 3)
+    assert engine.table[2] == (2, 1)
+    assert 6 not in engine.table and 7 not in engine.table # 15 + 1 is unreachable, and nothing is learnt at 16
+    check_via(engine)
+
+
+def test_cheaper_route_replaces(apply):
+    engine = make_engine()
+    apply(engine, 3, {5: 1})
+    assert engine.table[5] == (3, 5)
+    assert sorted(apply(engine, 2, {5: 2})) == [2, 5] # the first word from 2 also routes to it
+    assert engine.table[5] == (2, 3)
+    assert engine.routes_via(3) == {3}
+    check_via(engine)
+
+
+def test_equal_or_dearer_route_is_ignored(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 3})
+    apply(engine, 3, {5: 0}) # 4 through 3, the same as 3 + 1 through 2
+    assert engine.table[5] == (2, 4)
+
+
+def test_current_next_hop_raises_metric(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 1})
+    assert apply(engine, 2, {5: 6}) == [5]
+    assert engine.table[5] == (2, 7) # believed even though it is worse
+    assert apply(engine, 2, {5: 6}) == [] # and repeating it is no change
+
+
+def test_withdrawn_route(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 1, 6: 1})
+    assert apply(engine, 2, {5: 16, 6: 1}) == [5]
+    assert engine.table[5] == (2, INFINITY)
+    assert engine.table[6] == (2, 2)
+    apply(engine, 3, {5: 1}) # any other route is better than an unreachable one
+    assert engine.table[5] == (3, 5)
+    check_via(engine)
+
+
+def test_withdrawal_from_another_neighbour_is_ignored(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 1})
+    assert apply(engine, 3, {5: 16}) == [3]
+    assert engine.table[5] == (2, 2)
+
+
+def test_own_and_sender_routes_are_skipped(apply):
+    engine = make_engine()
+    apply(engine, 2, {ROUTER_ID: 1, 2: 5})
+    assert engine.table[ROUTER_ID] == (ROUTER_ID, 0)
+    assert engine.table[2] == (2, 1)
+
+
+def test_not_a_neighbour(apply):
+    engine = make_engine()
+    assert apply(engine, 9, {5: 1}) == []
+    assert 5 not in engine.table
+
+
+def test_neighbour_down_invalidates_only_its_routes(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 1, 6: 1})
+    apply(engine, 3, {7: 1})
+    assert sorted(engine.neighbour_down(2)) == [2, 5, 6]
+    assert [engine.table[dest] for dest in (2, 5, 6)] == [(2, INFINITY)] * 3
+    assert engine.table[7] == (3, 5) and engine.table[3] == (3, 4)
+    assert engine.neighbour_down(2) == [] # already unreachable
+    check_via(engine)
+
+
+def test_remove_route_poisons_routes_through_it(apply):
+    engine = make_engine()
+    apply(engine, 2, {5: 1})
+    assert sorted(engine.remove_route(2)) == [2, 5]
+    assert 2 not in engine.table
+    assert engine.table[5] == (2, INFINITY)
+
+
+def test_link_cost_changed(apply):
+    engine = make_engine()
+    apply(engine, 3, {5: 1, 6: 15})
+    assert sorted(engine.link_cost_changed(3, 2)) == [3, 5]
+    assert engine.table[5] == (3, 3) and engine.table[3] == (3, 2)
+    assert engine.link_cost_changed(3, 2) == []
+    check_via(engine)
+
+
+def test_direct_route_to_neighbour_is_not_pinned(apply):
+    engine = make_engine()
+    apply(engine, 2, {3: 1}) # 3 is cheaper through 2 (1 + 1) than over its own link (4)
+    assert engine.table[3] == (2, 2)
+    apply(engine, 3, {5: 1})
+    assert engine.table[3] == (2, 2)
+    assert engine.table[5] == (3, 5)
+
+
+def test_poison_reverse():
+    sim = Simulation(build_configs([(1, 2, 1), (2, 3, 1)], 30), seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    daemon = sim.daemons[2]
+    sent = {}
+    for datagram in daemon.serialize(daemon.routing_table, 1):
+        sent.update({entry.router_id: entry.metric for entry in Packet.from_bytes(datagram).entries})
+    assert sent == {1: INFINITY, 2: 0, 3: 1} # the route to 1 goes through 1 itself
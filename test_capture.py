@@ -0,0 +1,84 @@
+import pytest
+from capture import *
+from replay import *
+from simulator import *
+from routing_daemon import *
+
+"""Checks of writing and reading capture logs, and of replaying one captured on the simulator."""
+
+RECORDS = [(10.0, 6001, b"first"), (10.5, 6002, b""), (11.25, 6001, b"\x02\x02\x00\x07" + b"\x00" * 20)]
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def written(path, router_id=7, records=RECORDS):
+    writer = CaptureWriter(str(path), router_id)
+    for when, port, data in records:
+        writer.write(when, port, data)
+    writer.close()
+    return str(path)
+
+
+def read_back(path):
+    router_id, records = read_capture(path)
+    return router_id, [(when, port, bytes(data)) for when, port, data in records]
+
+
+def test_round_trip(tmp_path):
+    path = written(tmp_path / "router7.capture")
+    assert read_back(path) == (7, RECORDS)
+
+
+def test_appended_capture_carries_on_in_time(tmp_path):
+    path = written(tmp_path / "router7.capture")
+    written(path, records=[(2.0, 6001, b"after a restart"), (3.0, 6001, b"again")]) # a new monotonic clock
+    _, records = read_back(path)
+    assert [when for when, _, _ in records] == [10.0, 10.5, 11.25, 11.25, 12.25]
+    assert records[-1][2] == b"again"
+
+
+def test_capture_of_another_router(tmp_path):
+    path = written(tmp_path / "router7.capture")
+    with pytest.raises(CaptureError):
+        CaptureWriter(path, 8)
+
+
+def test_partial_last_record_is_left_out(tmp_path):
+    path = written(tmp_path / "router7.capture")
+    with open(path, "rb+") as capture_file:
+        capture_file.truncate(capture_file.seek(0, 2) - 1)
+    assert read_back(path) == (7, RECORDS[:-1])
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: b"", # empty
+    lambda data: data[:CAPTURE_HEADER.size - 1], # not even a header
+    lambda data: b"JUNK" + data[4:], # not a capture log
+    lambda data: data[:4] + struct.pack("!H", CAPTURE_VERSION + 1) + data[6:], # another layout version
+])
+def test_corrupt_log(tmp_path, damage):
+    path = written(tmp_path / "router7.capture")
+    with open(path, "rb") as capture_file:
+        data = capture_file.read()
+    with open(path, "wb") as capture_file:
+        capture_file.write(damage(data))
+    with pytest.raises(CaptureError):
+        read_capture(path)
+
+
+def test_replay_of_simulated_capture(tmp_path):
+    path = str(tmp_path / "router3.capture")
+    sim = Simulation(build_configs([(1, 2, 1), (2, 3, 2), (3, 4, 1), (1, 4, 5), (2, 4, 1)]), seed=1)
+    captured = sim.daemons[3]
+    captured.start_capture(path)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    captured.stop_capture()
+    router_id, records = read_capture(path)
+    assert router_id == 3 and len(records) > 0
+    assert all(port == BASE_PORT + 3 for _, port, _ in records)
+    clock = VirtualClock(records[0][0])
+    daemon = build_daemon(sim.config_objects[3], clock)
+    replay(daemon, clock, records)
+    assert table_digest(daemon.routing_table) == table_digest(captured.routing_table)
+    assert daemon.drop_stats["malformed"] == 0
@@ -0,0 +1,76 @@
+import random
+import pytest
+from forwarding import *
+
+"""Checks of ForwardingTable lookups against a plain longest prefix match."""
+
+
+def plain_lookup(routes, address):
+    """the next hop of the longest of 'routes' covering 'address', or NO_ROUTE"""
+    best = None
+    for prefix, length, next_hop in routes:
+        mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+        if address & mask == prefix and (best is None or length > best[0]):
+            best = (length, next_hop)
+    return NO_ROUTE if best is None else best[1]
+
+
+def route(text, next_hop):
+    address, length = text.split("/")
+    return (parse_address(address), int(length), next_hop)
+
+
+# Prefixes nested inside each other at every level of the trie, and one on each boundary.
+NESTED = [route("0.0.0.0/0", 1), route("10.0.0.0/8", 2), route("10.1.0.0/16", 3), route("10.1.2.0/23", 4),
+          route("10.1.2.0/24", 5), route("10.1.2.128/25", 6), route("10.1.2.129/32", 7), route("192.168.0.0/17", 8)]
+
+
+@pytest.mark.parametrize("text, next_hop", [
+    ("10.1.2.129", 7), ("10.1.2.130", 6), ("10.1.2.1", 5), ("10.1.3.1", 4), ("10.1.4.1", 3),
+    ("10.2.0.0", 2), ("11.0.0.0", 1), ("192.168.127.255", 8), ("192.168.128.0", 1)])
+def test_nested_prefixes(text, next_hop):
+    table = ForwardingTable(NESTED)
+    assert table.lookup_one(parse_address(text)) == next_hop
+
+
+def test_order_of_routes_does_not_matter():
+    shuffled = list(NESTED)
+    random.Random(1).shuffle(shuffled)
+    addresses = [parse_address(text) for text in ("10.1.2.129", "10.1.2.1", "10.1.3.1", "11.0.0.0")]
+    assert ForwardingTable(shuffled).lookup(addresses) == ForwardingTable(NESTED).lookup(addresses)
+
+
+def test_empty_table():
+    table = ForwardingTable()
+    assert len(table) == 0
+    assert table.lookup_one(parse_address("10.0.0.1")) == NO_ROUTE
+    assert table.lookup([0, 0xFFFFFFFF]) == [NO_ROUTE, NO_ROUTE]
+
+
+def test_random_prefixes_match_plain_lookup():
+    rng = random.Random(2)
+    routes = {}
+    for _ in range(300):
+        length = rng.choice([0, 4, 8, 12, 15, 16, 17, 20, 23, 24, 25, 28, 31, 32])
+        prefix = rng.getrandbits(32) & ((0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF)
+        routes[(prefix, length)] = rng.randint(1, 20)
+    routes = [(prefix, length, next_hop) for (prefix, length), next_hop in routes.items()]
+    addresses = [rng.getrandbits(32) for _ in range(2000)]
+    addresses += [prefix | (rng.getrandbits(32) & ((1 << (32 - length)) - 1)) for prefix, length, _ in routes]
+    table = ForwardingTable(routes)
+    expected = [plain_lookup(routes, address) for address in addresses]
+    assert [table.lookup_one(address) for address in addresses] == expected
+    assert table.lookup(addresses) == expected
+    if numpy is not None:
+        assert table.lookup(numpy.array(addresses, dtype=numpy.uint32)).tolist() == expected
+
+
+@pytest.mark.parametrize("text", ["0.0.0.0", "10.1.2.3", "255.255.255.255"])
+def test_address_round_trip(text):
+    assert format_address(parse_address(text)) == text
+
+
+@pytest.mark.parametrize("text", ["10.1.2", "10.1.2.256", "10.1.2.3.4"])
+def test_bad_address(text):
+    with pytest.raises(ValueError):
+        parse_address(text)
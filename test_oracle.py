@@ -0,0 +1,91 @@
+import pytest
+import oracle
+from simulator import *
+from routing_daemon import *
+from oracle import Reference, verify, verify_simulation
+
+"""Checks of the shortest path oracle, and of simulated networks converging to what it says."""
+
+# Router 1's direct link to 2 costs more than the path through 3, so its route to 2 must
+# go through 3 even though 2 sends it updates directly.
+UNEQUAL_LINKS = [(1, 2, 10), (1, 3, 1), (3, 2, 1), (2, 4, 1), (4, 5, 3), (3, 5, 7)]
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+@pytest.fixture(params=[True, False], ids=["numpy", "plain"])
+def kernel(request, monkeypatch):
+    """runs a test with the NumPy kernels of the oracle, and again with the pure Python ones"""
+    if request.param and oracle.numpy is None:
+        pytest.skip("NumPy is not installed")
+    if not request.param:
+        monkeypatch.setattr(oracle, "numpy", None)
+    return request.param
+
+
+def converged_simulation(links, adaptive=False):
+    sim = Simulation(build_configs(links, 30), seed=1)
+    for daemon in sim.daemons.values():
+        daemon.adaptive_updates = adaptive
+    sim.start()
+    assert sim.run_until_converged(60, 5000) is not None
+    return sim
+
+
+def test_reference_costs(kernel):
+    reference = Reference(build_configs(UNEQUAL_LINKS))
+    assert reference.cost(1, 2) == 2
+    assert reference.cost(1, 5) == 6
+    assert reference.cost(5, 1) == 6
+    assert reference.cost(3, 3) == 0
+
+
+def test_reference_dead_router_and_down_link(kernel):
+    reference = Reference(build_configs(UNEQUAL_LINKS), dead=[3], down_links=[(2, 4)])
+    assert reference.cost(1, 2) == 10
+    assert reference.cost(1, 5) == INFINITY
+    assert 3 not in reference.index
+
+
+def test_diff_finds_each_problem(kernel):
+    configs = build_configs(UNEQUAL_LINKS)
+    right = {1: (1, 0), 2: (3, 2), 3: (3, 1), 4: (3, 3), 5: (3, 6)}
+    assert verify(configs, {1: right}) == []
+    wrong = dict(right)
+    wrong[2] = (2, 10) # the direct link, not the shortest path
+    wrong[4] = (2, 3) # the right cost through a neighbour that cannot give it
+    del wrong[5]
+    wrong[9] = (3, 1)
+    problems = {dest: problem for _, dest, _, _, problem in verify(configs, {1: wrong})}
+    assert problems == {2: "cost", 4: "next hop", 5: "missing", 9: "unknown"}
+
+
+@pytest.mark.parametrize("adaptive", [False, True], ids=["periodic", "adaptive"])
+def test_unequal_costs_converge_to_shortest_paths(adaptive):
+    sim = converged_simulation(UNEQUAL_LINKS, adaptive)
+    assert sim.daemons[1].routing_table[2] == (3, 2)
+    for _ in range(4): # the route to a neighbour must not flap back onto the direct link at its next update
+        sim.run(sim.clock.now + 30)
+        assert verify_simulation(sim) == []
+
+
+@pytest.mark.parametrize("adaptive", [False, True], ids=["periodic", "adaptive"])
+def test_router_death_converges(adaptive):
+    sim = converged_simulation(UNEQUAL_LINKS, adaptive)
+    sim.kill_router(3)
+    assert sim.run_until_converged(400, sim.clock.now + 5000) is not None
+    assert sim.daemons[1].routing_table[2] == (2, 10)
+    assert verify_simulation(sim) == []
+
+
+def test_cheaper_link_converges_without_waiting_for_a_full_table():
+    sim = converged_simulation(UNEQUAL_LINKS, adaptive=True)
+    sim.run(sim.clock.now + 300) # stable long enough for full tables to be stretched out
+    sim.set_link_cost(1, 2, 1)
+    sim.run(sim.clock.now + 10) # time for the triggered updates, not for the next full table
+    assert verify_simulation(sim) == []
+
+
+def test_random_topology_converges():
+    sim = converged_simulation(random_topology(30, 3, (1, 5), seed=4))
+    assert verify_simulation(sim) == []
@@ -0,0 +1,116 @@
+import json
+import pytest
+from packet_class import *
+
+"""Round trips of Packet through both wire formats."""
+
+
+def make_packet(rid, command=RESPONSE):
+    entries = [RipEntry('AF_INET', router_id, metric) for router_id, metric in ((2, 1), (70000, 3), (1 << 20, 16))]
+    prefixes = [PrefixEntry('AF_INET', 0x0A000000, 8, 2, 1), PrefixEntry('AF_INET', 0xC0A80100, 24, 70000, 4)]
+    return Packet(command, 2, rid, entries, prefixes)
+
+
+def summary(packet):
+    return (packet.command, packet.version, packet.rid, packet.keepalive,
+            [(entry.router_id, entry.metric) for entry in packet.entries],
+            [(entry.prefix, entry.length, entry.origin, entry.metric) for entry in packet.prefixes])
+
+
+@pytest.mark.parametrize("packet_format", FORMATS)
+@pytest.mark.parametrize("rid", [1, HEADER_ID_LIMIT, HEADER_ID_LIMIT + 1, 70000, ID_LIMIT - 1])
+def test_round_trip(packet_format, rid):
+    packet = make_packet(rid)
+    assert summary(Packet.from_bytes(packet.to_bytes(packet_format))) == summary(packet)
+
+
+def test_small_router_id_stays_in_header():
+    packet = make_packet(7)
+    assert len(packet.to_binary()) == HEADER.size + ENTRY.size * (len(packet.entries) + len(packet.prefixes))
+
+
+def test_large_router_id_takes_a_leading_entry():
+    packet = Packet(RESPONSE, 2, 70000, [])
+    data = packet.to_binary()
+    assert len(data) == HEADER.size + ENTRY.size
+    decoded = Packet.from_bytes(data)
+    assert decoded.rid == 70000 and decoded.entries == [] and decoded.prefixes == []
+
+
+@pytest.mark.parametrize("packet_format", FORMATS)
+def test_request_round_trip(packet_format):
+    packet = Packet(REQUEST, 2, 70000, [])
+    assert summary(Packet.from_bytes(packet.to_bytes(packet_format))) == (REQUEST, 2, 70000, False, [], [])
+
+
+@pytest.mark.parametrize("packet_format", FORMATS)
+@pytest.mark.parametrize("rid", [7, 70000])
+def test_keepalive_round_trip(packet_format, rid):
+    packet = Packet(RESPONSE, 2, rid, [], keepalive=True)
+    assert summary(Packet.from_bytes(packet.to_bytes(packet_format))) == (RESPONSE, 2, rid, True, [], [])
+
+
+@pytest.mark.parametrize("packet_format", FORMATS)
+def test_empty_packets_are_not_keepalives(packet_format):
+    prefixes_only = Packet(RESPONSE, 2, 7, [], [PrefixEntry('AF_INET', 0x0A000000, 8, 2, 1)])
+    for packet in (Packet(RESPONSE, 2, 7, []), prefixes_only):
+        assert not Packet.from_bytes(packet.to_bytes(packet_format)).keepalive
+
+
+@pytest.mark.parametrize("data", [b"", b"\x02\x02", b"\x02\x02\x00\x01" + b"\x00" * 19, b"{not json", b'{"entries": []}'])
+def test_malformed(data):
+    with pytest.raises(PacketError):
+        Packet.from_bytes(data)
+
+
+def binary_packet(rid, records):
+    """a binary datagram from 'rid' with the raw (tag, address, mask, next hop, metric) 'records'"""
+    data = HEADER.pack(RESPONSE, 2, rid)
+    return data + b"".join(ENTRY.pack(AF_INET, tag, address, mask, next_hop, metric) for tag, address, mask, next_hop, metric in records)
+
+
+@pytest.mark.parametrize("records", [
+    [(0, ID_LIMIT + 5, 0, 0, 1)], # a destination too large for the routing table
+    [(0, 0, 0, 0, 1)], # router id 0
+    [(0, 3, 0, 0, 17)], # a metric above infinity
+    [(0, 3, 0, 0, 1), (PREFIX_TAG, 0x0A000000, 0xFF000000, ID_LIMIT, 1)], # a prefix of a router id too large
+    [(ROUTER_ID_TAG, ID_LIMIT, 0, 0, 0)], # a wide sending router id too large
+])
+def test_hostile_binary(records):
+    with pytest.raises(PacketError):
+        Packet.from_bytes(binary_packet(0 if records[0][0] == ROUTER_ID_TAG else 2, records))
+
+
+def json_packet(entries=(), prefixes=(), rid=2):
+    """a JSON datagram from 'rid' with the raw entry and prefix dictionaries given"""
+    return json.dumps({'command': RESPONSE, 'version': 2, 'rid': rid, 'entries': [json.dumps(entry) for entry in entries],
+                       'prefixes': [json.dumps(entry) for entry in prefixes]}).encode()
+
+
+def test_plain_json_accepted():
+    packet = Packet.from_bytes(json_packet([{'addr_identifier': 'AF_INET', 'router_id': 3, 'metric': 1}]))
+    assert [(entry.router_id, entry.metric) for entry in packet.entries] == [(3, 1)]
+
+
+@pytest.mark.parametrize("data", [
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': "x", 'metric': 1}]),
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': 3, 'metric': "1"}]),
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': 3.5, 'metric': 1}]),
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': True, 'metric': 1}]),
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': 1 << 31, 'metric': 1}]),
+    json_packet([{'addr_identifier': 'AF_INET', 'router_id': 3, 'metric': -1}]),
+    json_packet(prefixes=[{'addr_identifier': 'AF_INET', 'prefix': 1 << 32, 'length': 8, 'origin': 3, 'metric': 1}]),
+    json_packet(prefixes=[{'addr_identifier': 'AF_INET', 'prefix': 0, 'length': 33, 'origin': 3, 'metric': 1}]),
+    json_packet(prefixes=[{'addr_identifier': 'AF_INET', 'prefix': 0, 'length': 8, 'origin': None, 'metric': 1}]),
+    json_packet(rid="2"),
+])
+def test_hostile_json(data):
+    with pytest.raises(PacketError):
+        Packet.from_bytes(data)
+
+
+def test_non_contiguous_mask():
+    data = bytearray(make_packet(1).to_binary())
+    ENTRY.pack_into(data, HEADER.size + ENTRY.size * 3, AF_INET, PREFIX_TAG, 0x0A000000, 0xFF00FF00, 2, 1)
+    with pytest.raises(PacketError):
+        Packet.from_bytes(bytes(data))
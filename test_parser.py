@@ -0,0 +1,38 @@
+import pytest
+from Parser import *
+
+"""Checks of config file parsing."""
+
+BASE = ["router-id 1", "input-ports 6001", "outputs 5002-1-2"]
+
+
+def load(tmp_path, lines):
+    path = tmp_path / "router.conf"
+    path.write_text("\n".join(lines) + "\n")
+    return load_config(str(path))
+
+
+def test_defaults(tmp_path):
+    config = load(tmp_path, BASE)
+    assert (config.id, config.inputs, config.packet_format) == (1, [6001], "json")
+    assert (config.period, config.timeout, config.garbage) == (30, 180, 240)
+
+
+@pytest.mark.parametrize("line", ["router-id 3", "input-ports 6002", "outputs 5003-1-3", "packet-format binary"])
+def test_duplicate_line(tmp_path, line):
+    lines = BASE + ["packet-format json"] + [line]
+    with pytest.raises(ConfigError) as error:
+        load(tmp_path, lines)
+    assert ConfigError.EXISTS_ERROR in str(error.value)
+
+
+@pytest.mark.parametrize("rid, message", [("0", RouterIdError.NEGATIVE_ERROR), ("-3", RouterIdError.NEGATIVE_ERROR),
+                                          (str(ID_LIMIT), RouterIdError.RANGE_ERROR)])
+def test_router_id_range(tmp_path, rid, message):
+    with pytest.raises(ConfigError) as error:
+        load(tmp_path, ["router-id " + rid] + BASE[1:])
+    assert message in str(error.value)
+
+
+def test_largest_router_id(tmp_path):
+    assert load(tmp_path, ["router-id {}".format(ID_LIMIT - 1)] + BASE[1:]).id == ID_LIMIT - 1
@@ -0,0 +1,75 @@
+from simulator import *
+from routing_daemon import *
+
+"""Checks of learning, aging and advertising the prefixes attached to routers."""
+
+LINE = [(1, 2, 1), (2, 3, 1), (3, 4, 1)]
+KEPT = (0x0A000000, 8) # 10.0.0.0/8
+DROPPED = (0xC0A80000, 16) # 192.168.0.0/16
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def converged_line(networks=(KEPT, DROPPED)):
+    """a converged line of routers with 'networks' attached to router 4"""
+    config_objects = build_configs(LINE)
+    config_objects[3].networks = list(networks)
+    sim = Simulation(config_objects, seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    return sim
+
+
+def origins_sent(datagrams):
+    return {entry.origin for datagram in datagrams for entry in Packet.from_bytes(datagram).prefixes}
+
+
+def test_prefixes_are_learnt_along_the_line():
+    sim = converged_line()
+    for router_id in (1, 2, 3):
+        daemon = sim.daemons[router_id]
+        assert set(daemon.origin_prefixes[4]) == {KEPT, DROPPED}
+        assert daemon.forwarding.lookup_one(DROPPED[0] + 1) == daemon.routing_table[4][0]
+
+
+def test_dropped_prefix_is_forgotten():
+    sim = converged_line()
+    config_object = build_configs(LINE)[3]
+    config_object.networks = [KEPT]
+    sim.daemons[4].reload_config(config_object)
+    versions = {router_id: sim.daemons[router_id].prefix_version for router_id in (1, 2, 3)}
+    sim.run(sim.clock.now + 3 * (sim.daemons[1].timeout[0] + 60)) # a timeout for each router along the line
+    for router_id in (1, 2, 3):
+        daemon = sim.daemons[router_id]
+        assert set(daemon.origin_prefixes[4]) == {KEPT}
+        assert daemon.prefix_version > versions[router_id]
+        assert daemon.forwarding.lookup_one(DROPPED[0] + 1) == NO_ROUTE
+        assert daemon.forwarding.lookup_one(KEPT[0] + 1) == daemon.routing_table[4][0]
+
+
+def test_only_next_hop_speaks_for_prefixes():
+    sim = converged_line(networks=[KEPT])
+    daemon = sim.daemons[2] # routes to 4 through 3
+    version = daemon.prefix_version
+    daemon.learn_prefixes([PrefixEntry('AF_INET', DROPPED[0], DROPPED[1], 4, 3)], 1)
+    assert set(daemon.origin_prefixes[4]) == {KEPT} and daemon.prefix_version == version
+    daemon.learn_prefixes([PrefixEntry('AF_INET', DROPPED[0], DROPPED[1], 4, 2)], 3)
+    assert set(daemon.origin_prefixes[4]) == {KEPT, DROPPED} and daemon.prefix_version == version + 1
+
+
+def test_prefixes_of_routes_through_neighbour_are_not_sent_to_it():
+    sim = converged_line()
+    daemon = sim.daemons[2]
+    origins = lambda destination: {entry.origin for entry in daemon.prefix_entries(destination)}
+    assert origins(1) == {4} and origins(3) == set()
+
+
+def test_cache_follows_route_through_neighbour_going_unreachable():
+    sim = converged_line()
+    daemon = sim.daemons[2]
+    daemon.encoded_table(3)
+    daemon.engine.apply({4: (3, INFINITY)}, 3) # 3 withdraws the route to 4
+    assert daemon.routing_table[4] == (3, INFINITY)
+    assert daemon.encoded_table(3) == daemon.serialize(daemon.routing_table, 3)
+    assert daemon.encoded_table(1) == daemon.serialize(daemon.routing_table, 1)
+    assert origins_sent(daemon.encoded_table(1)) == set()
@@ -0,0 +1,119 @@
+from simulator import *
+from routing_daemon import *
+from oracle import verify_simulation
+
+"""Checks of reloading a running router's config on the simulator."""
+
+TRIANGLE = [(1, 2, 1), (2, 3, 1), (1, 3, 5)]
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+class Recorder(object):
+    """Wraps a daemon's transport, keeping every datagram it sends as (port, packet)"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.sent = []
+
+    def sendto(self, data, address):
+        self.sent.append((address[1], Packet.from_bytes(data)))
+        return self.transport.sendto(data, address)
+
+
+def converged(links):
+    sim = Simulation(build_configs(links), seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    assert verify_simulation(sim) == []
+    return sim
+
+
+def reconfigure(sim, links, router_ids=None):
+    """reloads the routers in 'router_ids' (default all) with the configs built from 'links',
+    recording what each sends. Returns the changed destinations and recorders of each router."""
+    changed, recorders = {}, {}
+    for config_object in build_configs(links):
+        router_id = config_object.id
+        if router_ids is not None and router_id not in router_ids:
+            continue
+        daemon = sim.daemons[router_id]
+        daemon.sender = recorders[router_id] = Recorder(daemon.sender)
+        sim.config_objects[router_id] = config_object
+        changed[router_id] = daemon.reload_config(config_object)
+        sim.record_changes(changed[router_id])
+        sim.wake(router_id)
+    return changed, recorders
+
+
+def test_neighbour_added():
+    sim = converged(TRIANGLE[:2])
+    changed, recorders = reconfigure(sim, TRIANGLE)
+    assert changed[1] == [] and sim.daemons[1].edges == {2: 1, 3: 5}
+    full_tables = [packet for port, packet in recorders[1].sent if port == BASE_PORT + 3]
+    assert {entry.router_id for packet in full_tables for entry in packet.entries} == {1, 2, 3} # straight away
+    sim.run_until_converged(60, sim.clock.now + 1000)
+    assert verify_simulation(sim) == []
+    assert sim.daemons[1].routing_table[3] == (2, 2) # still cheaper through 2
+
+
+def test_neighbour_removed():
+    sim = converged([(1, 2, 1), (2, 3, 1), (1, 3, 1)])
+    changed, _ = reconfigure(sim, [(1, 2, 1), (2, 3, 1)])
+    assert 3 in changed[1] and 3 not in sim.daemons[1].edges
+    assert sim.daemons[1].routing_table[3] == (3, INFINITY) # lost at once, not after a timeout
+    assert ("neighbour", 3) not in sim.daemons[1].timers
+    sim.run_until_converged(60, sim.clock.now + 1000)
+    assert verify_simulation(sim) == []
+    assert sim.daemons[1].routing_table[3] == (2, 2)
+
+
+def test_dearer_link_moves_routes():
+    sim = converged(TRIANGLE)
+    changed, recorders = reconfigure(sim, [(1, 2, 5), (2, 3, 1), (1, 3, 5)])
+    assert sorted(changed[1]) == [2, 3] and sim.daemons[1].routing_table[3] == (2, 6)
+    assert all(packet.command == RESPONSE for _, packet in recorders[1].sent) # nothing new to ask 2 for
+    sim.run_until_converged(60, sim.clock.now + 1000)
+    assert verify_simulation(sim) == []
+    assert sim.daemons[1].routing_table[3] == (3, 5)
+
+
+def test_cheaper_link_asks_for_table():
+    sim = converged(TRIANGLE)
+    changed, recorders = reconfigure(sim, [(1, 2, 1), (2, 3, 1), (1, 3, 1)], [1])
+    assert changed[1] == [] and sim.daemons[1].routing_table[3] == (2, 2) # nothing goes through 3 yet
+    requests = [port for port, packet in recorders[1].sent if packet.command == REQUEST]
+    assert requests == [BASE_PORT + 3] # so 3 is asked rather than waiting for its next full table
+    sim.run(sim.clock.now + 0.1)
+    assert sim.daemons[1].routing_table[3] == (3, 1)
+    reconfigure(sim, [(1, 2, 1), (2, 3, 1), (1, 3, 1)], [3])
+    sim.run_until_converged(60, sim.clock.now + 1000)
+    assert verify_simulation(sim) == []
+
+
+def snapshot_of(daemon):
+    return (daemon.config_object, dict(daemon.edges), list(daemon.outputs), dict(daemon.routing_table.items()),
+            daemon.routing_table.version, daemon.timers.timers())
+
+
+def test_other_router_id_is_rejected(monkeypatch):
+    monkeypatch.setattr(EVENT_LOG, "level", ERROR + 1) # the rejection is logged as an error
+    sim = converged(TRIANGLE)
+    daemon = sim.daemons[1]
+    before = snapshot_of(daemon)
+    daemon.sender = recorder = Recorder(daemon.sender)
+    assert daemon.reload_config(build_configs([(4, 2, 1), (4, 3, 1)])[2]) == []
+    assert snapshot_of(daemon) == before and recorder.sent == []
+
+
+def test_unreadable_config_is_rejected(tmp_path, monkeypatch):
+    monkeypatch.setattr(EVENT_LOG, "level", ERROR + 1)
+    sim = converged(TRIANGLE)
+    daemon = sim.daemons[1]
+    path = tmp_path / "router.conf"
+    path.write_text("router-id 1\ninput-ports 6001\noutputs 6002-20-2\n") # metric out of range
+    daemon.config_source = lambda: load_config(str(path))
+    before = snapshot_of(daemon)
+    daemon.sender = recorder = Recorder(daemon.sender)
+    assert daemon.handle_command("reload").startswith("error")
+    assert snapshot_of(daemon) == before and recorder.sent == []
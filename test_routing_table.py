@@ -0,0 +1,225 @@
+import pytest
+from routing_table import *
+from simulator import *
+from routing_daemon import *
+
+"""Checks of RoutingTable slot allocation, aging and change journal."""
+
+WIDE = DIRECT_LIMIT + 5 # an id that has to go through the overflow dictionary
+TIMEOUT, GARBAGE = 180, 240
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def check_slots(table):
+    """every route is found through its slot, and the slot bookkeeping agrees with the routes"""
+    for dest, route in table.items():
+        slot = table.slot(dest)
+        assert table.ids[slot] == dest and table.flags[slot] & USED
+        assert (table.next_hops[slot], table.metrics[slot]) == route
+    assert len(table) == table.count == sum(1 for flags in table.flags if flags & USED)
+
+
+def test_direct_ids_use_their_own_slot():
+    table = RoutingTable({1: (1, 0)})
+    assert table.set_route(7, 2, 3)
+    assert table.slot(7) == 7 and table.overflow == {}
+    assert table[7] == (2, 3) and 5 not in table
+    check_slots(table)
+
+
+def test_overflow_ids():
+    table = RoutingTable({1: (1, 0)})
+    table.set_route(WIDE, 2, 3)
+    table.set_route(ID_LIMIT - 1, 2, 4)
+    assert set(table.overflow) == {WIDE, ID_LIMIT - 1}
+    assert table[WIDE] == (2, 3) and table[ID_LIMIT - 1] == (2, 4)
+    assert len(table.ids) < 10 # no slot is reserved below them
+    check_slots(table)
+
+
+@pytest.mark.parametrize("dest", [ID_LIMIT, -2])
+def test_id_out_of_range_leaves_table_untouched(dest):
+    table = RoutingTable({1: (1, 0)})
+    table.set_route(WIDE, 2, 3)
+    slots, free, overflow, version = len(table.ids), list(table.free), dict(table.overflow), table.version
+    with pytest.raises(ValueError):
+        table.set_route(dest, 2, 3)
+    assert (len(table.ids), table.free, table.overflow, table.version) == (slots, free, overflow, version)
+    assert dest not in table
+    check_slots(table)
+
+
+def test_direct_id_takes_back_borrowed_slot():
+    table = RoutingTable({1: (1, 0)})
+    table.set_route(WIDE, 2, 3)
+    borrowed = table.slot(WIDE)
+    table.set_route(borrowed, 2, 5) # the direct id whose slot the wide id was given
+    assert table.slot(borrowed) == borrowed and table[borrowed] == (2, 5)
+    assert table.slot(WIDE) not in (-1, borrowed) and table[WIDE] == (2, 3)
+    check_slots(table)
+
+
+def test_freed_overflow_slot_is_reused():
+    table = RoutingTable({1: (1, 0)})
+    table.set_route(WIDE, 2, 3)
+    slot = table.slot(WIDE)
+    table.remove(WIDE)
+    assert WIDE not in table and table.free == [slot]
+    table.set_route(WIDE + 1, 2, 4)
+    assert table.slot(WIDE + 1) == slot and table.free == []
+    check_slots(table)
+
+
+def test_freed_slot_claimed_by_direct_id_is_skipped():
+    table = RoutingTable({1: (1, 0)})
+    table.set_route(WIDE, 2, 3)
+    slot = table.slot(WIDE)
+    table.remove(WIDE)
+    table.set_route(slot, 2, 5) # the direct id moves into its own slot while it is on the free list
+    table.set_route(WIDE + 1, 2, 4)
+    assert table.slot(WIDE + 1) != slot and table[slot] == (2, 5)
+    check_slots(table)
+
+
+def test_remove_direct_id():
+    table = RoutingTable({1: (1, 0), 4: (2, 3)})
+    table.remove(4)
+    assert 4 not in table and table.get(4) is None and len(table) == 1
+    with pytest.raises(KeyError):
+        table.remove(4)
+    check_slots(table)
+
+
+def aged_table():
+    """a table on a virtual clock with a route through 2 and one through 3, both set at time 100"""
+    clock = VirtualClock(100.0)
+    table = RoutingTable({1: (1, 0)}, clock)
+    table.set_route(5, 2, 3)
+    table.set_route(WIDE, 3, 2)
+    return table, clock
+
+
+def aged(table, clock):
+    return table.aged(clock.now - TIMEOUT, clock.now - GARBAGE)
+
+
+def test_routes_time_out():
+    table, clock = aged_table()
+    clock.now = 100.0 + TIMEOUT
+    assert aged(table, clock) == ([], []) # timed out only once the timeout has passed
+    clock.now += 0.5
+    timed_out, collectable = aged(table, clock)
+    assert sorted(timed_out) == [1, 5, WIDE] and collectable == [] # the daemon leaves its own route out
+
+
+def test_refresh_moves_deadline():
+    table, clock = aged_table()
+    clock.now = 150.0
+    table.refresh(5)
+    clock.now = 100.0 + TIMEOUT + 1
+    assert 5 not in aged(table, clock)[0] and WIDE in aged(table, clock)[0]
+    clock.now = 150.0 + TIMEOUT + 1
+    assert 5 in aged(table, clock)[0]
+
+
+def test_refresh_routes_only_through_next_hop():
+    table, clock = aged_table()
+    table.set_route(6, 2, INFINITY)
+    clock.now = 150.0
+    table.refresh_routes([5, 6, WIDE, 9], 2)
+    assert table.refreshed[table.slot(5)] == 150.0
+    assert table.refreshed[table.slot(WIDE)] == 100.0 # goes through 3
+    assert table.refreshed[table.slot(6)] == 100.0 # unreachable, left to be collected
+
+
+def test_unreachable_routes_are_collected():
+    table, clock = aged_table()
+    clock.now = 200.0
+    table.set_route(5, 2, INFINITY) # starts its garbage collection time
+    clock.now = 200.0 + GARBAGE
+    assert 5 not in aged(table, clock)[1]
+    clock.now += 0.5
+    timed_out, collectable = aged(table, clock)
+    assert collectable == [5] and 5 not in timed_out
+
+
+def test_neighbour_timeout_invalidates_only_its_routes():
+    sim = Simulation(build_configs([(1, 2, 1), (2, 3, 1), (3, 4, 1)]), seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    sim.kill_router(3)
+    daemon = sim.daemons[2]
+    last_heard = daemon.heard[3]
+    assert daemon.timers.deadline("neighbour", 3) <= last_heard + daemon.timeout[0]
+    sim.run(last_heard + daemon.timeout[0] - 0.1)
+    assert daemon.routing_table[3] == (3, 1) and daemon.routing_table[4] == (3, 2)
+    sim.run(last_heard + daemon.timeout[0] + 0.001) # the neighbour's deadline, not the next sweep
+    assert daemon.routing_table[3] == (3, INFINITY) and daemon.routing_table[4] == (3, INFINITY)
+    assert daemon.routing_table[1] == (1, 1) # 1 is still heard from, its deadline keeps moving
+    assert 3 not in daemon.heard
+    sim.run(last_heard + daemon.timeout[0] + daemon.garbage[0] + daemon.sweep_interval + 1)
+    assert 3 not in daemon.routing_table and 4 not in daemon.routing_table
+    assert daemon.routing_table[1] == (1, 1)
+
+
+def test_starting_routes_are_not_changes():
+    table = RoutingTable({1: (1, 0), 2: (2, 1)})
+    assert table.version == 0 and table.changes_since(0) == [] and table.entry_version(2) == 0
+
+
+def test_changes_since_gives_net_changes():
+    table = RoutingTable({1: (1, 0), 2: (2, 1)})
+    table.set_route(5, 2, 3)
+    start = table.version
+    table.set_route(5, 2, 4)
+    table.set_route(2, 2, 7)
+    table.set_route(2, 2, 1) # changed back
+    table.set_route(6, 2, 2)
+    table.remove(6) # came and went
+    table.set_route(5, 3, 2)
+    assert table.changes_since(start) == [(5, (2, 3), (3, 2))]
+    assert table.changes_since(0) == [(5, None, (3, 2))]
+    assert table.changes_since(table.version) == []
+    assert table.entry_version(5) == table.version and table.entry_version(6) == -1
+
+
+def test_subscriptions_read_independently():
+    table = RoutingTable({1: (1, 0)})
+    first, second = table.subscribe(), table.subscribe()
+    table.set_route(5, 2, 3)
+    assert first.changes() == [(5, None, (2, 3))]
+    table.set_route(5, 2, 4)
+    table.set_route(6, 2, 1)
+    assert first.changes() == [(5, (2, 3), (2, 4)), (6, None, (2, 1))]
+    assert first.changes() == [] # the cursor has moved on
+    assert second.changes() == [(5, None, (2, 4)), (6, None, (2, 1))]
+    late = table.subscribe()
+    table.remove(6)
+    assert late.changes() == first.changes() == second.changes() == [(6, (2, 1), None)]
+
+
+def test_skip():
+    table = RoutingTable({1: (1, 0)})
+    feed = table.subscribe()
+    table.set_route(5, 2, 3)
+    feed.skip()
+    table.set_route(6, 2, 3)
+    assert feed.changes() == [(6, None, (2, 3))]
+
+
+def test_reader_too_far_behind():
+    table = RoutingTable({1: (1, 0)})
+    behind, keeping_up = table.subscribe(), table.subscribe()
+    for metric in range(JOURNAL_LIMIT + 2):
+        table.set_route(5, 2, 1 + metric % 2)
+        if metric % 1000 == 0:
+            keeping_up.changes()
+    with pytest.raises(JournalTruncated):
+        table.changes_since(0)
+    with pytest.raises(JournalTruncated):
+        behind.changes()
+    assert behind.version == table.version # moved on, to start again from the whole table
+    table.set_route(6, 2, 1)
+    assert behind.changes() == [(6, None, (2, 1))]
+    assert [dest for dest, _, _ in keeping_up.changes()] == [5, 6]
@@ -0,0 +1,105 @@
+import pytest
+from snapshot import *
+from simulator import *
+from routing_daemon import *
+
+"""Checks of writing and reading routing table snapshots, and of a router restarting from one."""
+
+LINE = [(1, 2, 1), (2, 3, 1), (3, 4, 1)]
+WIDE = DIRECT_LIMIT + 5
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def saved_table(tmp_path):
+    """writes a snapshot of a small table with a direct and a wide id, returns its path, routes and neighbours"""
+    routes = {1: (1, 0), 2: (2, 1), 7: (2, 4), WIDE: (3, 6)}
+    output_ports = [Output(6002, 1, 2), Output(6003, 2, 3)]
+    path = str(tmp_path / "router1.snapshot")
+    write_snapshot(path, 1, RoutingTable(routes), output_ports)
+    return path, routes, {2: 1, 3: 2}
+
+
+def test_round_trip(tmp_path):
+    path, routes, neighbours = saved_table(tmp_path)
+    restored_neighbours, restored = read_snapshot(path, 1)
+    assert restored_neighbours == neighbours
+    assert sorted(restored) == sorted((dest, next_hop, metric) for dest, (next_hop, metric) in routes.items())
+
+
+def test_removed_routes_are_left_out(tmp_path):
+    table = RoutingTable({1: (1, 0), 5: (2, 3), WIDE: (2, 3)})
+    table.remove(5)
+    table.remove(WIDE)
+    path = str(tmp_path / "router1.snapshot")
+    write_snapshot(path, 1, table, [])
+    assert read_snapshot(path, 1) == ({}, [(1, 1, 0)])
+
+
+def test_other_router(tmp_path):
+    path, _, _ = saved_table(tmp_path)
+    with pytest.raises(SnapshotError):
+        read_snapshot(path, 2)
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:-1], # truncated
+    lambda data: data[:SNAPSHOT_HEADER.size - 1], # not even a header
+    lambda data: b"", # empty
+    lambda data: b"JUNK" + data[4:], # not a snapshot
+    lambda data: data[:4] + struct.pack("=H", SNAPSHOT_VERSION + 1) + data[6:], # another layout version
+    lambda data: data + b"\0" * 13, # more slots than the header says
+])
+def test_damaged_file(tmp_path, damage):
+    path, _, _ = saved_table(tmp_path)
+    with open(path, "rb") as snapshot_file:
+        data = snapshot_file.read()
+    with open(path, "wb") as snapshot_file:
+        snapshot_file.write(damage(data))
+    with pytest.raises(SnapshotError):
+        read_snapshot(path, 1)
+
+
+def test_too_old(tmp_path):
+    path, _, _ = saved_table(tmp_path)
+    with pytest.raises(SnapshotError):
+        read_snapshot(path, 1, max_age=-1)
+
+
+def restarted(tmp_path, keep_alive=()):
+    """converges a line of routers, snapshots router 2, stops every router but 'keep_alive'
+    and restarts router 2 from the snapshot"""
+    sim = Simulation(build_configs(LINE), seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    path = str(tmp_path / "router2.snapshot")
+    write_snapshot(path, 2, sim.daemons[2].routing_table, sim.daemons[2].output_ports)
+    for router_id in sim.daemons:
+        if router_id not in keep_alive:
+            sim.kill_router(router_id)
+    sim.dead.discard(2)
+    daemon = sim.daemons[2] = sim.build_daemon(sim.config_objects[2])
+    daemon.start_snapshots(path) # restores before the first table goes out, as main_file does
+    assert daemon.routing_table.stale == 3
+    sim.start_daemon(daemon)
+    return sim, daemon
+
+
+def test_restored_routes_are_stale(tmp_path):
+    sim, daemon = restarted(tmp_path)
+    table = daemon.routing_table
+    assert dict(table.items()) == {1: (1, 1), 2: (2, 0), 3: (3, 1), 4: (3, 2)}
+    assert [dest for dest in (1, 3, 4) if table.is_stale(dest)] == [1, 3, 4]
+    assert not table.is_stale(2)
+
+
+def test_restored_routes_expire_unless_refreshed(tmp_path):
+    sim, daemon = restarted(tmp_path, keep_alive=[1])
+    short_timeout = RESTORED_TIMEOUT_PERIODS * sim.config_objects[2].period
+    restarted_at = sim.clock.now
+    sim.run(restarted_at + short_timeout - 1)
+    assert daemon.routing_table[3] == (3, 1) and daemon.routing_table[4] == (3, 2)
+    assert not daemon.routing_table.is_stale(1) # confirmed by 1's first update
+    sim.run(restarted_at + short_timeout + daemon.sweep_interval)
+    assert daemon.routing_table[3] == (3, INFINITY) and daemon.routing_table[4] == (3, INFINITY)
+    assert daemon.routing_table[1] == (1, 1)
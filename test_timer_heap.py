@@ -0,0 +1,93 @@
+from timer_heap import *
+from simulator import VirtualClock
+
+"""Checks of TimerHeap scheduling, re-arming and lazy cancelling."""
+
+
+def make_heap():
+    clock = VirtualClock(100.0)
+    return TimerHeap(clock), clock
+
+
+def test_fires_in_deadline_order():
+    timers, clock = make_heap()
+    timers.schedule(5, "b", "update", -1)
+    timers.schedule(1, "a", "neighbour", 2)
+    timers.schedule(3, "c", "neighbour", 3)
+    assert timers.time_until_next() == 1
+    assert timers.pop_expired(102) == [(101, "a", "neighbour", 2)]
+    assert [kind for _, _, kind, _ in timers.pop_expired(110)] == ["neighbour", "update"]
+    assert len(timers) == 0 and timers.time_until_next() is None
+
+
+def test_equal_deadlines_fire_in_schedule_order():
+    timers, clock = make_heap()
+    for router_id in (5, 2, 9):
+        timers.schedule(1, "", "neighbour", router_id)
+    assert [router_id for _, _, _, router_id in timers.pop_expired(101)] == [5, 2, 9]
+
+
+def test_rearming_replaces_the_timer():
+    timers, clock = make_heap()
+    timers.schedule(1, "old", "neighbour", 2)
+    timers.schedule(10, "new", "neighbour", 2)
+    assert len(timers) == 1
+    assert timers.deadline("neighbour", 2) == 110
+    assert timers.pop_expired(105) == [] # the replaced entry is dead, it does not fire
+    assert timers.pop_expired(110) == [(110, "new", "neighbour", 2)]
+    assert timers.dead == 0
+
+
+def test_cancel():
+    timers, clock = make_heap()
+    timers.schedule(1, "", "neighbour", 2)
+    assert ("neighbour", 2) in timers
+    assert timers.cancel("neighbour", 2)
+    assert not timers.cancel("neighbour", 2)
+    assert ("neighbour", 2) not in timers and timers.deadline("neighbour", 2) is None
+    assert timers.pop_expired(200) == []
+
+
+def test_only_cancelled_timers():
+    timers, clock = make_heap()
+    timers.schedule(1, "", "neighbour", 2)
+    timers.schedule(2, "", "neighbour", 3)
+    timers.cancel("neighbour", 2)
+    timers.cancel("neighbour", 3)
+    assert timers.next_deadline() is None
+    assert timers.time_until_next() is None
+    assert timers.heap == [] and timers.dead == 0
+
+
+def test_time_until_next_never_negative():
+    timers, clock = make_heap()
+    timers.schedule(1, "", "update", -1)
+    clock.now = 150.0
+    assert timers.time_until_next() == 0.0
+
+
+def test_time_until_next_skips_cancelled_head():
+    timers, clock = make_heap()
+    timers.schedule(1, "", "neighbour", 2)
+    timers.schedule(4, "", "update", -1)
+    timers.cancel("neighbour", 2)
+    assert timers.time_until_next() == 4
+
+
+def test_heap_is_compacted_when_mostly_dead():
+    timers, clock = make_heap()
+    timers.schedule(1000, "", "update", -1)
+    for _ in range(200): # re-arming leaves a dead entry behind each time
+        timers.schedule(1, "", "neighbour", 2)
+    assert len(timers) == 2
+    assert len(timers.heap) < 100
+    assert timers.dead == len(timers.heap) - len(timers)
+
+
+def test_timers_lists_running_timers():
+    timers, clock = make_heap()
+    timers.schedule(3, "sweep", "sweep", -1)
+    timers.schedule(1, "update", "update", -1)
+    timers.schedule(2, "gone", "neighbour", 2)
+    timers.cancel("neighbour", 2)
+    assert timers.timers() == [(101, "update", "update", -1), (103, "sweep", "sweep", -1)]
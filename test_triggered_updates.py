@@ -0,0 +1,84 @@
+from simulator import *
+from routing_daemon import *
+
+"""Checks of triggered updates: hold-down coalescing, suppression before a periodic update,
+and that only the changed routes go out."""
+
+LINE = [(1, 2, 1), (2, 3, 1), (3, 4, 1)]
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+class Recorder(object):
+    """Wraps a daemon's transport, keeping every datagram it sends as (time, port, routes)"""
+
+    def __init__(self, transport, clock):
+        self.transport = transport
+        self.clock = clock
+        self.sent = []
+
+    def sendto(self, data, address):
+        routes = {entry.router_id: entry.metric for entry in Packet.from_bytes(data).entries}
+        self.sent.append((self.clock.now, address[1], routes))
+        return self.transport.sendto(data, address)
+
+
+def watched_router(router_id=2, update_in=20):
+    """a converged line of routers with 'router_id' recording what it sends, and its next
+    periodic update 'update_in' seconds away"""
+    sim = Simulation(build_configs(LINE), seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    sim.run(sim.daemons[router_id].timers.deadline("triggered", -1) or sim.clock.now) # let any hold-down run out
+    daemon = sim.daemons[router_id]
+    daemon.sender = Recorder(daemon.sender, sim.clock)
+    daemon.trigger_stats = dict.fromkeys(daemon.trigger_stats, 0) # count from here on
+    daemon.add_timer(update_in, "{}".format(router_id), "update", -1)
+    sim.wake(router_id)
+    return sim, daemon, daemon.sender
+
+
+def sent_to(recorder, router_id):
+    return [routes for _, port, routes in recorder.sent if port == BASE_PORT + router_id]
+
+
+def test_first_change_goes_out_with_only_changed_routes():
+    sim, daemon, recorder = watched_router()
+    sim.set_link_cost(2, 3, 3)
+    assert sent_to(recorder, 1) == [{3: 3, 4: 4}]
+    assert sent_to(recorder, 3) == [{3: INFINITY, 4: INFINITY}] # both are routed through 3 itself
+    assert daemon.trigger_stats["sent"] == 1 and daemon.trigger_stats["entries"] == 2
+    assert ("triggered", -1) in daemon.timers
+
+
+def test_changes_during_hold_down_are_coalesced():
+    sim, daemon, recorder = watched_router()
+    sim.set_link_cost(2, 3, 3)
+    started, hold_down = sim.clock.now, daemon.timers.deadline("triggered", -1)
+    assert 1 <= hold_down - started <= 5
+    sim.set_link_cost(1, 2, 2)
+    sim.set_link_cost(1, 2, 4)
+    assert len(recorder.sent) == 2 # still the first update, one datagram for each neighbour
+    assert daemon.trigger_stats["coalesced"] == 2
+    sim.run(hold_down)
+    later = [(port, routes) for when, port, routes in recorder.sent if when > started]
+    assert sorted(later) == [(BASE_PORT + 1, {1: INFINITY}), (BASE_PORT + 3, {1: 4})]
+    assert all(when == hold_down for when, _, _ in recorder.sent[2:])
+    assert daemon.trigger_stats["sent"] == 2
+
+
+def test_hold_down_with_nothing_queued_sends_nothing():
+    sim, daemon, recorder = watched_router()
+    sim.set_link_cost(2, 3, 3)
+    sim.run(daemon.timers.deadline("triggered", -1))
+    assert len(recorder.sent) == 2
+    assert ("triggered", -1) not in daemon.timers
+
+
+def test_suppressed_when_periodic_update_is_due():
+    sim, daemon, recorder = watched_router(update_in=0.5)
+    sim.set_link_cost(2, 3, 3)
+    assert recorder.sent == []
+    assert daemon.trigger_stats["suppressed"] == 1 and daemon.trigger_stats["sent"] == 0
+    sim.run(sim.clock.now + 0.5)
+    assert sent_to(recorder, 1) == [{1: INFINITY, 2: 0, 3: 3, 4: 4}] # the full table carries the change instead
@@ -0,0 +1,70 @@
+from simulator import *
+from routing_daemon import *
+
+"""Checks that the cached full table datagrams are rebuilt whenever what a neighbour would
+be sent changes, and always match a fresh encoding."""
+
+LINE = [(1, 2, 1), (2, 3, 1), (3, 4, 1)]
+NETWORK = (0x0A000000, 8) # 10.0.0.0/8, attached to router 4
+
+EVENT_LOG.level = WARNING # every router would log its route changes
+
+
+def converged_line():
+    config_objects = build_configs(LINE)
+    config_objects[3].networks = [NETWORK]
+    sim = Simulation(config_objects, seed=1)
+    sim.start()
+    sim.run_until_converged(60, 1000)
+    return sim, sim.daemons[2]
+
+
+def check_cache(daemon, destination):
+    """returns the cached datagrams for 'destination', having checked them against a fresh encoding"""
+    datagrams = daemon.encoded_table(destination)
+    assert datagrams == daemon.serialize(daemon.routing_table, destination)
+    return datagrams
+
+
+def test_unchanged_table_is_reused():
+    sim, daemon = converged_line()
+    first = check_cache(daemon, 1)
+    hits = daemon.cache_stats["hits"]
+    assert check_cache(daemon, 1) is first
+    assert daemon.cache_stats["hits"] == hits + 1
+
+
+def test_route_change_rebuilds():
+    sim, daemon = converged_line()
+    before = check_cache(daemon, 1)
+    sim.set_link_cost(2, 3, 3)
+    assert check_cache(daemon, 1) != before
+
+
+def test_change_through_neighbour_is_not_seen_by_it():
+    sim, daemon = converged_line()
+    before = check_cache(daemon, 3)
+    misses = daemon.cache_stats["misses"]
+    sim.set_link_cost(2, 3, 3) # the routes to 3 and 4 change, but 3 is sent them poisoned either way
+    assert daemon.routing_table.hop_changes[3] > 0
+    assert check_cache(daemon, 3) is before
+    assert daemon.cache_stats["misses"] == misses
+
+
+def test_prefix_change_rebuilds():
+    sim, daemon = converged_line()
+    before = check_cache(daemon, 1)
+    daemon.learn_prefixes([PrefixEntry('AF_INET', 0xC0A80000, 16, 4, 3)], 3)
+    after = check_cache(daemon, 1)
+    assert after != before
+    prefixes = [(entry.prefix, entry.length) for datagram in after for entry in Packet.from_bytes(datagram).prefixes]
+    assert sorted(prefixes) == [NETWORK, (0xC0A80000, 16)]
+
+
+def test_own_prefix_change_rebuilds():
+    sim, daemon = converged_line()
+    before = check_cache(daemon, 1)
+    config_object = build_configs(LINE)[1]
+    config_object.networks = [(0xAC100000, 12)]
+    daemon.reload_config(config_object)
+    assert check_cache(daemon, 1) != before
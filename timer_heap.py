@@ -0,0 +1,112 @@
+import heapq
+import itertools
+import time
+
+DEADLINE, SEQUENCE, KIND, ROUTER_ID, MESSAGE, LIVE = range(6)
+# positions of the fields in a heap entry
+
+
+class TimerHeap(object):
+    """
+    Priority heap of timers keyed on a monotonic clock. Every timer is identified
+    by a (kind, router_id) handle, so there is at most one timer of each kind per
+    router. Cancelling marks the heap entry as dead and forgets the handle (O(1));
+    dead entries are dropped when they reach the top of the heap, or all at once
+    when they outnumber the live timers.
+
+    Attributes:
+    clock -- function returning the current time in seconds, time.monotonic by default
+    heap -- list of [deadline, sequence, kind, router_id, message, live] entries ordered by deadline
+    handles -- dictionary of (kind, router_id) to the live heap entry for that timer
+    dead -- number of cancelled entries still sitting in the heap
+
+    Methods:
+    schedule -- starts a timer, replacing any timer with the same handle
+    cancel -- stops a timer if it is running
+    deadline -- the deadline of a running timer
+    next_deadline -- the deadline of the next timer to fire
+    time_until_next -- seconds until the next timer fires, suitable as a select timeout
+    pop_expired -- removes and returns all timers that have fired
+    timers -- all running timers in the order they will fire
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.heap = []
+        self.handles = {}
+        self.dead = 0
+        self.sequence = itertools.count() # breaks ties between equal deadlines without comparing the rest of the entry
+
+    def __len__(self):
+        return len(self.handles)
+
+    def __contains__(self, handle):
+        return handle in self.handles
+
+    def schedule(self, duration, message, kind, router_id):
+        """starts a timer firing 'duration' seconds from now, replacing any running timer with the same handle"""
+        self.cancel(kind, router_id)
+        entry = [self.clock() + duration, next(self.sequence), kind, router_id, message, True]
+        self.handles[(kind, router_id)] = entry
+        heapq.heappush(self.heap, entry)
+        return entry[DEADLINE]
+
+    def cancel(self, kind, router_id):
+        """stops the timer with this handle, returns True if one was running"""
+        entry = self.handles.pop((kind, router_id), None)
+        if entry is None:
+            return False
+        entry[LIVE] = False # leave it in the heap, it is skipped when it reaches the top
+        self.dead += 1
+        if self.dead > len(self.handles) and self.dead > 64: # mostly garbage, rebuild rather than let the heap grow
+            self.heap = [entry for entry in self.heap if entry[LIVE]]
+            heapq.heapify(self.heap)
+            self.dead = 0
+        return True
+
+    def deadline(self, kind, router_id):
+        """returns the deadline of the timer with this handle, or None if it is not running"""
+        entry = self.handles.get((kind, router_id))
+        return None if entry is None else entry[DEADLINE]
+
+    def _discard_dead(self):
+        """drops cancelled entries off the top of the heap"""
+        heap = self.heap
+        while heap and not heap[0][LIVE]:
+            heapq.heappop(heap)
+            self.dead -= 1
+
+    def next_deadline(self):
+        """returns the next live heap entry to fire, or None if no timers are running"""
+        self._discard_dead()
+        if not self.heap:
+            return None
+        return self.heap[0]
+
+    def time_until_next(self):
+        """seconds until the next timer fires (never negative), or None if no timers are running"""
+        entry = self.next_deadline()
+        if entry is None:
+            return None
+        return max(0.0, entry[DEADLINE] - self.clock())
+
+    def pop_expired(self, now=None):
+        """removes every timer whose deadline has passed and returns them in firing order
+        as (deadline, message, kind, router_id) tuples"""
+        if now is None:
+            now = self.clock()
+        fired = []
+        heap = self.heap
+        while heap and heap[0][DEADLINE] <= now:
+            entry = heapq.heappop(heap)
+            if not entry[LIVE]:
+                self.dead -= 1
+                continue
+            del self.handles[(entry[KIND], entry[ROUTER_ID])]
+            entry[LIVE] = False
+            fired.append((entry[DEADLINE], entry[MESSAGE], entry[KIND], entry[ROUTER_ID]))
+        return fired
+
+    def timers(self):
+        """returns every running timer as (deadline, message, kind, router_id) in firing order"""
+        return sorted((entry[DEADLINE], entry[MESSAGE], entry[KIND], entry[ROUTER_ID]) for entry in self.handles.values())